@@ -0,0 +1,362 @@
+"""
+Helpers for caching rendered API responses.
+
+Cached entries are tagged with surrogate keys naming what they were built
+from (``"deal:12"``, ``"city:3"``, ``"deals"`` for a whole collection's
+membership and order, ...). ``purge_tags`` stamps tags with a new version
+from a global clock, and an entry stays valid while none of its tags has a
+version newer than the clock reading taken before it was built.
+"""
+import hashlib
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone
+from redis.exceptions import LockError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+# Upper bound for entries with no natural expiry
+MAX_RESPONSE_TIMEOUT = 24 * 60 * 60
+
+# Expired entries stay in Redis this long to be served while one worker rebuilds
+STALE_TTL = 60
+REBUILD_LOCK_TIMEOUT = 30
+# How long a worker with nothing stale to serve waits for another's rebuild
+REBUILD_WAIT = 2.0
+REBUILD_POLL = 0.05
+# XFetch early refresh aggressiveness; 1.0 is the usual choice
+XFETCH_BETA = 1.0
+
+TAG_CLOCK_KEY = "tag:clock"
+# A missing tag reads as never purged, so tags must outlive every entry
+TAG_TTL = 7 * 24 * 60 * 60
+
+# Per-process hit/miss counters of get_or_rebuild, by cache name
+_stats = defaultdict(Counter)
+
+
+def tag_key(tag):
+    return f"tag:{tag}"
+
+
+def _wall_clock():
+    # Milliseconds keep clock values well inside float-exact integer range
+    return int(time.time() * 1000)
+
+
+def current_clock():
+    """
+    Read the tag clock. A missing clock restarts from the wall clock so it
+    stays ahead of versions handed out before an eviction.
+    """
+    cache.add(TAG_CLOCK_KEY, _wall_clock(), None)
+    return cache.get(TAG_CLOCK_KEY)
+
+
+def purge_tags(tags):
+    """Invalidate every cached entry tagged with any of ``tags``"""
+    tags = set(tags)
+    if not tags:
+        return
+    cache.add(TAG_CLOCK_KEY, _wall_clock(), None)
+    try:
+        version = cache.incr(TAG_CLOCK_KEY)
+    except ValueError:
+        # Evicted between add() and incr()
+        version = _wall_clock()
+        cache.set(TAG_CLOCK_KEY, version, None)
+    cache.set_many({tag_key(tag): version for tag in tags}, TAG_TTL)
+
+
+def purge_tags_on_commit(tags):
+    """``purge_tags`` once the current transaction commits"""
+    tags = set(tags)
+    transaction.on_commit(lambda: purge_tags(tags))
+
+
+def tags_unchanged(built_at, tags):
+    """Whether no tag has been purged since the clock read ``built_at``"""
+    if not tags:
+        return True
+    versions = cache.get_many([tag_key(tag) for tag in tags])
+    return all(version <= built_at for version in versions.values())
+
+
+def timeout_until(moment, now):
+    """Seconds from ``now`` until ``moment``, bounded to a sane cache timeout"""
+    if moment is None:
+        return MAX_RESPONSE_TIMEOUT
+    return max(1, min(MAX_RESPONSE_TIMEOUT, math.ceil((moment - now).total_seconds())))
+
+
+def json_response(content, status):
+    response = HttpResponse(content, content_type="application/json")
+    response["X-Cache"] = status
+    return response
+
+
+def content_etag(content):
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+def tags_etag(tags, *extra):
+    """
+    Weak ETag from the current versions of ``tags``. It changes whenever
+    one of them is purged, without touching the data the tags stand for.
+    """
+    keys = sorted({tag_key(tag) for tag in tags})
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # An expired or evicted tag may have been purged after a client's
+        # ETag was issued, so it counts as purged now; storing that version
+        # keeps the validator stable until the next purge
+        clock = current_clock()
+        for key in missing:
+            cache.add(key, clock, TAG_TTL)
+        versions = {**dict.fromkeys(missing, clock), **versions, **cache.get_many(missing)}
+    payload = "|".join([*map(str, extra), *(f"{key}={versions[key]}" for key in keys)])
+    return f'W/"{hashlib.md5(payload.encode()).hexdigest()}"'
+
+
+def etag_matches(request, etag):
+    """Weak If-None-Match comparison against ``etag``"""
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def cache_stats(name):
+    """Hit/miss counters for a cache name in this process"""
+    counts = _stats[name]
+    hits = counts["hits"] + counts["waits"]
+    total = hits + counts["stale"] + counts["misses"]
+    return {
+        "hits": counts["hits"],
+        "waits": counts["waits"],
+        "stale": counts["stale"],
+        "misses": counts["misses"],
+        "hit_ratio": round(hits / total, 4) if total else None,
+    }
+
+
+def all_cache_stats():
+    return {name: cache_stats(name) for name in sorted(_stats)}
+
+
+def get_or_rebuild(key, build, name=None):
+    """
+    Return ``(value, status)`` for ``key``, calling ``build()`` at most once
+    across workers at a time. ``build`` returns ``(value, timeout, tags)``.
+
+    Entries carry their logical expiry, the tag clock reading taken before
+    the build and their tags; Redis keeps them STALE_TTL longer. When an
+    entry is expired or purged, the worker that takes the rebuild lock
+    rebuilds it while the others serve the stale value, or wait up to
+    REBUILD_WAIT for the new one when there is nothing to serve. Fresh
+    entries are refreshed early with probability rising towards expiry,
+    scaled by how long the last build took (XFetch), so hot keys are usually
+    rebuilt before they expire.
+
+    Reading the clock before building means a purge landing mid-build
+    leaves the new entry already stale.
+    """
+    values = cache.get_many([key, TAG_CLOCK_KEY])
+    clock = values.get(TAG_CLOCK_KEY)
+    if clock is None:
+        clock = current_clock()
+    entry = values.get(key)
+    if not (isinstance(entry, tuple) and len(entry) == 5):
+        # Missing, or written in an older entry format
+        entry = None
+    stats = _stats[name or key.split(":", 1)[0]]
+
+    if entry is not None and tags_unchanged(entry[0], entry[1]):
+        _, _, value, expires_at, delta = entry
+        early = delta * XFETCH_BETA * -math.log(1.0 - random.random())
+        if time.time() + early < expires_at:
+            stats["hits"] += 1
+            return value, "HIT"
+
+    lock = cache.lock(f"{key}:rebuild", timeout=REBUILD_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        if entry is not None:
+            # Expired, due for early refresh or purged
+            stats["stale"] += 1
+            return entry[2], "STALE"
+        deadline = time.monotonic() + REBUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(REBUILD_POLL)
+            entry = cache.get(key)
+            if entry is not None and entry[0] >= clock and tags_unchanged(entry[0], entry[1]):
+                stats["waits"] += 1
+                return entry[2], "HIT"
+        # The rebuilding worker is slow or gone; build without the lock
+        lock = None
+
+    try:
+        stats["misses"] += 1
+        started = time.monotonic()
+        value, timeout, tags = build()
+        delta = time.monotonic() - started
+        entry = (clock, tuple(sorted(set(tags))), value, time.time() + timeout, delta)
+        cache.set(key, entry, timeout + STALE_TTL)
+    finally:
+        if lock is not None:
+            try:
+                lock.release()
+            except LockError:
+                # Held past REBUILD_LOCK_TIMEOUT; another worker owns it now
+                pass
+    return value, "MISS"
+
+
+def cached_json_response(name, key, build, request=None):
+    """
+    Serve the rendered JSON body cached at ``key`` through ``get_or_rebuild``.
+    ``build`` returns ``(data, timeout, tags)``. The body's ETag is stored
+    with it, so a matching If-None-Match on ``request`` gets a 304 straight
+    from the cache.
+    """
+    def render():
+        data, timeout, tags = build()
+        content = JSONRenderer().render(data)
+        return (content_etag(content), content), timeout, tags
+
+    (etag, content), status = get_or_rebuild(key, render, name=name)
+    if request is not None and etag_matches(request, etag):
+        return not_modified(etag)
+    response = json_response(content, status)
+    response["ETag"] = etag
+    return response
+
+
+class CachedListMixin:
+    """
+    Serve a ListAPIView's filtered, ordered and paginated pages through
+    ``cached_json_response`` under ``cache_name``. The key covers the request
+    host (pagination links are absolute), the path and the query parameters
+    listed in ``cache_query_params``, which every view must declare so that
+    unrelated parameters cannot mint new keys. Only the search term is
+    normalized (case and whitespace, as SearchFilter ignores both); other
+    values, such as ordering fields and filter choices, are kept verbatim.
+    Pages are tagged with ``cache_tags`` plus ``get_cache_tags(objects)``.
+    """
+    cache_name = None
+    cache_query_params = None
+    cache_tags = ()
+
+    def get_cache_key(self):
+        if self.cache_query_params is None:
+            raise ImproperlyConfigured(
+                f"{type(self).__name__} must set cache_query_params to the parameters its pages vary on"
+            )
+        params = self.request.query_params
+        values = []
+        for name in self.cache_query_params:
+            value = params.get(name, "")
+            if name == api_settings.SEARCH_PARAM:
+                value = " ".join(value.lower().split())
+            values.append((name, value))
+        normalized = urlencode(sorted(values))
+        digest = hashlib.md5(f"{self.request.path}?{normalized}".encode()).hexdigest()
+        return f"{self.cache_name}:{self.request.get_host()}:{digest}"
+
+    def get_cache_timeout(self, queryset, now):
+        """Seconds the page stays valid without a write; override for time-bound lists"""
+        return MAX_RESPONSE_TIMEOUT
+
+    def get_cache_tags(self, objects):
+        """Surrogate keys of the objects rendered on a page"""
+        return []
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            now = timezone.now()
+            queryset = self.filter_queryset(self.get_queryset())
+            timeout = self.get_cache_timeout(queryset, now)
+            page = self.paginate_queryset(queryset)
+            objects = list(queryset) if page is None else page
+            tags = list(self.cache_tags) + list(self.get_cache_tags(objects))
+            serializer = self.get_serializer(objects, many=True)
+            if page is None:
+                return serializer.data, timeout, tags
+            return self.get_paginated_response(serializer.data).data, timeout, tags
+
+        return cached_json_response(self.cache_name, self.get_cache_key(), build, request)
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answer detail GETs with an ETag built from surrogate key versions, and
+    with 304 Not Modified when it matches, before running the lookup or the
+    serializer. ``get_etag_tags()`` returns the tags the detail response is
+    built from, or None to skip validation.
+    """
+
+    def get_etag_tags(self):
+        return None
+
+    def retrieve(self, request, *args, **kwargs):
+        tags = self.get_etag_tags()
+        if tags is None:
+            return super().retrieve(request, *args, **kwargs)
+        tags = list(tags)
+        if request.user.is_authenticated:
+            # is_saved / can_use are per user
+            tags.append(f"user:{request.user.pk}")
+        # Image URLs in the body are absolute
+        etag = tags_etag(tags, request.get_host(), request.path, request.user.pk)
+        if etag_matches(request, etag):
+            response = not_modified(etag)
+        else:
+            response = super().retrieve(request, *args, **kwargs)
+            response["ETag"] = etag
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+
+def snapshot_fields(instance, fields):
+    """
+    Stash the stored values of ``fields`` on ``instance`` from a pre_save
+    receiver, so post_save can tell which fields a write changed
+    """
+    previous = None
+    if instance.pk is not None:
+        previous = type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first()
+    instance._cache_snapshot = previous
+
+
+def fields_changed(instance, fields):
+    """Whether a save changed any of ``fields`` (always true for new rows)"""
+    previous = getattr(instance, "_cache_snapshot", None)
+    if previous is None:
+        return True
+    return any(previous[field] != getattr(instance, field) for field in fields)
+
+
+def previous_value(instance, field):
+    """Stored value of ``field`` before the save, or the current value"""
+    previous = getattr(instance, "_cache_snapshot", None)
+    if previous is None:
+        return getattr(instance, field)
+    return previous[field]
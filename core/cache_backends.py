@@ -0,0 +1,346 @@
+"""
+Two-tier cache backend: a per-process LRU in front of django-redis.
+
+Keys whose name starts with one of ``L1_PREFIXES`` are also kept in process
+memory, so repeated reads skip the network round trip and the unpickle.
+Local copies live no longer than the Redis entry (its remaining TTL is read
+in the same round trip) nor ``L1_TIMEOUT``. Every write to such a key
+through this backend is published on a Redis pub/sub channel and each
+process drops its local copy on receipt; a process only keeps local copies
+while its subscription is up. Only prefixes that are read far more often
+than written belong in the local tier: until the message arrives another
+process may serve its old copy.
+
+Values served from memory are shared between callers and must be treated
+as read-only.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "core.cache_backends.TieredRedisCache",
+            "LOCATION": "redis://redis:6379/1",
+            "OPTIONS": {
+                "L1_PREFIXES": ["catalogue", "active_deals"],
+                "L1_MAX_ENTRIES": 1000,
+                "L1_TIMEOUT": 30,
+            },
+        }
+    }
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django_redis.cache import RedisCache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_L1_MAX_ENTRIES = 1000
+DEFAULT_L1_TIMEOUT = 30
+DEFAULT_L1_CHANNEL = "cache:l1:invalidate"
+# Published in place of a key to drop every local copy
+FLUSH_MESSAGE = "*"
+LISTENER_RETRY_SECONDS = 1.0
+
+_missing = object()
+
+
+class LocalTier:
+    """
+    Process-wide LRU shared by every thread's backend instance for one
+    Redis location. Django creates a cache backend per thread, so the
+    state cannot live on the backend itself.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = defaultdict(Counter)
+        # Token of each key's in-flight fill from Redis; invalidating the key
+        # voids it, so a value read before a write is not stored after it
+        self.fills = {}
+        self.listening = threading.Event()
+        self.pid = os.getpid()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _missing
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return _missing
+            self.entries.move_to_end(key)
+            return value
+
+    def begin_fill(self, key):
+        """Token to pass to ``set`` once ``key`` has been read from Redis"""
+        token = object()
+        with self.lock:
+            self.fills[key] = token
+        return token
+
+    def end_fill(self, key, token):
+        """Forget a fill that stores nothing, e.g. because the key was missing"""
+        with self.lock:
+            if self.fills.get(key) is token:
+                del self.fills[key]
+
+    def set(self, key, value, timeout, prefix, token):
+        with self.lock:
+            if self.fills.get(key) is not token:
+                # Invalidated, or superseded by a later fill, since the read
+                return
+            del self.fills[key]
+            if not self.listening.is_set():
+                return
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats[prefix]["evictions"] += 1
+
+    def invalidate(self, key):
+        if key == FLUSH_MESSAGE:
+            self.reset()
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.fills.pop(key, None)
+
+    def reset(self):
+        """Forget everything, e.g. when the subscription drops"""
+        with self.lock:
+            self.entries.clear()
+            self.fills.clear()
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TieredRedisCache(RedisCache):
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        options = params.get("OPTIONS", {})
+        self._l1_prefixes = tuple(options.get("L1_PREFIXES", ()))
+        self._l1_timeout = options.get("L1_TIMEOUT", DEFAULT_L1_TIMEOUT)
+        self._l1_max_entries = options.get("L1_MAX_ENTRIES", DEFAULT_L1_MAX_ENTRIES)
+        self._l1_channel = options.get("L1_CHANNEL", DEFAULT_L1_CHANNEL)
+
+    # Local tier plumbing
+
+    @property
+    def tier(self):
+        """This process's LocalTier, starting its listener on first use"""
+        tier_key = (str(self._server), self._l1_channel)
+        with _tiers_lock:
+            tier = _tiers.get(tier_key)
+            if tier is None or tier.pid != os.getpid():
+                # First use, or first use since a fork: threads do not survive it
+                tier = _tiers[tier_key] = LocalTier(self._l1_max_entries)
+                thread = threading.Thread(
+                    target=self._listen, args=(tier,), name="cache-l1-listener", daemon=True
+                )
+                thread.start()
+        return tier
+
+    def _listen(self, tier):
+        failures = 0
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.get_client(write=True).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self._l1_channel)
+                # Wait for the subscription before trusting local copies
+                pubsub.get_message(timeout=LISTENER_RETRY_SECONDS)
+                tier.reset()
+                tier.listening.set()
+                failures = 0
+                for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        tier.invalidate(data.decode() if isinstance(data, bytes) else data)
+            except Exception:
+                # Warn once per outage rather than on every retry
+                if not failures:
+                    logger.warning("Cache L1 listener disconnected", exc_info=True)
+                failures += 1
+            finally:
+                tier.listening.clear()
+                tier.reset()
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            time.sleep(LISTENER_RETRY_SECONDS)
+
+    def _l1_prefix(self, key):
+        key = str(key)
+        for prefix in self._l1_prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def _publish(self, keys):
+        redis = self.client.get_client(write=True)
+        tier = self.tier
+        for key in keys:
+            tier.invalidate(key)
+            try:
+                redis.publish(self._l1_channel, key)
+            except RedisError:
+                logger.warning("Cache L1 invalidation not published", exc_info=True)
+
+    def _invalidate(self, keys, version=None):
+        full_keys = [
+            str(self.make_key(key, version=version))
+            for key in keys if self._l1_prefix(key) is not None
+        ]
+        if full_keys:
+            self._publish(full_keys)
+
+    def _fetch(self, keys, version):
+        """Read keys and their remaining TTLs from Redis in one round trip"""
+        pipeline = self.client.get_client(write=False).pipeline(transaction=False)
+        full_keys = [str(self.make_key(key, version=version)) for key in keys]
+        for full_key in full_keys:
+            pipeline.get(full_key)
+            pipeline.pttl(full_key)
+        replies = pipeline.execute()
+        results = {}
+        for index, key in enumerate(keys):
+            raw, pttl = replies[2 * index], replies[2 * index + 1]
+            if raw is not None:
+                results[key] = (full_keys[index], self.client.decode(raw), pttl)
+        return results
+
+    def _read_through(self, keys, version):
+        """Serve ``keys`` (all L1-eligible) from memory, else from Redis"""
+        tier = self.tier
+        found = {}
+        misses = []
+        for key in keys:
+            prefix = self._l1_prefix(key)
+            value = tier.get(str(self.make_key(key, version=version)))
+            if value is _missing:
+                tier.stats[prefix]["misses"] += 1
+                misses.append(key)
+            else:
+                tier.stats[prefix]["hits"] += 1
+                found[key] = value
+        if not misses:
+            return found
+
+        full_keys = {key: str(self.make_key(key, version=version)) for key in misses}
+        tokens = {key: tier.begin_fill(full_key) for key, full_key in full_keys.items()}
+        fetched = {}
+        try:
+            fetched = self._fetch(misses, version)
+        finally:
+            for key in misses:
+                if key not in fetched:
+                    tier.end_fill(full_keys[key], tokens[key])
+        for key, (full_key, value, pttl) in fetched.items():
+            found[key] = value
+            # pttl is -1 for keys without expiry
+            timeout = self._l1_timeout if pttl < 0 else min(self._l1_timeout, pttl / 1000)
+            tier.set(full_key, value, timeout, self._l1_prefix(key), tokens[key])
+        return found
+
+    def l1_stats(self):
+        """Per-prefix local tier counters for this process"""
+        tier = self.tier
+        with tier.lock:
+            size = len(tier.entries)
+            stats = {prefix: dict(counts) for prefix, counts in tier.stats.items()}
+        return {"listening": tier.listening.is_set(), "entries": size, "prefixes": stats}
+
+    # Reads
+
+    def get(self, key, default=None, version=None, client=None):
+        if client is not None or self._l1_prefix(key) is None:
+            return super().get(key, default=default, version=version, client=client)
+        try:
+            return self._read_through([key], version).get(key, default)
+        except RedisError:
+            if self._ignore_exceptions:
+                return default
+            raise
+
+    def get_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        if client is not None:
+            return super().get_many(keys, version=version, client=client)
+        local = [key for key in keys if self._l1_prefix(key) is not None]
+        remote = [key for key in keys if self._l1_prefix(key) is None]
+        results = super().get_many(remote, version=version) if remote else {}
+        if local:
+            try:
+                results.update(self._read_through(local, version))
+            except RedisError:
+                if not self._ignore_exceptions:
+                    raise
+        return results
+
+    # Writes: change Redis first, then tell every process to drop its copy
+
+    def set(self, key, value, *args, **kwargs):
+        result = super().set(key, value, *args, **kwargs)
+        self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def add(self, key, value, *args, **kwargs):
+        result = super().add(key, value, *args, **kwargs)
+        if result:
+            self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def set_many(self, data, *args, **kwargs):
+        result = super().set_many(data, *args, **kwargs)
+        self._invalidate(list(data), kwargs.get("version"))
+        return result
+
+    def delete(self, key, *args, **kwargs):
+        result = super().delete(key, *args, **kwargs)
+        self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def delete_many(self, keys, *args, **kwargs):
+        keys = list(keys)
+        result = super().delete_many(keys, *args, **kwargs)
+        self._invalidate(keys, kwargs.get("version"))
+        return result
+
+    def incr(self, key, *args, **kwargs):
+        result = super().incr(key, *args, **kwargs)
+        self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def decr(self, key, *args, **kwargs):
+        result = super().decr(key, *args, **kwargs)
+        self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def touch(self, key, *args, **kwargs):
+        result = super().touch(key, *args, **kwargs)
+        self._invalidate([key], kwargs.get("version"))
+        return result
+
+    def delete_pattern(self, *args, **kwargs):
+        result = super().delete_pattern(*args, **kwargs)
+        self._publish([FLUSH_MESSAGE])
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._publish([FLUSH_MESSAGE])
+        return result
@@ -0,0 +1,167 @@
+"""
+Base for per-process in-memory indexes built from the database.
+
+An index is an immutable snapshot swapped in as a whole, so readers never
+lock. A daemon thread in each worker applies rows changed since the last
+refresh (by ``updated_at``) as pending changes on top of the snapshot, and
+rebuilds it every ``REBUILD_INTERVAL`` seconds or once more than
+``MAX_OVERLAY`` changes are pending; requests only ever read.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "PRELOAD": True,
+    "REFRESH_INTERVAL": 30,  # seconds between incremental refreshes
+    "REBUILD_INTERVAL": 900,  # seconds between full rebuilds (picks up deletes)
+    "MAX_OVERLAY": 2000,  # pending changes that force a rebuild
+    # Refresh in a daemon thread; when off, the request that finds the index
+    # stale refreshes it (development, tests)
+    "BACKGROUND_REFRESH": True,
+}
+
+# Rows committed slightly out of updated_at order are re-read on the next
+# refresh; applying a change twice is harmless.
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+class RefreshingIndex:
+    """
+    Snapshot lifecycle shared by the in-memory indexes. Subclasses implement
+    ``load()``, returning a fresh snapshot, and ``apply_changes(snapshot,
+    since)``, returning ``snapshot`` with the rows changed since a moment
+    applied. Snapshots have a length and a ``pending`` change count.
+    """
+    # Log and stats label, settings dict name and the unit ``len(snapshot)`` counts
+    name = None
+    settings_name = None
+    size_name = "entries"
+    defaults = DEFAULTS
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._watermark = None
+        self._refresher = None
+        self.built_at = None
+        self.build_seconds = None
+        self.refreshed_at = None
+
+    def settings(self):
+        return {**self.defaults, **getattr(settings, self.settings_name, {})}
+
+    def load(self):
+        raise NotImplementedError
+
+    def apply_changes(self, snapshot, since):
+        raise NotImplementedError
+
+    def build(self):
+        """Rebuild the snapshot from the database"""
+        started = time.perf_counter()
+        now = timezone.now()
+        self._snapshot = self.load()
+        self._watermark = now
+        self.built_at = now
+        self.refreshed_at = now
+        self.build_seconds = time.perf_counter() - started
+        logger.info(
+            "Built %s: %d %s in %.3fs",
+            self.name, len(self._snapshot), self.size_name, self.build_seconds
+        )
+
+    def refresh(self):
+        """Apply rows changed since the last refresh, rebuilding when due"""
+        config = self.settings()
+        now = timezone.now()
+        snapshot = self._snapshot
+        if snapshot is None or (now - self.built_at).total_seconds() >= config["REBUILD_INTERVAL"]:
+            self.build()
+            return
+        snapshot = self.apply_changes(snapshot, self._watermark - REFRESH_OVERLAP)
+        if snapshot.pending > config["MAX_OVERLAY"]:
+            self.build()
+            return
+        self._snapshot = snapshot
+        self._watermark = now
+        self.refreshed_at = now
+
+    def ensure_fresh(self):
+        """Build on first use; afterwards only the refresher touches the database"""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.build()
+        config = self.settings()
+        if config["BACKGROUND_REFRESH"]:
+            self.start_refresher()
+            return
+        age = (timezone.now() - self.refreshed_at).total_seconds()
+        if age >= config["REFRESH_INTERVAL"] and self._lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+
+    def start_refresher(self):
+        """Start this process's refresh thread unless it is running (threads do not survive fork)"""
+        refresher = self._refresher
+        if refresher is not None and refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_forever, name=f"{self.name} refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(self.settings()["REFRESH_INTERVAL"])
+            close_old_connections()
+            try:
+                with self._lock:
+                    self.refresh()
+            except Exception:
+                logger.exception("Refreshing %s failed", self.name)
+            finally:
+                close_old_connections()
+
+    def warm(self):
+        """Build at worker start; a missing or unmigrated database is not fatal"""
+        try:
+            with self._lock:
+                self.build()
+        except DatabaseError:
+            logger.warning("%s not preloaded", self.name.capitalize(), exc_info=True)
+            return
+        if self.settings()["BACKGROUND_REFRESH"]:
+            self.start_refresher()
+
+    def snapshot_stats(self, snapshot):
+        """Index-specific additions to ``stats``"""
+        return {}
+
+    def stats(self):
+        """Size, build time and staleness of this worker's index"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {self.size_name: 0, "built_at": None}
+        return {
+            self.size_name: len(snapshot),
+            "pending_changes": snapshot.pending,
+            "built_at": self.built_at,
+            "build_seconds": self.build_seconds,
+            "refreshed_at": self.refreshed_at,
+            "staleness_seconds": (timezone.now() - self.refreshed_at).total_seconds(),
+            **self.snapshot_stats(snapshot),
+        }
@@ -0,0 +1,206 @@
+"""
+Keyset (seek) pagination.
+
+Pages are selected with a WHERE clause on the ordering columns of the last
+row seen instead of an OFFSET, and no COUNT(*) is run, so page 500 costs the
+same as page 1 when a composite index matches the ordering. Clients opt in
+per request; the page-number envelope stays the default.
+"""
+import datetime
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Below this many estimated rows the planner's guess is replaced by an exact count
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def approximate_count(queryset):
+    """
+    Row count of ``queryset`` from the query planner's estimate on PostgreSQL,
+    exact on other backends and for small results
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = plan[0]["Plan"]["Plan Rows"]
+    if estimate < EXACT_COUNT_THRESHOLD:
+        return queryset.count()
+    return estimate
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode. ``?paginate=cursor``
+    (or any ``cursor``) pages over the queryset's own ordering, with the
+    primary key appended as a tiebreaker: ``next``/``previous`` links carry an
+    opaque ``cursor`` and no ``count`` is returned unless ``?count=true`` asks
+    for an approximate one.
+
+    Keyset mode needs an ordering on non-null columns of the model itself;
+    others (e.g. ``?ordering=distance`` or search relevance) are rejected
+    with 400 rather than silently paginated by page number.
+    """
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    mode_query_param = "paginate"
+    invalid_cursor_message = "Invalid cursor"
+    unsupported_ordering_message = (
+        "Cursor pagination is not available for this ordering; use page numbers."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if not self.cursor_requested(request):
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = self.get_keyset(queryset)
+        if self.keyset is None:
+            raise ParseError(self.unsupported_ordering_message)
+
+        self.request = request
+        self.keyset_model = queryset.model
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.display_page_controls = False
+        self.count = None
+        if request.query_params.get(self.count_query_param, "").lower() in ("1", "true"):
+            self.count = approximate_count(queryset)
+
+        values, reverse = self.decode_cursor(request)
+        if reverse:
+            queryset = queryset.order_by(*[self.flip(name) for name in self.keyset])
+        else:
+            queryset = queryset.order_by(*self.keyset)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(values, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        self.page_rows = rows
+        return rows
+
+    def cursor_requested(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or request.query_params.get(self.cursor_query_param) is not None
+        )
+
+    def get_keyset(self, queryset):
+        """Ordering of ``queryset`` with a pk tiebreaker, or None when it cannot seek"""
+        model = queryset.model
+        ordering = list(queryset.query.order_by)
+        if not ordering and queryset.query.default_ordering:
+            ordering = list(model._meta.ordering)
+        if not ordering:
+            return None
+        names = []
+        for name in ordering:
+            if not isinstance(name, str) or name == "?":
+                return None
+            try:
+                field = model._meta.get_field(name.lstrip("-"))
+            except FieldDoesNotExist:
+                # Annotations and related fields
+                return None
+            if not field.concrete or field.null or field.many_to_many:
+                return None
+            names.append(("-" if name.startswith("-") else "") + field.attname)
+            if field.primary_key:
+                return names
+        pk = model._meta.pk.attname
+        return names + [f"-{pk}" if ordering[-1].startswith("-") else pk]
+
+    def flip(self, name):
+        return name[1:] if name.startswith("-") else f"-{name}"
+
+    def seek_filter(self, values, reverse):
+        """Rows after ``values`` in keyset order (before them when ``reverse``)"""
+        query = Q()
+        equal = Q()
+        for name, value in zip(self.keyset, values):
+            field = name.lstrip("-")
+            descending = name.startswith("-") != reverse
+            query |= equal & Q(**{f"{field}__{'lt' if descending else 'gt'}": value})
+            equal &= Q(**{field: value})
+        # The leading column's bound lets the planner start an index range scan there
+        first = self.keyset[0]
+        descending = first.startswith("-") != reverse
+        return Q(**{f"{first.lstrip('-')}__{'lte' if descending else 'gte'}": values[0]}) & query
+
+    def encode_cursor(self, row, reverse):
+        values = [getattr(row, name.lstrip("-")) for name in self.keyset]
+        payload = json.dumps({"v": values, "r": reverse}, default=self.encode_value)
+        cursor = b64encode(payload.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_value(self, value):
+        # Full precision: DjangoJSONEncoder truncates datetimes to milliseconds
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        return str(value)
+
+    def decode_cursor(self, request):
+        """``(values, reverse)`` from the request's cursor, ``(None, False)`` without one"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode(), validate=True).decode())
+            raw_values, reverse = payload["v"], bool(payload["r"])
+            if len(raw_values) != len(self.keyset):
+                raise ValueError
+            model = self.keyset_model
+            values = [
+                model._meta.get_field(name.lstrip("-")).to_python(value)
+                for name, value in zip(self.keyset, raw_values)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_next_link(self):
+        if self.keyset is None:
+            return super().get_next_link()
+        if not self.has_next or not self.page_rows:
+            return None
+        return self.encode_cursor(self.page_rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.keyset is None:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_rows:
+            return None
+        return self.encode_cursor(self.page_rows[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        fields = [("next", self.get_next_link()), ("previous", self.get_previous_link())]
+        if self.count is not None:
+            fields.insert(0, ("count", self.count))
+        return Response(OrderedDict([*fields, ("results", data)]))
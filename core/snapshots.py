@@ -0,0 +1,123 @@
+"""
+Precomputed JSON snapshots of lists that change rarely but are read often.
+
+A snapshot is a full response body rendered once, gzipped and stored in the
+cache under its content hash, which doubles as the ETag. Writes rebuild it
+(``rebuild_snapshots_on_commit``) instead of invalidating it, so serving a
+snapshot costs no database work. Builders are registered by name with
+``register_snapshot`` and return the data to render for the absolute URL
+the list is requested at, since pagination links are absolute. Each URL
+gets its own snapshot, and the URLs served are recorded so that a rebuild
+covers all of them.
+"""
+import gzip
+import hashlib
+import re
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
+
+from .cache import (
+    MAX_RESPONSE_TIMEOUT, REBUILD_LOCK_TIMEOUT, content_etag, etag_matches, json_response,
+    not_modified
+)
+
+_accepts_gzip = re.compile(r"\bgzip\b")
+
+_builders = {}
+
+
+def register_snapshot(name, build):
+    _builders[name] = build
+
+
+def snapshot_key(name, base_url):
+    return f"snapshot:{name}:{hashlib.md5(base_url.encode()).hexdigest()}"
+
+
+def _urls_key(name):
+    return cache.make_key(f"snapshot:{name}:urls")
+
+
+def _render_snapshot(name, base_url):
+    key = snapshot_key(name, base_url)
+    # Serialized so a slow rebuild cannot overwrite a newer one
+    with cache.lock(f"{key}:rebuild", timeout=REBUILD_LOCK_TIMEOUT):
+        content = JSONRenderer().render(_builders[name](base_url))
+        snapshot = (content_etag(content), gzip.compress(content))
+        # Expires so a snapshot rendered by older code does not outlive a deploy
+        cache.set(key, snapshot, MAX_RESPONSE_TIMEOUT)
+    return snapshot
+
+
+def rebuild_snapshot(name):
+    """Render and store snapshot ``name`` again for every URL it is served at"""
+    for base_url in get_redis_connection("default").smembers(_urls_key(name)):
+        _render_snapshot(name, base_url.decode())
+
+
+def rebuild_snapshots_on_commit(names):
+    """``rebuild_snapshot`` for each of ``names`` once the current transaction commits"""
+    for name in set(names):
+        transaction.on_commit(lambda name=name: rebuild_snapshot(name))
+
+
+def load_snapshot(name, base_url):
+    key = snapshot_key(name, base_url)
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot, "HIT"
+    with cache.lock(f"{key}:rebuild", timeout=REBUILD_LOCK_TIMEOUT):
+        # Another worker may have rebuilt it while this one waited
+        snapshot = cache.get(key)
+    if snapshot is not None:
+        return snapshot, "HIT"
+    # Recorded before rendering, so a write committing meanwhile rebuilds it
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.sadd(_urls_key(name), base_url)
+    pipeline.expire(_urls_key(name), MAX_RESPONSE_TIMEOUT)
+    pipeline.execute()
+    return _render_snapshot(name, base_url), "MISS"
+
+
+def snapshot_response(request, name):
+    """
+    Serve snapshot ``name`` for the requested URL, gzipped as stored when the
+    client accepts it, or 304 Not Modified when If-None-Match carries the
+    ETag of the encoding it would get. The gzipped body has its own ETag,
+    as it is a different representation.
+    """
+    (etag, compressed), status = load_snapshot(name, request.build_absolute_uri(request.path))
+    gzipped = bool(_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")))
+    if gzipped:
+        etag = f'{etag[:-1]}-gz"'
+    if etag_matches(request, etag):
+        response = not_modified(etag)
+    elif gzipped:
+        response = json_response(compressed, status)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = json_response(gzip.decompress(compressed), status)
+    if response.status_code == 200:
+        response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+class SnapshotListMixin:
+    """
+    Serve a list view's first page from snapshot ``snapshot_name``, which
+    holds the same paginated body as the view's own ``list``. Requests for
+    it without query parameters, or with only ``page=1``, get the snapshot;
+    any other parameter falls through to ``list``.
+    """
+    snapshot_name = None
+
+    def list(self, request, *args, **kwargs):
+        params = list(request.query_params.lists())
+        if not params or params == [(self.paginator.page_query_param, ["1"])]:
+            return snapshot_response(request, self.snapshot_name)
+        return super().list(request, *args, **kwargs)
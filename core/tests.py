@@ -0,0 +1,148 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django_redis import get_redis_connection
+
+from .cache import get_or_rebuild, purge_tags, tag_key, tags_etag
+from .cache_backends import _missing
+
+
+class GetOrRebuildTests(TestCase):
+    key = "test:page"
+
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def build(self, value="fresh", timeout=60, tags=("restaurant:1",)):
+        def build():
+            self.builds.append(value)
+            return value, timeout, list(tags)
+        return build
+
+    def rebuild_lock(self):
+        """The rebuild lock as another worker would hold it"""
+        lock = cache.lock(f"{self.key}:rebuild", timeout=30)
+        self.assertTrue(lock.acquire(blocking=False))
+        self.addCleanup(lock.release)
+        return lock
+
+    def test_builds_once_then_hits(self):
+        self.assertEqual(get_or_rebuild(self.key, self.build()), ("fresh", "MISS"))
+        self.assertEqual(get_or_rebuild(self.key, self.build("other")), ("fresh", "HIT"))
+        self.assertEqual(self.builds, ["fresh"])
+
+    def test_purged_tag_rebuilds(self):
+        get_or_rebuild(self.key, self.build("old"))
+        purge_tags(["restaurant:2"])
+        self.assertEqual(get_or_rebuild(self.key, self.build("new")), ("old", "HIT"))
+        purge_tags(["restaurant:1"])
+        self.assertEqual(get_or_rebuild(self.key, self.build("new")), ("new", "MISS"))
+
+    def test_purge_during_build_leaves_the_entry_stale(self):
+        def build():
+            purge_tags(["restaurant:1"])
+            return "racing", 60, ["restaurant:1"]
+
+        get_or_rebuild(self.key, build)
+        self.assertEqual(get_or_rebuild(self.key, self.build()), ("fresh", "MISS"))
+
+    def test_stale_entry_is_served_while_another_worker_rebuilds(self):
+        get_or_rebuild(self.key, self.build("old"))
+        purge_tags(["restaurant:1"])
+        self.rebuild_lock()
+        self.assertEqual(get_or_rebuild(self.key, self.build("new")), ("old", "STALE"))
+        self.assertEqual(self.builds, ["old"])
+
+    def test_expired_entry_is_served_while_another_worker_rebuilds(self):
+        get_or_rebuild(self.key, self.build("old", timeout=0))
+        self.rebuild_lock()
+        self.assertEqual(get_or_rebuild(self.key, self.build("new")), ("old", "STALE"))
+
+    def test_missing_entry_waits_for_the_rebuilding_worker(self):
+        lock = self.rebuild_lock()
+
+        def other_worker_finishes(seconds):
+            if not self.builds:
+                lock.release()
+                get_or_rebuild(self.key, self.build("theirs"))
+                lock.acquire(blocking=False)
+
+        with mock.patch("core.cache.time.sleep", side_effect=other_worker_finishes):
+            self.assertEqual(get_or_rebuild(self.key, self.build("ours")), ("theirs", "HIT"))
+        self.assertEqual(self.builds, ["theirs"])
+
+    def test_missing_entry_is_built_when_the_rebuilding_worker_is_gone(self):
+        self.rebuild_lock()
+        with mock.patch("core.cache.REBUILD_WAIT", 0.1):
+            self.assertEqual(get_or_rebuild(self.key, self.build()), ("fresh", "MISS"))
+
+
+class TagsEtagTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_changes_on_purge(self):
+        before = tags_etag(["restaurant:1", "city:1"])
+        self.assertEqual(tags_etag(["city:1", "restaurant:1"]), before)
+        purge_tags(["restaurant:2"])
+        self.assertEqual(tags_etag(["restaurant:1", "city:1"]), before)
+        purge_tags(["restaurant:1"])
+        self.assertNotEqual(tags_etag(["restaurant:1", "city:1"]), before)
+
+    def test_expired_tag_does_not_revert_to_an_older_etag(self):
+        before = tags_etag(["restaurant:1"])
+        purge_tags(["restaurant:1"])
+        after = tags_etag(["restaurant:1"])
+        cache.delete(tag_key("restaurant:1"))
+        self.assertNotEqual(tags_etag(["restaurant:1"]), before)
+        self.assertEqual(tags_etag(["restaurant:1"]), tags_etag(["restaurant:1"]))
+        self.assertNotEqual(after, before)
+
+
+class LocalTierTests(TestCase):
+    key = "catalogue:test"
+
+    def setUp(self):
+        cache.clear()
+        self.tier = cache.tier
+        self.assertTrue(self.tier.listening.wait(5))
+        self.full_key = str(cache.make_key(self.key))
+        self.redis = get_redis_connection("default")
+
+    def other_process_sets(self, key, value, publish=True):
+        """Write ``key`` straight to Redis, as another process's backend would"""
+        self.redis.set(str(cache.make_key(key)), cache.client.encode(value))
+        if publish:
+            self.redis.publish(cache._l1_channel, str(cache.make_key(key)))
+
+    def eventually(self, read, expected):
+        deadline = time.monotonic() + 5
+        while read() != expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(read(), expected)
+
+    def test_local_copy_is_dropped_on_pubsub_invalidation(self):
+        cache.set(self.key, "old", 60)
+        self.assertEqual(cache.get(self.key), "old")
+        self.assertIn(self.full_key, self.tier.entries)
+        self.other_process_sets(self.key, "new", publish=False)
+        self.assertEqual(cache.get(self.key), "old")
+        self.redis.publish(cache._l1_channel, self.full_key)
+        self.eventually(lambda: cache.get(self.key), "new")
+
+    def test_invalidation_voids_only_that_keys_fill(self):
+        first, second = self.tier.begin_fill("first"), self.tier.begin_fill("second")
+        self.tier.invalidate("second")
+        self.tier.set("first", 1, 60, "catalogue", first)
+        self.tier.set("second", 2, 60, "catalogue", second)
+        self.assertEqual(self.tier.get("first"), 1)
+        self.assertIs(self.tier.get("second"), _missing)
+
+    def test_surrogate_keys_are_always_read_from_redis(self):
+        before = tags_etag(["restaurant:1"])
+        self.other_process_sets(tag_key("restaurant:1"), 10 ** 15, publish=False)
+        self.assertNotEqual(tags_etag(["restaurant:1"]), before)
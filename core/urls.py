@@ -1,9 +1,10 @@
 from django.urls import path
 
-from .views import HealthCheckView
+from .views import CacheStatsView, HealthCheckView
 
 urlpatterns = [
     path("health/", HealthCheckView.as_view(), name="health-check"),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache-stats"),
 ]
 
 
@@ -1,7 +1,10 @@
+from django.core.cache import cache
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 
+from users.permissions import IsAdmin
+from .cache import all_cache_stats
 from .serializers import HealthSerializer
 
 
@@ -13,3 +16,12 @@ class HealthCheckView(APIView):
         return Response(serializer.data)
 
 
+class CacheStatsView(APIView):
+    """Hit/miss counters of the response and local caches in this worker process"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        stats = {"responses": all_cache_stats()}
+        if hasattr(cache, "l1_stats"):
+            stats["local"] = cache.l1_stats()
+        return Response(stats)
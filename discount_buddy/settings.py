@@ -144,16 +144,41 @@ SIMPLE_JWT = {
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "core.cache_backends.TieredRedisCache",
         "LOCATION": os.environ.get("REDIS_URL", "redis://redis:6379/1"),
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # Keys also kept in per-process memory, invalidated over pub/sub.
+            # Surrogate key versions ("tag:") stay Redis-only: purges must be
+            # visible to every worker at once, and they are written too often
+            # to be worth a local copy
+            "L1_PREFIXES": [
+                "catalogue", "active_deals", "voucher_catalogue", "restaurant_clusters", "snapshot:"
+            ],
+            "L1_MAX_ENTRIES": int(os.environ.get("CACHE_L1_MAX_ENTRIES", 1000)),
+            "L1_TIMEOUT": int(os.environ.get("CACHE_L1_TIMEOUT", 30)),
         },
     }
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
+# Per-process k-d tree used by restaurants nearby (see restaurants/spatial_index.py)
+RESTAURANT_SPATIAL_INDEX = {
+    "ENABLED": os.environ.get("RESTAURANT_SPATIAL_INDEX_ENABLED", "True").lower() == "true",
+    "PRELOAD": os.environ.get("RESTAURANT_SPATIAL_INDEX_PRELOAD", "True").lower() == "true",
+    "REFRESH_INTERVAL": int(os.environ.get("RESTAURANT_SPATIAL_INDEX_REFRESH", "30")),
+    "REBUILD_INTERVAL": int(os.environ.get("RESTAURANT_SPATIAL_INDEX_REBUILD", "900")),
+    "MAX_OVERLAY": 2000,
+}
+
+AUTOCOMPLETE_INDEX = {
+    "PRELOAD": os.environ.get("AUTOCOMPLETE_INDEX_PRELOAD", "True").lower() == "true",
+    "REFRESH_INTERVAL": int(os.environ.get("AUTOCOMPLETE_INDEX_REFRESH", "30")),
+    "REBUILD_INTERVAL": int(os.environ.get("AUTOCOMPLETE_INDEX_REBUILD", "900")),
+    "MAX_OVERLAY": 2000,
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -0,0 +1,19 @@
+"""
+Settings for ``manage.py test``. The cache talks to an in-process fakeredis
+server, so the suite needs no Redis and never reads or flushes a real one.
+"""
+import fakeredis
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+CACHES = {
+    "default": {
+        **CACHES["default"],
+        "LOCATION": "redis://fakeredis:6379/1",
+        "OPTIONS": {
+            **CACHES["default"]["OPTIONS"],
+            "CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeConnection},
+        },
+    }
+}
@@ -7,3 +7,16 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "discount_buddy.settings")
 application = get_wsgi_application()
 
 
+
+# Build per-process in-memory indexes before the worker takes traffic
+from django.conf import settings  # noqa: E402
+
+if settings.RESTAURANT_SPATIAL_INDEX["ENABLED"] and settings.RESTAURANT_SPATIAL_INDEX["PRELOAD"]:
+    from restaurants.spatial_index import restaurant_index
+
+    restaurant_index.warm()
+
+if settings.AUTOCOMPLETE_INDEX["PRELOAD"]:
+    from restaurants.autocomplete import autocomplete_index
+
+    autocomplete_index.warm()
@@ -5,6 +5,10 @@ import sys
 
 def main():
     """Run administrative tasks."""
+    settings_module = os.environ.get("DJANGO_SETTINGS_MODULE")
+    if sys.argv[1:2] == ["test"] and settings_module in (None, "discount_buddy.settings"):
+        # Tests run against an in-process Redis, never the configured one
+        os.environ["DJANGO_SETTINGS_MODULE"] = "discount_buddy.test_settings"
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "discount_buddy.settings")
     try:
         from django.core.management import execute_from_command_line
@@ -0,0 +1,213 @@
+"""
+Per-process prefix index for search-box autocomplete.
+
+Restaurant names, live deal titles, active city names and category names
+are normalized (case and accents folded) and every word-initial suffix of a
+name becomes a key ("noodle bar 56", "bar 56", "56"), so typing any word of a
+name finds it. Keys are held in one sorted array searched with bisect;
+the best entries for every prefix of up to PRECOMPUTED_PREFIX_LENGTH
+characters are ranked ahead of time, so the short, broad prefixes typed
+first never scan their whole key range. Like the spatial index, rows changed
+since the last refresh (by ``updated_at``) sit in a small overlay until the
+next rebuild (see core.memory_index).
+"""
+import heapq
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from core.memory_index import RefreshingIndex
+
+MAX_SUGGESTIONS = 20
+PRECOMPUTED_PREFIX_LENGTH = 3
+# Entries kept per precomputed prefix; the slack covers entries masked out
+# by pending changes
+PRECOMPUTED_TOP = 4 * MAX_SUGGESTIONS
+
+# Sorts after every character a normalized key can contain
+_KEY_END = "\U0010ffff"
+
+
+def normalize(text):
+    """Case- and accent-folded words of ``text`` joined by single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(
+        char if char.isalnum() else " "
+        for char in decomposed if not unicodedata.combining(char)
+    )
+    return " ".join(folded.split())
+
+
+def entry_keys(label):
+    words = normalize(label).split(" ")
+    return [" ".join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+def rank(entry):
+    """Sort key putting the most popular entries first, then shorter labels, then lower ids"""
+    _, pk, label, popularity = entry
+    return popularity, -len(label), -pk
+
+
+def _saves(model, field):
+    """Subquery counting ``model`` rows (saves) pointing at the outer row through ``field``"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef("pk")}).order_by().values(field).annotate(
+            count=Count("id")
+        ).values("count")
+    ), 0)
+
+
+def _sources():
+    """
+    ``(kind, queryset, changed)`` per entry kind. Querysets hold only
+    visible rows and yield ``(id, label, popularity)``; ``changed(since)``
+    selects the rows whose entry may have changed since a moment.
+    """
+    from .models import City, Deal, Restaurant, RestaurantCategory, SavedDeal, SavedRestaurant
+
+    return [
+        (
+            "restaurant",
+            Restaurant.objects.filter(is_active=True, verified=True).annotate(
+                popularity=_saves(SavedRestaurant, "restaurant") + F("active_deals_count")
+            ).values_list("id", "name", "popularity"),
+            lambda since: Q(updated_at__gte=since),
+        ),
+        (
+            "deal",
+            Deal.objects.filter(
+                is_live=True, restaurant__is_active=True, restaurant__verified=True
+            ).annotate(
+                popularity=_saves(SavedDeal, "deal") + F("used_count")
+            ).values_list("id", "title", "popularity"),
+            # Deals disappear with their restaurant
+            lambda since: Q(updated_at__gte=since) | Q(
+                restaurant__in=Restaurant.objects.filter(updated_at__gte=since)
+            ),
+        ),
+        (
+            "city",
+            City.objects.filter(is_active=True).values_list("id", "name", "restaurants_count"),
+            lambda since: Q(updated_at__gte=since),
+        ),
+        (
+            "category",
+            RestaurantCategory.objects.values_list("id", "name", "restaurants_count"),
+            lambda since: Q(updated_at__gte=since),
+        ),
+    ]
+
+
+class PrefixTable:
+    """Sorted keys of a fixed set of entries, with precomputed best entries per short prefix"""
+
+    def __init__(self, entries):
+        # (kind, id, label, popularity)
+        self.entries = entries
+        keyed = sorted(
+            (key, index) for index, entry in enumerate(entries) for key in entry_keys(entry[2])
+        )
+        self.keys = [key for key, _ in keyed]
+        self.positions = [index for _, index in keyed]
+        candidates = defaultdict(set)
+        for key, index in keyed:
+            for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+                candidates[key[:length]].add(index)
+        self.top = {
+            prefix: heapq.nlargest(PRECOMPUTED_TOP, indexes, key=self._rank)
+            for prefix, indexes in candidates.items()
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rank(self, index):
+        return rank(self.entries[index])
+
+    def matches(self, prefix, limit, removed):
+        """Best ``limit`` entries with a key starting with ``prefix``, skipping ``removed``"""
+        def visible(index):
+            return self.entries[index][:2] not in removed
+
+        top = self.top.get(prefix)
+        if top is not None:
+            indexes = [index for index in top if visible(index)]
+            # A full list may have lost entries it was hiding behind removed ones
+            if len(indexes) >= limit or len(top) < PRECOMPUTED_TOP:
+                return [self.entries[index] for index in indexes[:limit]]
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + _KEY_END, start)
+        indexes = {index for index in self.positions[start:end] if visible(index)}
+        return [self.entries[index] for index in heapq.nlargest(limit, indexes, key=self._rank)]
+
+
+class _Snapshot:
+    """Immutable prefix table plus pending changes, swapped in as a whole"""
+
+    def __init__(self, table, removed=frozenset(), overlay=None):
+        self.table = table
+        self.removed = removed
+        self.overlay = overlay or {}
+        self.overlay_keys = [(entry, entry_keys(entry[2])) for entry in self.overlay.values()]
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def pending(self):
+        return len(self.removed) + len(self.overlay)
+
+    def matches(self, prefix, limit):
+        entries = self.table.matches(prefix, limit, self.removed)
+        entries += [
+            entry for entry, keys in self.overlay_keys
+            if any(key.startswith(prefix) for key in keys)
+        ]
+        return sorted(entries, key=rank, reverse=True)[:limit]
+
+
+class AutocompleteIndex(RefreshingIndex):
+    """In-memory prefix index of restaurant, deal, city and category names"""
+    name = "autocomplete index"
+    settings_name = "AUTOCOMPLETE_INDEX"
+
+    def load(self):
+        """A prefix table of every visible row"""
+        return _Snapshot(PrefixTable([
+            (kind, pk, label, popularity)
+            for kind, queryset, _ in _sources()
+            for pk, label, popularity in queryset
+        ]))
+
+    def apply_changes(self, snapshot, since):
+        removed = set(snapshot.removed)
+        overlay = dict(snapshot.overlay)
+        for kind, queryset, changed in _sources():
+            model = queryset.model
+            # Changed rows are hidden from the table; those still visible
+            # come back through the overlay
+            for pk in model.objects.filter(changed(since)).values_list("pk", flat=True):
+                removed.add((kind, pk))
+                overlay.pop((kind, pk), None)
+            for pk, label, popularity in queryset.filter(changed(since)):
+                overlay[(kind, pk)] = (kind, pk, label, popularity)
+        return _Snapshot(snapshot.table, frozenset(removed), overlay)
+
+    def suggest(self, query, limit=10):
+        """Up to ``limit`` ``(kind, id, label)`` whose names have a word starting with ``query``"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_fresh()
+        entries = self._snapshot.matches(prefix, limit)
+        return [(kind, pk, label) for kind, pk, label, _ in entries]
+
+    def snapshot_stats(self, snapshot):
+        return {"keys": len(snapshot.table.keys)}
+
+
+autocomplete_index = AutocompleteIndex()
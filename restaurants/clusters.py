@@ -0,0 +1,108 @@
+"""Grid aggregation of restaurant coordinates for map marker clusters"""
+import math
+
+from django.db.models import Avg, Count, FloatField, Q, Sum
+from django.db.models.functions import Cast, Substr
+
+from core.cache import get_or_rebuild
+
+from .geo import GEOHASH_PRECISION, geohash_bounds, geohash_cell_size
+from .models import Restaurant
+from .signals import DEALS_TAG, RESTAURANTS_TAG
+
+MAX_CLUSTER_CELLS = 64
+# Coarse grids are aggregated over every restaurant once and cached; finer
+# grids only ever cover a small bbox and are aggregated live.
+PRECOMPUTED_MAX_PRECISION = 5
+CLUSTER_CACHE_TIMEOUT = 300
+
+
+def precision_for_zoom(zoom, bbox):
+    """
+    Geohash precision giving roughly four cells per 256px map tile at this
+    zoom, coarsened until the bbox spans at most MAX_CLUSTER_CELLS cells
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_span = max_lon - min_lon if max_lon >= min_lon else max_lon - min_lon + 360.0
+    lat_span = max_lat - min_lat
+    precision = max(1, min(GEOHASH_PRECISION, (2 * (zoom + 2)) // 5))
+    while precision > 1:
+        lat_size, lon_size = geohash_cell_size(precision)
+        cells = math.ceil(lat_span / lat_size + 1) * math.ceil(lon_span / lon_size + 1)
+        if cells <= MAX_CLUSTER_CELLS:
+            break
+        precision -= 1
+    return precision
+
+
+def _bbox_filter(bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    query = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lon <= max_lon:
+        return query & Q(longitude__gte=min_lon, longitude__lte=max_lon)
+    # Box crossing the antimeridian
+    return query & (Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon))
+
+
+def _cell_in_bbox(geohash, bbox):
+    """Whether the cell's bounds overlap the bbox, not just its centroid"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cell_min_lat, cell_max_lat, cell_min_lon, cell_max_lon = geohash_bounds(geohash)
+    if cell_min_lat > max_lat or cell_max_lat < min_lat:
+        return False
+    if min_lon <= max_lon:
+        return cell_min_lon <= max_lon and cell_max_lon >= min_lon
+    return cell_max_lon >= min_lon or cell_min_lon <= max_lon
+
+
+def aggregate_cells(precision, bbox=None):
+    """Aggregate active, verified restaurants per geohash cell in one query"""
+    queryset = Restaurant.objects.filter(
+        is_active=True,
+        verified=True,
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+    if bbox is not None:
+        queryset = queryset.filter(_bbox_filter(bbox))
+    rows = queryset.annotate(
+        cell=Substr("geohash", 1, precision)
+    ).values("cell").annotate(
+        count=Count("id"),
+        latitude=Avg(Cast("latitude", FloatField())),
+        longitude=Avg(Cast("longitude", FloatField())),
+        active_deals_count=Sum("active_deals_count")
+    ).order_by("cell")
+    return [
+        {
+            "geohash": row["cell"],
+            "latitude": round(row["latitude"], 6),
+            "longitude": round(row["longitude"], 6),
+            "count": row["count"],
+            "active_deals_count": row["active_deals_count"],
+        }
+        for row in rows
+    ]
+
+
+def cluster_grid(precision):
+    """Cached aggregation of every restaurant at a coarse precision"""
+    grid, _ = get_or_rebuild(
+        f"restaurant_clusters:{precision}",
+        # Moved, hidden or deleted restaurants and deal count changes purge it
+        lambda: (aggregate_cells(precision), CLUSTER_CACHE_TIMEOUT, (RESTAURANTS_TAG, DEALS_TAG))
+    )
+    return grid
+
+
+def clusters_for_bbox(bbox, zoom):
+    """Return (precision, clusters) for a bbox ``(min_lon, min_lat, max_lon, max_lat)``"""
+    precision = precision_for_zoom(zoom, bbox)
+    if precision <= PRECOMPUTED_MAX_PRECISION:
+        cells = [
+            cell for cell in cluster_grid(precision)
+            if _cell_in_bbox(cell["geohash"], bbox)
+        ]
+    else:
+        cells = aggregate_cells(precision, bbox)
+    return precision, cells
@@ -0,0 +1,124 @@
+"""Vectorized great-circle distance calculations for bulk geo queries"""
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .geo import EARTH_RADIUS_KM
+
+# Bound on points x segments evaluated at once by route_distances
+ROUTE_BLOCK_SIZE = 1_000_000
+
+
+def haversine_many(latitude, longitude, latitudes, longitudes):
+    """Distances in km from one point to arrays of coordinates"""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def within_radius(distances, radius_km):
+    """Boolean mask of distances inside the radius"""
+    return distances <= radius_km
+
+
+def after_mask(ids, distances, after=None):
+    """Mask of rows strictly after an exclusive ``(distance_km, id)`` cursor"""
+    if after is None:
+        return np.ones(len(distances), dtype=bool)
+    after_distance, after_id = after
+    return (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+
+
+def order_by_distance(ids, distances, k=None):
+    """
+    Return ``(ids, distances)`` ordered by distance, ties broken by id.
+    With ``k`` only the k nearest are sorted, using a partial selection.
+    """
+    if k is not None and k <= 0:
+        return ids[:0], distances[:0]
+    if k is not None and k < len(distances):
+        nearest = np.argpartition(distances, k - 1)[:k]
+        # Keep every row tied with the k-th distance so the id tiebreak holds
+        cutoff = distances[nearest].max()
+        candidates = np.flatnonzero(distances <= cutoff)
+    else:
+        candidates = np.arange(len(distances))
+    order = candidates[np.lexsort((ids[candidates], distances[candidates]))]
+    if k is not None:
+        order = order[:k]
+    return ids[order], distances[order]
+
+
+def coordinate_arrays(queryset):
+    """
+    Load ``(ids, latitudes, longitudes)`` arrays for a queryset.
+
+    Coordinates are cast to floats in the database so no per-row Decimal
+    conversion happens in Python.
+    """
+    rows = list(queryset.filter(
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).annotate(
+        _lat=Cast("latitude", FloatField()),
+        _lon=Cast("longitude", FloatField())
+    ).values_list("id", "_lat", "_lon"))
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return np.empty(0, dtype=np.int64), empty, empty
+    ids, latitudes, longitudes = zip(*rows)
+    return (
+        np.fromiter(ids, dtype=np.int64, count=len(rows)),
+        np.fromiter(latitudes, dtype=np.float64, count=len(rows)),
+        np.fromiter(longitudes, dtype=np.float64, count=len(rows)),
+    )
+
+
+def nearest_within(latitude, longitude, queryset, radius_km, k=None, after=None):
+    """
+    Distances, radius mask and ordering for a candidate queryset in one pass.
+    Returns ``(ids, distances)`` ordered nearest first, optionally limited to
+    k rows after a ``(distance_km, id)`` cursor.
+    """
+    ids, latitudes, longitudes = coordinate_arrays(queryset)
+    distances = haversine_many(latitude, longitude, latitudes, longitudes)
+    mask = within_radius(distances, radius_km) & after_mask(ids, distances, after)
+    return order_by_distance(ids[mask], distances[mask], k=k)
+
+
+def route_distances(latitudes, longitudes, route):
+    """
+    Distance in km from each point to the nearest segment of a route given
+    as ``[(lat, lon), ...]``. Each segment is projected onto a local
+    equirectangular plane at its own latitude, which is accurate for the
+    corridor widths involved, and points are processed in blocks so memory
+    stays bounded for long routes.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    if len(route) == 1:
+        return haversine_many(route[0, 0], route[0, 1], latitudes, longitudes)
+
+    start, end = route[:-1], route[1:]
+    km_per_lon = np.radians(EARTH_RADIUS_KM) * np.cos(np.radians((start[:, 0] + end[:, 0]) / 2))
+    km_per_lat = np.radians(EARTH_RADIUS_KM)
+    # Segment vectors in km, relative to the segment start
+    seg_x = (end[:, 1] - start[:, 1]) * km_per_lon
+    seg_y = (end[:, 0] - start[:, 0]) * km_per_lat
+    seg_len2 = np.maximum(seg_x ** 2 + seg_y ** 2, 1e-12)
+
+    result = np.empty(len(latitudes))
+    block = max(1, ROUTE_BLOCK_SIZE // len(start))
+    for offset in range(0, len(latitudes), block):
+        lat = latitudes[offset:offset + block, None]
+        lon = longitudes[offset:offset + block, None]
+        point_x = (lon - start[:, 1]) * km_per_lon
+        point_y = (lat - start[:, 0]) * km_per_lat
+        t = np.clip((point_x * seg_x + point_y * seg_y) / seg_len2, 0.0, 1.0)
+        distance2 = (point_x - t * seg_x) ** 2 + (point_y - t * seg_y) ** 2
+        result[offset:offset + block] = np.sqrt(distance2.min(axis=1))
+    return result
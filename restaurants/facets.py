@@ -0,0 +1,76 @@
+"""
+Facet counts for the filter UI.
+
+Every facet of a filtered list is counted in one round trip: a grouped query
+per facet over the ids of the filtered queryset, combined with UNION ALL,
+plus the total. Counting runs over the filtered ids rather than the filtered
+queryset itself so a filter on a multi-valued relation (e.g. a category)
+does not narrow that relation's own counts to the filtered value.
+"""
+from django.db.models import CharField, Count, Value
+from django.db.models.functions import Cast
+
+# (facet, value lookup, label lookup or None to label from the field's choices)
+RESTAURANT_FACETS = (
+    ("category", "categories", "categories__name"),
+    ("price_range", "price_range", None),
+    ("city", "city", "city__name"),
+)
+DEAL_FACETS = (
+    ("deal_type", "deal_type", None),
+    ("category", "restaurant__categories", "restaurant__categories__name"),
+    ("price_range", "restaurant__price_range", None),
+    ("city", "restaurant__city", "restaurant__city__name"),
+)
+
+
+def _target_field(model, lookup):
+    """The field a lookup's values come from, following relations to their primary key"""
+    for name in lookup.split("__"):
+        field = model._meta.get_field(name)
+        if field.is_relation:
+            model = field.related_model
+            field = model._meta.pk
+    return field
+
+
+def facet_counts(queryset, facets):
+    """
+    ``{"count": total, "facets": {facet: [{"value", "label", "count"}]}}``
+    for ``queryset``, values of each facet most frequent first
+    """
+    rows = queryset.model._base_manager.filter(pk__in=queryset.order_by().values("pk"))
+    text = CharField()
+    total = rows.annotate(
+        facet=Value("", output_field=text), value=Value("", output_field=text),
+        label=Value("", output_field=text)
+    ).values("facet", "value", "label").annotate(count=Count("pk")).order_by()
+    parts = [
+        rows.filter(**{f"{lookup}__isnull": False}).annotate(
+            facet=Value(name, output_field=text),
+            value=Cast(lookup, text),
+            label=Cast(label, text) if label else Value("", output_field=text)
+        ).values("facet", "value", "label").annotate(count=Count("pk", distinct=True)).order_by()
+        for name, lookup, label in facets
+    ]
+
+    fields = {}
+    for name, lookup, label in facets:
+        field = _target_field(queryset.model, lookup)
+        fields[name] = field, dict(field.flatchoices)
+    count = 0
+    results = {name: [] for name, _, _ in facets}
+    for row in total.union(*parts, all=True):
+        if not row["facet"]:
+            count = row["count"]
+            continue
+        field, choices = fields[row["facet"]]
+        value = field.to_python(row["value"])
+        results[row["facet"]].append({
+            "value": value,
+            "label": row["label"] or str(choices.get(value, value)),
+            "count": row["count"],
+        })
+    for values in results.values():
+        values.sort(key=lambda item: (-item["count"], item["label"]))
+    return {"count": count, "facets": results}
@@ -1,7 +1,33 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 from .models import Restaurant, Deal, City
 
 
+class RankedOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that puts the best full-text matches first when a search
+    annotated ``search_rank`` and no explicit ordering was requested
+    """
+    
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if "search_rank" in queryset.query.annotations and not request.query_params.get(
+            self.ordering_param
+        ):
+            return ["-search_rank", *(ordering or [])]
+        return ordering
+
+
+class DistanceOrderingFilter(RankedOrderingFilter):
+    """OrderingFilter that only accepts ``distance`` on geo-annotated querysets"""
+    
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        valid_fields = super().remove_invalid_fields(queryset, fields, view, request)
+        if "distance" not in queryset.query.annotations:
+            valid_fields = [field for field in valid_fields if field.lstrip("-") != "distance"]
+        return valid_fields
+
+
 class RestaurantFilter(filters.FilterSet):
     """Filter for restaurants"""
     min_price = filters.NumberFilter(field_name="price_range", lookup_expr="gte")
@@ -16,14 +42,8 @@ class RestaurantFilter(filters.FilterSet):
     
     def filter_has_deals(self, queryset, name, value):
         """Filter restaurants that have active deals"""
-        from django.utils import timezone
         if value:
-            now = timezone.now()
-            return queryset.filter(
-                deals__is_active=True,
-                deals__start_date__lte=now,
-                deals__end_date__gte=now
-            ).distinct()
+            return queryset.filter(active_deals_count__gt=0)
         return queryset
 
 
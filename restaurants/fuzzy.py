@@ -0,0 +1,209 @@
+"""
+Typo-tolerant (fuzzy) name search.
+
+Candidates come from a trigram index, so a misspelled query only touches the
+rows sharing some of its three-letter fragments; they are then ranked by
+edit distance to the query in Python. On PostgreSQL the index is a pg_trgm
+GIN index on the name column itself. On SQLite it is a side table of
+``(trigram, object_id)`` rows kept current by restaurants.signals after
+commit, like the full-text index, and rebuilt with the rebuild_search_index
+command. Other backends fall back to a plain substring match.
+"""
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+from .autocomplete import normalize
+from .models import Deal, Restaurant
+
+# Rows of the filtered queryset taken from the trigram index per query, best
+# trigram overlap first
+MAX_CANDIDATES = 200
+INDEX_BATCH_SIZE = 500
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+def max_distance(query):
+    """Edits tolerated in a query of this length"""
+    length = len(query)
+    if length < 3:
+        return 0
+    if length <= 4:
+        return 1
+    if length <= 8:
+        return 2
+    return 3
+
+
+def edit_distance(first, second, limit):
+    """Levenshtein distance between two strings, or ``limit + 1`` once it exceeds ``limit``"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(min(
+                previous[column] + 1,
+                current[column - 1] + 1,
+                previous[column - 1] + (first_char != second_char),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def name_distance(query, name, limit):
+    """
+    Fewest edits turning ``query`` into ``name`` or into a run of as many
+    consecutive words of it, so "piza" is one edit from "Pizza Palace"
+    """
+    words = normalize(name).split()
+    span = len(query.split())
+    windows = {" ".join(words)}
+    windows.update(" ".join(words[index:index + span]) for index in range(len(words) - span + 1))
+    return min(edit_distance(query, window, limit) for window in windows)
+
+
+class TrigramIndex:
+    """Trigram index over one text field of a model"""
+
+    def __init__(self, model, table, field):
+        self.model = model
+        # SQLite side table
+        self.table = table
+        self.field = field
+
+    def supported(self, using="default"):
+        return connections[using].vendor in ("sqlite", "postgresql")
+
+    def maintained(self, using="default"):
+        # pg_trgm indexes the column itself
+        return connections[using].vendor == "sqlite"
+
+    def index(self, queryset=None, using="default"):
+        """(Re)write the trigrams of ``queryset`` (every row by default)"""
+        if not self.maintained(using):
+            return
+        if queryset is None:
+            queryset = self.model._base_manager.using(using)
+        batch = []
+        with connections[using].cursor() as cursor:
+            for row in queryset.values_list("pk", self.field).iterator(chunk_size=INDEX_BATCH_SIZE):
+                batch.append(row)
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    self._write(cursor, batch)
+                    batch = []
+            if batch:
+                self._write(cursor, batch)
+
+    def _write(self, cursor, rows):
+        cursor.executemany(f"DELETE FROM {self.table} WHERE object_id = %s", [[pk] for pk, _ in rows])
+        cursor.executemany(
+            f"INSERT INTO {self.table} (trigram, object_id) VALUES (%s, %s)",
+            [[gram, pk] for pk, text in rows for gram in trigrams(text or "")]
+        )
+
+    def remove(self, pks, using="default"):
+        if not self.maintained(using) or not pks:
+            return
+        with connections[using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE object_id = %s", [[pk] for pk in pks])
+
+    def rebuild(self, using="default"):
+        """Empty the table and index every row again"""
+        if not self.maintained(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        self.index(using=using)
+
+    def candidates(self, queryset, query):
+        """
+        ``(pk, text)`` of up to MAX_CANDIDATES rows of ``queryset`` sharing
+        the most trigrams with ``query``; the limit applies after the
+        queryset's own filters
+        """
+        connection = connections[queryset.db]
+        outer_table = connection.ops.quote_name(self.model._meta.db_table)
+        if connection.vendor == "sqlite":
+            grams = sorted(trigrams(query))
+            placeholders = ", ".join(["%s"] * len(grams))
+            outer = f"{outer_table}.{connection.ops.quote_name(self.model._meta.pk.column)}"
+            # Each edit breaks at most three of the query's trigrams
+            shared = max(1, len(grams) - 3 * max_distance(query))
+            matches = RawSQL(
+                f"SELECT object_id FROM {self.table} WHERE trigram IN ({placeholders}) "
+                "GROUP BY object_id HAVING COUNT(*) >= %s",
+                [*grams, shared]
+            )
+            score = RawSQL(
+                f"SELECT COUNT(*) FROM {self.table} "
+                f"WHERE object_id = {outer} AND trigram IN ({placeholders})",
+                grams,
+                output_field=FloatField()
+            )
+            queryset = queryset.filter(pk__in=matches)
+        else:
+            column = connection.ops.quote_name(self.model._meta.get_field(self.field).column)
+            text = f"lower({outer_table}.{column})"
+            # <% is served by the gin_trgm_ops index on lower(column)
+            queryset = queryset.filter(
+                RawSQL(f"%s <%% {text}", [query], output_field=BooleanField())
+            )
+            score = RawSQL(f"word_similarity(%s, {text})", [query], output_field=FloatField())
+        return queryset.annotate(trigram_score=score).order_by("-trigram_score", "pk").values_list(
+            "pk", self.field
+        )[:MAX_CANDIDATES]
+
+    def search(self, queryset, query):
+        """
+        ``queryset`` narrowed to rows within ``max_distance`` edits of
+        ``query``, annotated with ``search_rank`` (fewer edits rank higher)
+        """
+        query = normalize(query)
+        limit = max_distance(query)
+        if not self.supported(queryset.db):
+            return queryset.filter(**{f"{self.field}__icontains": query})
+        distances = {}
+        for pk, text in self.candidates(queryset, query):
+            distance = name_distance(query, text or "", limit)
+            if distance <= limit:
+                distances[pk] = distance
+        if not distances:
+            # Still ranked, so the response is shaped like any other fuzzy result
+            return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return queryset.filter(pk__in=distances).annotate(search_rank=Case(
+            *[When(pk=pk, then=Value(-float(distance))) for pk, distance in distances.items()],
+            output_field=FloatField()
+        ))
+
+
+RESTAURANT_TRIGRAMS = TrigramIndex(Restaurant, "restaurants_restaurant_trigram", "name")
+DEAL_TRIGRAMS = TrigramIndex(Deal, "restaurants_deal_trigram", "title")
+TRIGRAM_INDEXES = {Restaurant: RESTAURANT_TRIGRAMS, Deal: DEAL_TRIGRAMS}
+
+
+class FuzzySearchFilter(BaseFilterBackend):
+    """
+    ``?fuzzy=`` matches names (deal titles) despite typos, best matches
+    first through ``search_rank`` and RankedOrderingFilter
+    """
+    fuzzy_param = "fuzzy"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.fuzzy_param, "")
+        index = TRIGRAM_INDEXES.get(queryset.model)
+        if index is None or not normalize(query):
+            return queryset
+        return index.search(queryset, query)
@@ -0,0 +1,282 @@
+"""Geohash and distance helpers for indexing and querying restaurant coordinates"""
+import math
+
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.0
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5m cells, stored on Restaurant.geohash
+MAX_COVER_CELLS = 32
+
+# Cell pruning compares against the nearest point of a cell, which is a
+# slight over-estimate near meridian edges; keep a little slack.
+_COVER_SLACK = 1.01
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometers"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing the radius"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    cos_lat = abs(math.cos(math.radians(latitude)))
+    lon_delta = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+    return (
+        max(-90.0, latitude - lat_delta),
+        min(90.0, latitude + lat_delta),
+        longitude - lon_delta,
+        longitude + lon_delta,
+    )
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a base32 geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                ch = (ch << 1) | 1
+                lon_range[0] = mid
+            else:
+                ch <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                ch = (ch << 1) | 1
+                lat_range[0] = mid
+            else:
+                ch <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (min_lat, max_lat, min_lon, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geohash_cell_size(precision):
+    """Return the (lat, lon) size in degrees of a cell at the given precision"""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def _next_geohash(geohash):
+    """Smallest geohash (of any length) sorting after every cell under geohash"""
+    chars = list(geohash)
+    while chars:
+        index = GEOHASH_ALPHABET.index(chars[-1])
+        if index + 1 < len(GEOHASH_ALPHABET):
+            chars[-1] = GEOHASH_ALPHABET[index + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def _distance_to_cell(latitude, longitude, bounds):
+    """Approximate distance in km from a point to the nearest point of a cell"""
+    min_lat, max_lat, min_lon, max_lon = bounds
+    nearest_lat = min(max(latitude, min_lat), max_lat)
+    # Shift the cell by whole turns so it lies closest to the query longitude
+    center = (min_lon + max_lon) / 2
+    shift = round((longitude - center) / 360.0) * 360.0
+    nearest_lon = min(max(longitude, min_lon + shift), max_lon + shift)
+    return haversine(latitude, longitude, nearest_lat, nearest_lon)
+
+
+def _wrap_longitude(longitude):
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def _cover_cells(latitude, longitude, radius_km, precision):
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    lat_size, lon_size = geohash_cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while True:
+        lon = min_lon
+        while True:
+            cells.add(encode_geohash(min(lat, 90.0 - 1e-9), _wrap_longitude(lon), precision))
+            if lon >= max_lon:
+                break
+            lon = min(lon + lon_size, max_lon)
+        if lat >= max_lat:
+            break
+        lat = min(lat + lat_size, max_lat)
+    return cells
+
+
+def geohash_cover(latitude, longitude, radius_km, max_cells=MAX_COVER_CELLS):
+    """
+    Plan the geohash ranges that cover a circle.
+
+    Picks the finest precision whose cover fits in ``max_cells``, drops the
+    cells lying entirely outside the radius and merges neighbouring cells
+    into contiguous ``(start, stop)`` ranges. ``stop`` is exclusive and may be
+    ``None`` for the end of the keyspace.
+    """
+    cells = None
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lon_size = geohash_cell_size(precision)
+        lat_span = 2 * radius_km / KM_PER_DEGREE
+        cos_lat = max(abs(math.cos(math.radians(latitude))), 1e-6)
+        lon_span = min(360.0, 2 * radius_km / (KM_PER_DEGREE * cos_lat))
+        estimate = (math.ceil(lat_span / lat_size) + 1) * (math.ceil(lon_span / lon_size) + 1)
+        if estimate > max_cells * 4 and precision > 1:
+            continue
+        cells = _cover_cells(latitude, longitude, radius_km, precision)
+        if len(cells) <= max_cells or precision == 1:
+            break
+
+    limit = radius_km * _COVER_SLACK
+    cells = sorted(
+        cell for cell in cells
+        if _distance_to_cell(latitude, longitude, geohash_bounds(cell)) <= limit
+    )
+
+    ranges = []
+    for cell in cells:
+        stop = _next_geohash(cell)
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((cell, stop))
+    return ranges
+
+
+def radius_filter(latitude, longitude, radius_km, prefix=""):
+    """
+    Build a Q object selecting restaurants inside the geohash cover and the
+    bounding box of a radius. ``prefix`` allows filtering through a relation
+    (e.g. ``"restaurant__"``).
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+
+    cells = Q()
+    for start, stop in geohash_cover(latitude, longitude, radius_km):
+        cell = Q(**{f"{prefix}geohash__gte": start})
+        if stop is not None:
+            cell &= Q(**{f"{prefix}geohash__lt": stop})
+        cells |= cell
+
+    query = cells & Q(**{
+        f"{prefix}latitude__gte": min_lat,
+        f"{prefix}latitude__lte": max_lat,
+    })
+    if min_lon >= -180.0 and max_lon <= 180.0:
+        query &= Q(**{
+            f"{prefix}longitude__gte": min_lon,
+            f"{prefix}longitude__lte": max_lon,
+        })
+    return query
+
+
+def distance_expression(latitude, longitude, prefix=""):
+    """
+    Database expression for the haversine distance in km from a point to
+    ``latitude``/``longitude`` columns. Uses only portable math functions,
+    which Django also registers on SQLite.
+    """
+    lat1 = math.radians(latitude)
+    lat2 = Radians(Cast(f"{prefix}latitude", FloatField()))
+    dlat = lat2 - Value(lat1)
+    dlon = Radians(Cast(f"{prefix}longitude", FloatField())) - Value(math.radians(longitude))
+    a = (
+        Power(Sin(dlat / Value(2.0)), 2)
+        + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin(dlon / Value(2.0)), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+def decode_polyline(encoded, precision=5):
+    """Decode a Google encoded polyline into a list of (latitude, longitude)"""
+    points = []
+    index = latitude = longitude = 0
+    factor = 10 ** precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                if index >= len(encoded):
+                    raise ValueError("Truncated polyline")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                if byte < 0:
+                    raise ValueError("Invalid polyline character")
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        latitude += deltas[0]
+        longitude += deltas[1]
+        points.append((latitude / factor, longitude / factor))
+    return points
+
+
+def corridor_filter(points, width_km, max_boxes=32, prefix=""):
+    """
+    Build a Q object of bounding boxes around consecutive runs of route
+    segments, each grown by ``width_km``. Runs are sized so at most
+    ``max_boxes`` boxes are emitted however detailed the route is.
+    """
+    segments = max(len(points) - 1, 1)
+    run = math.ceil(segments / max_boxes)
+    query = Q()
+    for start in range(0, segments, run):
+        chunk = points[start:start + run + 1]
+        latitudes = [lat for lat, _ in chunk]
+        longitudes = [lon for _, lon in chunk]
+        lat_delta = width_km / KM_PER_DEGREE
+        # Widest longitude span is at the latitude furthest from the equator
+        widest = min(89.0, max(abs(lat) for lat in latitudes) + lat_delta)
+        lon_delta = width_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+        query |= Q(**{
+            f"{prefix}latitude__gte": min(latitudes) - lat_delta,
+            f"{prefix}latitude__lte": max(latitudes) + lat_delta,
+            f"{prefix}longitude__gte": min(longitudes) - lon_delta,
+            f"{prefix}longitude__lte": max(longitudes) + lon_delta,
+        })
+    return query
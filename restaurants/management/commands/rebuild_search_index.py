@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from restaurants.fuzzy import TRIGRAM_INDEXES
+from restaurants.search import SEARCH_DOCUMENTS
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the restaurant and deal full-text search and trigram indexes from scratch. "
+        "They are normally kept current by writes."
+    )
+
+    def handle(self, *args, **options):
+        for model, document in SEARCH_DOCUMENTS.items():
+            document.rebuild()
+            self.stdout.write(f"Rebuilt search index for {model._meta.verbose_name_plural}")
+        for model, trigram_index in TRIGRAM_INDEXES.items():
+            trigram_index.rebuild()
+            self.stdout.write(f"Rebuilt trigram index for {model._meta.verbose_name_plural}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from restaurants.models import City, Country, Restaurant, RestaurantCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute Restaurant.active_deals_count for every restaurant and the "
+        "catalogue counts of every country, city and category. Counts are "
+        "normally kept current by writes and run_deal_scheduler."
+    )
+
+    def handle(self, *args, **options):
+        updated = Restaurant.refresh_active_deals_counts()
+        self.stdout.write(f"Refreshed active deal counts for {updated} restaurants")
+        updated = City.refresh_catalogue_counts()
+        self.stdout.write(f"Refreshed restaurant and deal counts for {updated} cities")
+        updated = Country.refresh_cities_counts()
+        self.stdout.write(f"Refreshed city counts for {updated} countries")
+        updated = RestaurantCategory.refresh_restaurants_counts()
+        self.stdout.write(f"Refreshed restaurant counts for {updated} categories")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from restaurants.scheduler import DealScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the deal scheduler: flips Deal.is_live and refreshes restaurant "
+        "active deal counts as deals start and end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tick", type=float, default=1.0, help="Seconds per wheel tick")
+        parser.add_argument(
+            "--horizon", type=int, default=300,
+            help="Seconds of upcoming boundaries kept in the wheel"
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Sweep and fire due transitions once, then exit"
+        )
+
+    def handle(self, *args, **options):
+        scheduler = DealScheduler(tick=options["tick"], horizon=options["horizon"])
+        if options["once"]:
+            changed = scheduler.run_once()
+            self.stdout.write(f"Flipped {changed} deals")
+            return
+        self.stdout.write("Deal scheduler running")
+        scheduler.run()
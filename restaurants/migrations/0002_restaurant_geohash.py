@@ -0,0 +1,86 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(latitude, longitude):
+    """Geohash as restaurants.geo encoded it at the time of this migration"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(chars) < GEOHASH_PRECISION:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                ch = (ch << 1) | 1
+                lon_range[0] = mid
+            else:
+                ch <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                ch = (ch << 1) | 1
+                lat_range[0] = mid
+            else:
+                ch <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bit = 0
+            ch = 0
+    return "".join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    Restaurant = apps.get_model("restaurants", "Restaurant")
+    restaurants = Restaurant.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).only("id", "latitude", "longitude")
+    batch = []
+    for restaurant in restaurants.iterator(chunk_size=2000):
+        restaurant.geohash = encode_geohash(restaurant.latitude, restaurant.longitude)
+        batch.append(restaurant)
+        if len(batch) >= 2000:
+            Restaurant.objects.bulk_update(batch, ["geohash"])
+            batch = []
+    if batch:
+        Restaurant.objects.bulk_update(batch, ["geohash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Geohash of latitude/longitude, maintained on save",
+                max_length=12,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="restaurant",
+            index=models.Index(
+                fields=["is_active", "verified", "geohash", "latitude", "longitude"],
+                name="restaurant_geohash_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
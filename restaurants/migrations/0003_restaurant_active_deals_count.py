@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_active_deals_count(apps, schema_editor):
+    Restaurant = apps.get_model("restaurants", "Restaurant")
+    Deal = apps.get_model("restaurants", "Deal")
+    now = timezone.now()
+    active_deals = (
+        Deal.objects.filter(
+            restaurant=OuterRef("pk"),
+            is_active=True,
+            start_date__lte=now,
+            end_date__gte=now,
+        )
+        .order_by()
+        .values("restaurant")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Restaurant.objects.update(active_deals_count=Coalesce(Subquery(active_deals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0002_restaurant_geohash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="restaurant",
+            name="active_deals_count",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_active_deals_count, migrations.RunPython.noop),
+    ]
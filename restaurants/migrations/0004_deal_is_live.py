@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:25
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_is_live(apps, schema_editor):
+    Deal = apps.get_model("restaurants", "Deal")
+    now = timezone.now()
+    Deal.objects.filter(is_active=True, start_date__lte=now, end_date__gte=now).update(
+        is_live=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0003_restaurant_active_deals_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deal",
+            name="is_live",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_is_live, migrations.RunPython.noop),
+    ]
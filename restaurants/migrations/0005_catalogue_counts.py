@@ -0,0 +1,79 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_by):
+    return Coalesce(
+        Subquery(queryset.order_by().values(group_by).annotate(count=Count("id")).values("count")),
+        0,
+    )
+
+
+def backfill_catalogue_counts(apps, schema_editor):
+    Country = apps.get_model("restaurants", "Country")
+    City = apps.get_model("restaurants", "City")
+    RestaurantCategory = apps.get_model("restaurants", "RestaurantCategory")
+    Restaurant = apps.get_model("restaurants", "Restaurant")
+    Deal = apps.get_model("restaurants", "Deal")
+    Country.objects.update(
+        cities_count=_count(City.objects.filter(country=OuterRef("pk"), is_active=True), "country")
+    )
+    City.objects.update(
+        restaurants_count=_count(
+            Restaurant.objects.filter(city=OuterRef("pk"), is_active=True, verified=True),
+            "city",
+        ),
+        active_deals_count=_count(
+            Deal.objects.filter(
+                restaurant__city=OuterRef("pk"),
+                restaurant__is_active=True,
+                restaurant__verified=True,
+                is_live=True,
+            ),
+            "restaurant__city",
+        ),
+    )
+    RestaurantCategory.objects.update(
+        restaurants_count=_count(
+            Restaurant.categories.through.objects.filter(
+                restaurantcategory=OuterRef("pk"),
+                restaurant__is_active=True,
+                restaurant__verified=True,
+            ),
+            "restaurantcategory",
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0004_deal_is_live"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="city",
+            name="active_deals_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="city",
+            name="restaurants_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="country",
+            name="cities_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="restaurantcategory",
+            name="restaurants_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_catalogue_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0005_catalogue_counts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="deal",
+            index=models.Index(fields=["is_live", "is_featured", "created_at", "id"], name="deal_listing_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="dealuse",
+            index=models.Index(fields=["user", "used_at", "id"], name="dealuse_user_used_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="restaurant",
+            index=models.Index(fields=["is_active", "verified", "is_featured", "created_at", "id"], name="restaurant_listing_idx"),
+        ),
+    ]
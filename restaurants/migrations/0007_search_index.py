@@ -0,0 +1,66 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:50
+
+from django.db import migrations
+
+# Documents as restaurants.search builds them at the time of this migration:
+# (table, weight A-D columns, FROM clause)
+SEARCH_DOCUMENTS = (
+    (
+        "restaurants_restaurant_search",
+        ("o.name", "city.name", "o.address", "o.description"),
+        "restaurants_restaurant o "
+        "INNER JOIN restaurants_city city ON city.id = o.city_id",
+    ),
+    (
+        "restaurants_deal_search",
+        ("o.title", "restaurant.name", "city.name", "o.description"),
+        "restaurants_deal o "
+        "INNER JOIN restaurants_restaurant restaurant ON restaurant.id = o.restaurant_id "
+        "INNER JOIN restaurants_city city ON city.id = restaurant.city_id",
+    ),
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns, source in SEARCH_DOCUMENTS:
+        texts = [f"COALESCE({column}, '')" for column in columns]
+        if vendor == "sqlite":
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {table} USING fts5("
+                "a, b, c, d, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            schema_editor.execute(
+                f"INSERT INTO {table} (rowid, a, b, c, d) "
+                f"SELECT o.id, {', '.join(texts)} FROM {source}"
+            )
+        elif vendor == "postgresql":
+            schema_editor.execute(
+                f"CREATE TABLE {table} (object_id bigint PRIMARY KEY, document tsvector NOT NULL)"
+            )
+            schema_editor.execute(f"CREATE INDEX {table}_document ON {table} USING gin (document)")
+            document = " || ".join(
+                f"setweight(to_tsvector('simple', {text}), '{weight}')"
+                for text, weight in zip(texts, "ABCD")
+            )
+            schema_editor.execute(
+                f"INSERT INTO {table} (object_id, document) SELECT o.id, {document} FROM {source}"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ("sqlite", "postgresql"):
+        return
+    for table, _, _ in SEARCH_DOCUMENTS:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0006_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
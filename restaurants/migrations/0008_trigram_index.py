@@ -0,0 +1,81 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:05
+
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# (SQLite side table, PostgreSQL index, model, column)
+TRIGRAM_INDEXES = (
+    ("restaurants_restaurant_trigram", "restaurants_restaurant_name_trgm", "Restaurant", "name"),
+    ("restaurants_deal_trigram", "restaurants_deal_title_trgm", "Deal", "title"),
+)
+
+
+def trigrams(text):
+    """Trigrams as restaurants.fuzzy computed them at the time of this migration"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(
+        char if char.isalnum() else " "
+        for char in decomposed if not unicodedata.combining(char)
+    )
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for _, index, model_name, column in TRIGRAM_INDEXES:
+            table = apps.get_model("restaurants", model_name)._meta.db_table
+            schema_editor.execute(
+                f"CREATE INDEX {index} ON {table} USING gin (lower({column}) gin_trgm_ops)"
+            )
+        return
+    if vendor != "sqlite":
+        return
+    for table, _, model_name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE TABLE {table} (trigram text NOT NULL, object_id bigint NOT NULL, "
+            "PRIMARY KEY (trigram, object_id)) WITHOUT ROWID"
+        )
+        schema_editor.execute(f"CREATE INDEX {table}_object ON {table} (object_id)")
+
+        model = apps.get_model("restaurants", model_name)
+        rows = model._base_manager.values_list("pk", column).iterator(chunk_size=BATCH_SIZE)
+        with schema_editor.connection.cursor() as cursor:
+            batch = []
+            for pk, text in rows:
+                batch += [[gram, pk] for gram in trigrams(text or "")]
+                if len(batch) >= BATCH_SIZE:
+                    cursor.executemany(
+                        f"INSERT INTO {table} (trigram, object_id) VALUES (%s, %s)", batch
+                    )
+                    batch = []
+            if batch:
+                cursor.executemany(f"INSERT INTO {table} (trigram, object_id) VALUES (%s, %s)", batch)
+
+
+def drop_trigram_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, index, *_ in TRIGRAM_INDEXES:
+        if vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS {index}")
+        elif vendor == "sqlite":
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0007_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0008_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="deal",
+            index=models.Index(fields=["updated_at"], name="deal_updated_idx"),
+        ),
+    ]
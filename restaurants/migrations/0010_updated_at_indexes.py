@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("restaurants", "0009_deal_updated_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(fields=["updated_at"], name="city_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="restaurant",
+            index=models.Index(fields=["updated_at"], name="restaurant_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="restaurantcategory",
+            index=models.Index(fields=["updated_at"], name="category_updated_idx"),
+        ),
+    ]
@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 from core.models import TimeStampedModel, SoftDeleteModel
 from users.models import User
 
+from .geo import encode_geohash
+
 
 class Country(TimeStampedModel):
     """Country model"""
@@ -12,12 +16,28 @@ class Country(TimeStampedModel):
     code = models.CharField(max_length=2, unique=True, help_text="ISO 3166-1 alpha-2 code (e.g., GB, DE)")
     flag_emoji = models.CharField(max_length=10, blank=True, help_text="Flag emoji for the country")
     
+    # Denormalized, kept current by restaurants.signals and the
+    # refresh_active_deals_counts command
+    cities_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Countries"
         ordering = ["name"]
         
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def refresh_cities_counts(cls, country_ids=None):
+        """Recompute cities_count in bulk (all countries by default)"""
+        active_cities = City.objects.filter(
+            country=OuterRef("pk"),
+            is_active=True
+        ).order_by().values("country").annotate(count=Count("id")).values("count")
+        queryset = cls.objects.all()
+        if country_ids is not None:
+            queryset = queryset.filter(pk__in=country_ids)
+        return queryset.update(cities_count=Coalesce(Subquery(active_cities), 0))
 
 
 class City(TimeStampedModel):
@@ -29,16 +49,46 @@ class City(TimeStampedModel):
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     is_active = models.BooleanField(default=True, db_index=True)
     
+    # Denormalized counts of active, verified restaurants and their live
+    # deals, kept current by restaurants.signals and the
+    # refresh_active_deals_counts command
+    restaurants_count = models.PositiveIntegerField(default=0, editable=False)
+    active_deals_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Cities"
         unique_together = [["name", "country"]]
         ordering = ["name"]
         indexes = [
             models.Index(fields=["is_active", "country"]),
+            # The autocomplete index refreshes from recently changed rows
+            models.Index(fields=["updated_at"], name="city_updated_idx"),
         ]
         
     def __str__(self):
         return f"{self.name}, {self.country.name}"
+    
+    @classmethod
+    def refresh_catalogue_counts(cls, city_ids=None):
+        """Recompute restaurants_count and active_deals_count in bulk (all cities by default)"""
+        restaurants = Restaurant.objects.filter(
+            city=OuterRef("pk"),
+            is_active=True,
+            verified=True
+        ).order_by().values("city").annotate(count=Count("id")).values("count")
+        live_deals = Deal.objects.filter(
+            restaurant__city=OuterRef("pk"),
+            restaurant__is_active=True,
+            restaurant__verified=True,
+            is_live=True
+        ).order_by().values("restaurant__city").annotate(count=Count("id")).values("count")
+        queryset = cls.objects.all()
+        if city_ids is not None:
+            queryset = queryset.filter(pk__in=city_ids)
+        return queryset.update(
+            restaurants_count=Coalesce(Subquery(restaurants), 0),
+            active_deals_count=Coalesce(Subquery(live_deals), 0)
+        )
 
 
 class RestaurantCategory(TimeStampedModel):
@@ -47,12 +97,33 @@ class RestaurantCategory(TimeStampedModel):
     slug = models.SlugField(max_length=120, unique=True)
     icon = models.CharField(max_length=50, blank=True, help_text="Icon name or emoji")
     
+    # Denormalized count of active, verified restaurants, kept current by
+    # restaurants.signals and the refresh_active_deals_counts command
+    restaurants_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = "Restaurant Categories"
         ordering = ["name"]
+        indexes = [
+            # The autocomplete index refreshes from recently changed rows
+            models.Index(fields=["updated_at"], name="category_updated_idx"),
+        ]
         
     def __str__(self):
         return self.name
+    
+    @classmethod
+    def refresh_restaurants_counts(cls, category_ids=None):
+        """Recompute restaurants_count in bulk (all categories by default)"""
+        restaurants = Restaurant.categories.through.objects.filter(
+            restaurantcategory=OuterRef("pk"),
+            restaurant__is_active=True,
+            restaurant__verified=True
+        ).order_by().values("restaurantcategory").annotate(count=Count("id")).values("count")
+        queryset = cls.objects.all()
+        if category_ids is not None:
+            queryset = queryset.filter(pk__in=category_ids)
+        return queryset.update(restaurants_count=Coalesce(Subquery(restaurants), 0))
 
 
 class Restaurant(TimeStampedModel, SoftDeleteModel):
@@ -74,6 +145,12 @@ class Restaurant(TimeStampedModel, SoftDeleteModel):
     postcode = models.CharField(max_length=20, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(
+        max_length=12,
+        blank=True,
+        editable=False,
+        help_text="Geohash of latitude/longitude, maintained on save"
+    )
     
     # Contact
     phone = models.CharField(max_length=20, blank=True)
@@ -92,6 +169,10 @@ class Restaurant(TimeStampedModel, SoftDeleteModel):
     verified = models.BooleanField(default=False, db_index=True)
     is_featured = models.BooleanField(default=False, db_index=True)
     
+    # Denormalized, kept current by restaurants.signals and the
+    # refresh_active_deals_counts command
+    active_deals_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    
     # Hours (simple JSON field - can be extended later)
     opening_hours = models.JSONField(default=dict, blank=True)
     
@@ -101,19 +182,49 @@ class Restaurant(TimeStampedModel, SoftDeleteModel):
             models.Index(fields=["city", "verified"]),
             models.Index(fields=["is_featured", "verified"]),
             models.Index(fields=["latitude", "longitude"]),
+            # Coordinates are trailing key columns so the index covers the
+            # nearby candidate scan on every backend
+            models.Index(
+                fields=["is_active", "verified", "geohash", "latitude", "longitude"],
+                name="restaurant_geohash_idx"
+            ),
+            # Keyset pagination of the public list in its default order
+            models.Index(
+                fields=["is_active", "verified", "is_featured", "created_at", "id"],
+                name="restaurant_listing_idx"
+            ),
+            # The spatial and autocomplete indexes refresh from recently changed rows
+            models.Index(fields=["updated_at"], name="restaurant_updated_idx"),
         ]
         
     def __str__(self):
         return f"{self.name} ({self.city.name})"
     
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"geohash"}
+        super().save(*args, **kwargs)
+    
     def get_active_deals_count(self):
         """Count of active deals for this restaurant"""
-        now = timezone.now()
-        return self.deals.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now
-        ).count()
+        return self.deals.filter(is_live=True).count()
+    
+    @classmethod
+    def refresh_active_deals_counts(cls, restaurant_ids=None):
+        """Recompute active_deals_count in bulk (all restaurants by default)"""
+        active_deals = Deal.objects.filter(
+            restaurant=OuterRef("pk"),
+            is_live=True
+        ).order_by().values("restaurant").annotate(count=Count("id")).values("count")
+        queryset = cls.objects.all()
+        if restaurant_ids is not None:
+            queryset = queryset.filter(pk__in=restaurant_ids)
+        return queryset.update(active_deals_count=Coalesce(Subquery(active_deals), 0))
 
 
 class Deal(TimeStampedModel, SoftDeleteModel):
@@ -173,6 +284,9 @@ class Deal(TimeStampedModel, SoftDeleteModel):
     
     # Status
     is_featured = models.BooleanField(default=False, db_index=True)
+    # Materialized is_active and start_date <= now <= end_date; set on save
+    # and flipped at each boundary by the run_deal_scheduler command
+    is_live = models.BooleanField(default=False, db_index=True, editable=False)
     
     class Meta:
         ordering = ["-is_featured", "-created_at"]
@@ -180,11 +294,27 @@ class Deal(TimeStampedModel, SoftDeleteModel):
             models.Index(fields=["restaurant", "is_active"]),
             models.Index(fields=["start_date", "end_date", "is_active"]),
             models.Index(fields=["is_featured", "is_active"]),
+            # Keyset pagination of live deals in their default order
+            models.Index(
+                fields=["is_live", "is_featured", "created_at", "id"],
+                name="deal_listing_idx"
+            ),
+            # The deal scheduler and the autocomplete index pick up changed deals by it
+            models.Index(fields=["updated_at"], name="deal_updated_idx"),
         ]
         
     def __str__(self):
         return f"{self.title} - {self.restaurant.name}"
     
+    def save(self, *args, **kwargs):
+        self.is_live = bool(
+            self.is_active and self.start_date <= timezone.now() <= self.end_date
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"is_live"}
+        super().save(*args, **kwargs)
+    
     def is_active_now(self):
         """Check if deal is currently active"""
         now = timezone.now()
@@ -194,12 +324,13 @@ class Deal(TimeStampedModel, SoftDeleteModel):
             and (self.max_uses is None or self.used_count < self.max_uses)
         )
     
-    def can_user_use(self, user):
-        """Check if user can use this deal"""
+    def can_user_use(self, user, use_count=None):
+        """Check if user can use this deal; ``use_count`` skips counting their uses"""
         if not self.is_active_now():
             return False
-        user_uses = self.deal_uses.filter(user=user).count()
-        return user_uses < self.max_per_user
+        if use_count is None:
+            use_count = self.deal_uses.filter(user=user).count()
+        return use_count < self.max_per_user
 
 
 class RestaurantImage(TimeStampedModel):
@@ -285,6 +416,8 @@ class DealUse(TimeStampedModel):
         indexes = [
             models.Index(fields=["user", "deal"]),
             models.Index(fields=["used_at"]),
+            # Keyset pagination of a user's uses, newest first
+            models.Index(fields=["user", "used_at", "id"], name="dealuse_user_used_idx"),
         ]
         
     def __str__(self):
@@ -0,0 +1,124 @@
+"""
+Per-user saved restaurant and deal ids kept in Redis sorted sets.
+
+Each set is scored by the time the item was saved, so it answers both
+``is_saved`` membership and the newest-first saved lists. Sets are hydrated
+from the database on first use and written through by the SavedRestaurant /
+SavedDeal signals. A sentinel member marks a set as hydrated, because Redis
+does not keep empty sets and write-through may create a partial one.
+
+Every write-through also bumps a per-set version key that hydration WATCHes
+while it reads the database, so a save or unsave committed during that read
+aborts the hydration instead of being overwritten by the stale rows.
+"""
+import logging
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, WatchError
+
+from .models import SavedDeal, SavedRestaurant
+
+logger = logging.getLogger(__name__)
+
+SAVED_SET_TTL = 24 * 60 * 60
+HYDRATED = "-"
+
+# kind -> (model, field holding the saved object's id)
+SAVED_KINDS = {
+    "restaurants": (SavedRestaurant, "restaurant_id"),
+    "deals": (SavedDeal, "deal_id"),
+}
+
+
+def saved_key(kind, user_id):
+    return cache.make_key(f"saved:{kind}:{user_id}")
+
+
+def version_key(kind, user_id):
+    return cache.make_key(f"saved:{kind}:{user_id}:version")
+
+
+def _from_database(kind, user_id):
+    model, field = SAVED_KINDS[kind]
+    return list(
+        model.objects.filter(user_id=user_id).order_by("-created_at").values_list(field, "created_at")
+    )
+
+
+def saved_ids(kind, user_id):
+    """Ids the user saved, newest first"""
+    key = saved_key(kind, user_id)
+    try:
+        redis = get_redis_connection("default")
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.zscore(key, HYDRATED)
+        pipeline.zrevrange(key, 0, -1)
+        hydrated, members = pipeline.execute()
+        if hydrated is not None:
+            return [int(member) for member in members if member != HYDRATED.encode()]
+
+        with redis.pipeline() as pipeline:
+            pipeline.watch(version_key(kind, user_id))
+            rows = _from_database(kind, user_id)
+            mapping = {HYDRATED: 0}
+            mapping.update({str(object_id): saved_at.timestamp() for object_id, saved_at in rows})
+            pipeline.multi()
+            # Replaces any partial set left by a write-through
+            pipeline.delete(key)
+            pipeline.zadd(key, mapping)
+            pipeline.expire(key, SAVED_SET_TTL)
+            try:
+                pipeline.execute()
+            except WatchError:
+                # A write-through landed during the read; the rows may be
+                # stale for the cache but are this request's best answer
+                pass
+    except RedisError:
+        logger.warning("Saved set unavailable, reading from the database", exc_info=True)
+        rows = _from_database(kind, user_id)
+    return [object_id for object_id, _ in rows]
+
+
+def _bump_version(redis, kind, user_id):
+    """Abort any hydration of the user's set that is reading the database"""
+    pipeline = redis.pipeline()
+    pipeline.incr(version_key(kind, user_id))
+    pipeline.expire(version_key(kind, user_id), SAVED_SET_TTL)
+    pipeline.execute()
+
+
+def add_saved(kind, user_id, object_id, saved_at):
+    """Write a save through to the user's set (only if it is hydrated)"""
+    key = saved_key(kind, user_id)
+    try:
+        redis = get_redis_connection("default")
+        _bump_version(redis, kind, user_id)
+        # A set expiring in between is left without the sentinel and is
+        # rebuilt from the database on its next read
+        if redis.exists(key):
+            pipeline = redis.pipeline()
+            pipeline.zadd(key, {str(object_id): saved_at.timestamp()})
+            pipeline.expire(key, SAVED_SET_TTL)
+            pipeline.execute()
+    except RedisError:
+        logger.warning("Saved set write-through failed", exc_info=True)
+        drop_saved(kind, user_id)
+
+
+def remove_saved(kind, user_id, object_id):
+    try:
+        redis = get_redis_connection("default")
+        _bump_version(redis, kind, user_id)
+        redis.zrem(saved_key(kind, user_id), str(object_id))
+    except RedisError:
+        logger.warning("Saved set write-through failed", exc_info=True)
+        drop_saved(kind, user_id)
+
+
+def drop_saved(kind, user_id):
+    """Forget a user's set so it is hydrated again from the database"""
+    try:
+        get_redis_connection("default").delete(saved_key(kind, user_id))
+    except RedisError:
+        pass
@@ -0,0 +1,179 @@
+"""
+Deal activation/expiry scheduler.
+
+Upcoming ``start_date``/``end_date`` boundaries are kept in a hashed timing
+wheel; at each tick deals created or edited since the previous tick (by
+``updated_at``) have their boundaries added, then the due deals have their
+materialized ``is_live`` flag flipped in bulk and ``deal_live_changed`` is sent
+so counters and caches can react. A periodic sweep repairs anything the wheel
+did not see (bulk updates that skip ``updated_at``, a scheduler restart, ...).
+"""
+import logging
+import math
+import time
+from datetime import timedelta
+
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Deal
+from .signals import deal_live_changed
+
+logger = logging.getLogger(__name__)
+
+UPDATE_BATCH_SIZE = 500
+# Deals committed slightly out of updated_at order are re-read on the next
+# tick; scheduling a boundary twice is harmless.
+CHANGES_OVERLAP = timedelta(seconds=5)
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel with ``tick``-second buckets. Scheduling is O(1) and
+    advancing only visits the buckets elapsed since the last advance.
+    """
+
+    def __init__(self, tick=1.0, slots=3600):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.current = None
+
+    def __len__(self):
+        return sum(len(keys) for slot in self.slots for keys in slot.values())
+
+    def schedule(self, key, when):
+        """Schedule ``key`` to fire once ``when`` (an aware datetime) has passed"""
+        index = math.ceil(when.timestamp() / self.tick)
+        if self.current is not None and index <= self.current:
+            index = self.current + 1
+        self.slots[index % len(self.slots)].setdefault(index, set()).add(key)
+
+    def advance(self, now):
+        """Return every key due at or before ``now``"""
+        target = int(now.timestamp() // self.tick)
+        if self.current is None:
+            self.current = target - 1
+        due = set()
+        if target - self.current >= len(self.slots):
+            # Fell a full turn behind: scan every bucket once
+            for slot in self.slots:
+                for index in [index for index in slot if index <= target]:
+                    due |= slot.pop(index)
+        else:
+            for index in range(self.current + 1, target + 1):
+                due |= self.slots[index % len(self.slots)].pop(index, set())
+        self.current = max(self.current, target)
+        return due
+
+
+def live_q(now):
+    return Q(is_active=True, start_date__lte=now, end_date__gte=now)
+
+
+def next_transition(now):
+    """Earliest start or end of an active deal after ``now``, or None"""
+    upcoming = Deal.objects.filter(is_active=True).aggregate(
+        next_start=Min("start_date", filter=Q(start_date__gt=now)),
+        next_end=Min("end_date", filter=Q(end_date__gte=now))
+    )
+    moments = [moment for moment in upcoming.values() if moment is not None]
+    return min(moments, default=None)
+
+
+def apply_transitions(queryset, now):
+    """
+    Flip ``is_live`` for deals in ``queryset`` whose state is out of date and
+    send ``deal_live_changed``. Returns the number of deals changed.
+    """
+    live = live_q(now)
+    going_live = list(queryset.filter(live, is_live=False).values_list("id", "restaurant_id"))
+    going_dark = list(queryset.filter(is_live=True).exclude(live).values_list("id", "restaurant_id"))
+    for rows, value in ((going_live, True), (going_dark, False)):
+        for offset in range(0, len(rows), UPDATE_BATCH_SIZE):
+            batch = [deal_id for deal_id, _ in rows[offset:offset + UPDATE_BATCH_SIZE]]
+            # updated_at lets the in-process indexes pick the change up
+            Deal.objects.filter(id__in=batch).update(is_live=value, updated_at=timezone.now())
+
+    changed = going_live + going_dark
+    if changed:
+        deal_live_changed.send(
+            sender=Deal,
+            deal_ids=[deal_id for deal_id, _ in changed],
+            restaurant_ids=sorted({restaurant_id for _, restaurant_id in changed}),
+        )
+    return len(changed)
+
+
+class DealScheduler:
+    """Keeps ``Deal.is_live`` in step with deal start and end boundaries"""
+
+    def __init__(self, tick=1.0, horizon=300):
+        self.tick = tick
+        self.horizon = timedelta(seconds=horizon)
+        self.wheel = TimingWheel(tick=tick, slots=max(1, int(horizon / tick)) * 2)
+        self.loaded_until = None
+        # Wall-clock time of the last look for changed deals
+        self.changes_since = None
+
+    def schedule_boundaries(self, queryset, now, until):
+        """Schedule the boundaries of deals in ``queryset`` falling between ``now`` and ``until``"""
+        boundaries = queryset.filter(is_active=True).filter(
+            Q(start_date__gt=now, start_date__lte=until) | Q(end_date__gte=now, end_date__lt=until)
+        ).values_list("id", "start_date", "end_date")
+        count = 0
+        for deal_id, start_date, end_date in boundaries.iterator(chunk_size=5000):
+            if now < start_date <= until:
+                self.wheel.schedule(deal_id, start_date)
+                count += 1
+            if now <= end_date < until:
+                # A deal is live through end_date itself and dark right after
+                self.wheel.schedule(deal_id, end_date + timedelta(microseconds=1))
+                count += 1
+        return count
+
+    def load(self, now):
+        """Schedule every boundary falling in the next horizon"""
+        self.changes_since = timezone.now()
+        until = now + self.horizon
+        count = self.schedule_boundaries(Deal.objects.all(), now, until)
+        self.loaded_until = until
+        return count
+
+    def pick_up_changes(self, now):
+        """Schedule the boundaries of deals created or edited since the last look"""
+        checked_at = timezone.now()
+        changed = Deal.objects.filter(updated_at__gte=self.changes_since - CHANGES_OVERLAP)
+        count = self.schedule_boundaries(changed, now, self.loaded_until)
+        self.changes_since = checked_at
+        return count
+
+    def sweep(self, now):
+        """Fix every deal whose is_live is out of date"""
+        return apply_transitions(Deal.objects.all(), now)
+
+    def run_once(self, now=None):
+        """
+        Fire due transitions, after picking up changed deals or reloading the
+        horizon when half consumed
+        """
+        now = now or timezone.now()
+        changed = 0
+        if self.loaded_until is None or now >= self.loaded_until - self.horizon / 2:
+            changed += self.sweep(now)
+            self.load(now)
+        else:
+            self.pick_up_changes(now)
+        due = list(self.wheel.advance(now))
+        for offset in range(0, len(due), UPDATE_BATCH_SIZE):
+            batch = due[offset:offset + UPDATE_BATCH_SIZE]
+            changed += apply_transitions(Deal.objects.filter(id__in=batch), now)
+        return changed
+
+    def run(self, stop=None):
+        """Tick until ``stop()`` returns True"""
+        while not (stop and stop()):
+            started = time.monotonic()
+            changed = self.run_once()
+            if changed:
+                logger.info("Deal scheduler flipped %d deals", changed)
+            time.sleep(max(0.0, self.tick - (time.monotonic() - started)))
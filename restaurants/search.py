@@ -0,0 +1,164 @@
+"""
+Full-text search index over restaurants and deals.
+
+Each searchable model has a side table holding one document per row, built
+from up to four text fields weighted A (most relevant) to D. On SQLite the
+table is an FTS5 virtual table keyed by rowid and ranked with bm25; on
+PostgreSQL it holds a weighted ``tsvector`` under a GIN index and is ranked
+with ts_rank_cd. Other backends have no index and fall back to DRF's
+SearchFilter. Terms are prefix-matched and all must occur. Documents are
+rewritten by restaurants.signals after commit and can be rebuilt with the
+rebuild_search_index command.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Deal, Restaurant
+
+# bm25 weights of the FTS5 columns, mirroring tsvector weights A-D
+FTS5_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+INDEX_BATCH_SIZE = 500
+# Unicode letters and digits; punctuation would be query syntax to either engine
+_term_re = re.compile(r"[^\W_]+")
+
+
+def search_terms(text):
+    return _term_re.findall(text.lower())
+
+
+class SearchDocument:
+    """The index table of one model and the fields its documents are built from"""
+
+    def __init__(self, model, table, fields):
+        self.model = model
+        self.table = table
+        # Field lookups for weights A, B, C and D; None leaves a weight empty
+        self.fields = fields
+
+    def supported(self, using="default"):
+        return connections[using].vendor in ("sqlite", "postgresql")
+
+    def rows(self, queryset):
+        lookups = [field for field in self.fields if field is not None]
+        for row in queryset.values_list("pk", *lookups).iterator(chunk_size=INDEX_BATCH_SIZE):
+            texts = iter(row[1:])
+            yield row[0], [
+                (next(texts) or "") if field is not None else "" for field in self.fields
+            ]
+
+    def index(self, queryset=None, using="default"):
+        """(Re)write the documents of ``queryset`` (every row by default)"""
+        if not self.supported(using):
+            return
+        if queryset is None:
+            queryset = self.model._base_manager.using(using)
+        connection = connections[using]
+        batch = []
+        with connection.cursor() as cursor:
+            for row in self.rows(queryset):
+                batch.append(row)
+                if len(batch) >= INDEX_BATCH_SIZE:
+                    self._write(cursor, connection.vendor, batch)
+                    batch = []
+            if batch:
+                self._write(cursor, connection.vendor, batch)
+
+    def _write(self, cursor, vendor, rows):
+        if vendor == "sqlite":
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [[pk] for pk, _ in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, a, b, c, d) VALUES (%s, %s, %s, %s, %s)",
+                [[pk, *texts] for pk, texts in rows]
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (object_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C') || "
+                "setweight(to_tsvector('simple', %s), 'D')) "
+                "ON CONFLICT (object_id) DO UPDATE SET document = EXCLUDED.document",
+                [[pk, *texts] for pk, texts in rows]
+            )
+
+    def remove(self, pks, using="default"):
+        if not self.supported(using) or not pks:
+            return
+        key = "rowid" if connections[using].vendor == "sqlite" else "object_id"
+        with connections[using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE {key} = %s", [[pk] for pk in pks])
+
+    def rebuild(self, using="default"):
+        """Empty the table and index every row again"""
+        if not self.supported(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        self.index(using=using)
+
+    def search(self, queryset, terms):
+        """``queryset`` narrowed to documents matching every term, annotated with ``search_rank``"""
+        connection = connections[queryset.db]
+        outer = "{}.{}".format(
+            connection.ops.quote_name(self.model._meta.db_table),
+            connection.ops.quote_name(self.model._meta.pk.column)
+        )
+        if connection.vendor == "sqlite":
+            query = " ".join(f'"{term}"*' for term in terms)
+            matches = RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [query])
+            # bm25 is lower for better matches
+            weights = ", ".join(map(str, FTS5_WEIGHTS))
+            rank = RawSQL(
+                f"SELECT -bm25({self.table}, {weights}) FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND rowid = {outer}",
+                [query],
+                output_field=FloatField()
+            )
+        else:
+            query = " & ".join(f"{term}:*" for term in terms)
+            matches = RawSQL(
+                f"SELECT object_id FROM {self.table} "
+                "WHERE document @@ to_tsquery('simple', %s)",
+                [query]
+            )
+            rank = RawSQL(
+                f"SELECT ts_rank_cd(document, to_tsquery('simple', %s)) FROM {self.table} "
+                f"WHERE object_id = {outer}",
+                [query],
+                output_field=FloatField()
+            )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
+
+RESTAURANT_SEARCH = SearchDocument(
+    Restaurant,
+    "restaurants_restaurant_search",
+    ("name", "city__name", "address", "description")
+)
+DEAL_SEARCH = SearchDocument(
+    Deal,
+    "restaurants_deal_search",
+    ("title", "restaurant__name", "restaurant__city__name", "description")
+)
+SEARCH_DOCUMENTS = {Restaurant: RESTAURANT_SEARCH, Deal: DEAL_SEARCH}
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for SearchFilter answered from the full-text index,
+    annotating ``search_rank`` for RankedOrderingFilter. Models without an
+    index, and backends without full-text support, use SearchFilter.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        document = SEARCH_DOCUMENTS.get(queryset.model)
+        if document is None or not document.supported(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        terms = search_terms(" ".join(self.get_search_terms(request)))
+        if not terms:
+            return queryset
+        return document.search(queryset, terms)
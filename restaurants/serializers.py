@@ -4,23 +4,37 @@ from .models import (
     Country, City, RestaurantCategory, Restaurant, Deal,
     RestaurantImage, DealImage, SavedRestaurant, SavedDeal, DealUse
 )
+from .user_context import UserContext
+
+
+class PrimaryImageMixin:
+    """
+    Resolves ``primary_image`` from ``obj.images.all()``, which is served by
+    the views' ``prefetch_related("images")`` instead of a query per row.
+    """
+    
+    def get_primary_image(self, obj):
+        images = list(obj.images.all())
+        primary_img = next((image for image in images if image.is_primary), None)
+        if not primary_img and images:
+            primary_img = images[0]
+        if primary_img and primary_img.image:
+            request = self.context.get("request")
+            if request:
+                return request.build_absolute_uri(primary_img.image.url)
+            return primary_img.image.url
+        return None
 
 
 class CountrySerializer(serializers.ModelSerializer):
-    cities_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Country
         fields = ("id", "name", "code", "flag_emoji", "cities_count", "created_at")
-        
-    def get_cities_count(self, obj):
-        return obj.cities.filter(is_active=True).count()
 
 
 class CitySerializer(serializers.ModelSerializer):
     country = CountrySerializer(read_only=True)
-    restaurants_count = serializers.SerializerMethodField()
-    active_deals_count = serializers.SerializerMethodField()
     
     class Meta:
         model = City
@@ -28,32 +42,13 @@ class CitySerializer(serializers.ModelSerializer):
             "id", "name", "slug", "country", "latitude", "longitude",
             "is_active", "restaurants_count", "active_deals_count", "created_at"
         )
-        
-    def get_restaurants_count(self, obj):
-        return obj.restaurants.filter(is_active=True, verified=True).count()
-    
-    def get_active_deals_count(self, obj):
-        from django.utils import timezone
-        now = timezone.now()
-        return Deal.objects.filter(
-            restaurant__city=obj,
-            restaurant__is_active=True,
-            restaurant__verified=True,
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now
-        ).count()
 
 
 class RestaurantCategorySerializer(serializers.ModelSerializer):
-    restaurants_count = serializers.SerializerMethodField()
     
     class Meta:
         model = RestaurantCategory
         fields = ("id", "name", "slug", "icon", "restaurants_count", "created_at")
-        
-    def get_restaurants_count(self, obj):
-        return obj.restaurants.filter(is_active=True, verified=True).count()
 
 
 class RestaurantImageSerializer(serializers.ModelSerializer):
@@ -89,13 +84,13 @@ class RestaurantSerializer(serializers.ModelSerializer):
         )
         
     def get_is_saved(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return SavedRestaurant.objects.filter(user=request.user, restaurant=obj).exists()
+        user_context = UserContext.for_request(self.context.get("request"))
+        if user_context:
+            return obj.pk in user_context.saved_restaurant_ids
         return False
 
 
-class RestaurantListSerializer(serializers.ModelSerializer):
+class RestaurantListSerializer(PrimaryImageMixin, serializers.ModelSerializer):
     """Lightweight serializer for list views"""
     city_name = serializers.CharField(source="city.name", read_only=True)
     country_name = serializers.CharField(source="city.country.name", read_only=True)
@@ -109,17 +104,14 @@ class RestaurantListSerializer(serializers.ModelSerializer):
             "latitude", "longitude", "price_range", "verified",
             "is_featured", "primary_image", "active_deals_count"
         )
-        
-    def get_primary_image(self, obj):
-        primary_img = obj.images.filter(is_primary=True).first()
-        if not primary_img:
-            primary_img = obj.images.first()
-        if primary_img and primary_img.image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(primary_img.image.url)
-            return primary_img.image.url
-        return None
+
+
+class NearbyRestaurantSerializer(RestaurantListSerializer):
+    """List serializer with the distance (km) from the queried point"""
+    distance = serializers.FloatField(read_only=True)
+    
+    class Meta(RestaurantListSerializer.Meta):
+        fields = RestaurantListSerializer.Meta.fields + ("distance",)
 
 
 class DealImageSerializer(serializers.ModelSerializer):
@@ -159,19 +151,21 @@ class DealSerializer(serializers.ModelSerializer):
         return obj.is_active_now()
     
     def get_can_use(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return obj.can_user_use(request.user)
+        user_context = UserContext.for_request(self.context.get("request"))
+        if user_context:
+            return obj.can_user_use(
+                user_context.user, use_count=user_context.deal_use_counts.get(obj.pk, 0)
+            )
         return False
     
     def get_is_saved(self, obj):
-        request = self.context.get("request")
-        if request and request.user.is_authenticated:
-            return SavedDeal.objects.filter(user=request.user, deal=obj).exists()
+        user_context = UserContext.for_request(self.context.get("request"))
+        if user_context:
+            return obj.pk in user_context.saved_deal_ids
         return False
 
 
-class DealListSerializer(serializers.ModelSerializer):
+class DealListSerializer(PrimaryImageMixin, serializers.ModelSerializer):
     """Lightweight serializer for deal lists"""
     restaurant_name = serializers.CharField(source="restaurant.name", read_only=True)
     restaurant_slug = serializers.CharField(source="restaurant.slug", read_only=True)
@@ -188,17 +182,6 @@ class DealListSerializer(serializers.ModelSerializer):
             "is_featured", "primary_image", "is_active", "created_at"
         )
         
-    def get_primary_image(self, obj):
-        primary_img = obj.images.filter(is_primary=True).first()
-        if not primary_img:
-            primary_img = obj.images.first()
-        if primary_img and primary_img.image:
-            request = self.context.get("request")
-            if request:
-                return request.build_absolute_uri(primary_img.image.url)
-            return primary_img.image.url
-        return None
-    
     def get_is_active(self, obj):
         return obj.is_active_now()
 
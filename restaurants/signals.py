@@ -0,0 +1,313 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from core.cache import fields_changed, previous_value, purge_tags_on_commit, snapshot_fields
+from core.snapshots import rebuild_snapshot, rebuild_snapshots_on_commit
+
+from .models import (
+    City, Country, Deal, DealImage, DealUse, Restaurant, RestaurantCategory,
+    RestaurantImage, SavedDeal, SavedRestaurant
+)
+from .saved import add_saved, remove_saved
+from .fuzzy import DEAL_TRIGRAMS, RESTAURANT_TRIGRAMS
+from .search import DEAL_SEARCH, RESTAURANT_SEARCH
+from .snapshots import CATEGORIES_SNAPSHOT, CITIES_SNAPSHOT, COUNTRIES_SNAPSHOT
+
+# Cache namespace of the rendered DealViewSet.active pages
+ACTIVE_DEALS_CACHE = "active_deals"
+# Cache namespace of the country, city and category lists, which embed
+# restaurant and live deal counts
+CATALOGUE_CACHE = "catalogue"
+
+# Surrogate keys of whole collections, purged when membership or order may
+# have changed; single rows are tagged "<model>:<id>"
+DEALS_TAG = "deals"
+RESTAURANTS_TAG = "restaurants"
+COUNTRIES_TAG = "countries"
+CITIES_TAG = "cities"
+CATEGORIES_TAG = "categories"
+
+# Fields deciding which deals are listed and in what order. is_live is
+# recomputed by every save, so an unrelated edit can flip it ahead of the
+# scheduler, which then has nothing left to announce
+DEAL_LISTING_FIELDS = [
+    "is_active", "is_live", "is_featured", "start_date", "end_date", "restaurant_id"
+]
+# Restaurant fields that decide whether its deals are listed and where it is counted
+RESTAURANT_LISTING_FIELDS = ["is_active", "verified", "city_id"]
+# Restaurant fields placing it on the map clusters
+RESTAURANT_LOCATION_FIELDS = ["latitude", "longitude"]
+CITY_LISTING_FIELDS = ["is_active", "country_id"]
+
+# Sent by the deal scheduler after flipping Deal.is_live in bulk, with
+# ``deal_ids`` and ``restaurant_ids`` of the deals that changed
+deal_live_changed = Signal()
+
+
+def refresh_restaurant_counts(restaurant_ids):
+    """Recompute the restaurants' active_deals_count once the write commits"""
+    transaction.on_commit(
+        lambda: Restaurant.refresh_active_deals_counts(restaurant_ids)
+    )
+
+
+def refresh_city_counts(restaurant_ids):
+    """
+    Recompute the catalogue counts of the restaurants' cities, and the cities
+    snapshot, once the write commits
+    """
+    def refresh():
+        rows = Restaurant.objects.filter(id__in=restaurant_ids).values_list("city_id", flat=True)
+        City.refresh_catalogue_counts(set(rows))
+        rebuild_snapshot(CITIES_SNAPSHOT)
+    transaction.on_commit(refresh)
+
+
+def reindex_on_commit(document, **lookup):
+    """
+    Rewrite the search documents (or trigrams) of rows matching ``lookup``
+    once the write commits
+    """
+    transaction.on_commit(
+        lambda: document.index(document.model._base_manager.filter(**lookup))
+    )
+
+
+def restaurant_tags(restaurant_ids):
+    """Restaurant and city surrogate keys for a set of restaurants"""
+    rows = Restaurant.objects.filter(id__in=restaurant_ids).values_list("id", "city_id")
+    tags = {f"restaurant:{restaurant_id}" for restaurant_id in restaurant_ids}
+    tags |= {f"city:{city_id}" for _, city_id in rows}
+    return tags
+
+
+@receiver(pre_save, sender=Deal)
+def deal_saving(sender, instance, **kwargs):
+    snapshot_fields(instance, DEAL_LISTING_FIELDS)
+
+
+@receiver(post_save, sender=Deal)
+def deal_saved(sender, instance, **kwargs):
+    # Covers creates, edits, soft-deletes (is_active=False) and uses; a deal
+    # moved to another restaurant leaves its old one
+    restaurant_ids = {instance.restaurant_id, previous_value(instance, "restaurant_id")}
+    refresh_restaurant_counts(restaurant_ids)
+    tags = {f"deal:{instance.pk}"}
+    if fields_changed(instance, DEAL_LISTING_FIELDS):
+        # Listings and the live deal counts of its restaurant and city may move
+        refresh_city_counts(restaurant_ids)
+        tags |= {DEALS_TAG} | restaurant_tags(restaurant_ids)
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=Deal)
+def deal_deleted(sender, instance, **kwargs):
+    refresh_restaurant_counts([instance.restaurant_id])
+    refresh_city_counts([instance.restaurant_id])
+    purge_tags_on_commit(
+        {f"deal:{instance.pk}", DEALS_TAG} | restaurant_tags([instance.restaurant_id])
+    )
+
+
+@receiver(deal_live_changed)
+def deals_transitioned(sender, deal_ids, restaurant_ids, **kwargs):
+    Restaurant.refresh_active_deals_counts(restaurant_ids)
+    refresh_city_counts(restaurant_ids)
+    tags = {DEALS_TAG} | restaurant_tags(restaurant_ids)
+    purge_tags_on_commit(tags | {f"deal:{deal_id}" for deal_id in deal_ids})
+
+
+@receiver(post_save, sender=DealImage)
+@receiver(post_delete, sender=DealImage)
+def deal_image_changed(sender, instance, **kwargs):
+    purge_tags_on_commit({f"deal:{instance.deal_id}"})
+
+
+@receiver(pre_save, sender=Restaurant)
+def restaurant_saving(sender, instance, **kwargs):
+    snapshot_fields(instance, RESTAURANT_LISTING_FIELDS + RESTAURANT_LOCATION_FIELDS)
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, **kwargs):
+    # The save wrote back the instance's copy of active_deals_count, which
+    # may predate deal writes since it was loaded
+    refresh_restaurant_counts([instance.pk])
+    tags = {f"restaurant:{instance.pk}", f"city:{instance.city_id}"}
+    if fields_changed(instance, RESTAURANT_LISTING_FIELDS + RESTAURANT_LOCATION_FIELDS):
+        tags.add(RESTAURANTS_TAG)
+    if fields_changed(instance, RESTAURANT_LISTING_FIELDS):
+        # Its deals join or leave the listings; city and category counts move
+        city_ids = {instance.city_id, previous_value(instance, "city_id")}
+        category_ids = list(instance.categories.values_list("id", flat=True))
+        transaction.on_commit(lambda: City.refresh_catalogue_counts(city_ids))
+        transaction.on_commit(
+            lambda: RestaurantCategory.refresh_restaurants_counts(category_ids)
+        )
+        rebuild_snapshots_on_commit([CITIES_SNAPSHOT, CATEGORIES_SNAPSHOT])
+        tags |= {DEALS_TAG} | {f"city:{city_id}" for city_id in city_ids}
+        tags |= {f"category:{category_id}" for category_id in category_ids}
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: City.refresh_catalogue_counts([instance.city_id]))
+    # Its category links are already gone, so recount every category
+    transaction.on_commit(RestaurantCategory.refresh_restaurants_counts)
+    rebuild_snapshots_on_commit([CITIES_SNAPSHOT, CATEGORIES_SNAPSHOT])
+    purge_tags_on_commit(
+        {f"restaurant:{instance.pk}", f"city:{instance.city_id}", DEALS_TAG, RESTAURANTS_TAG}
+    )
+
+
+@receiver(m2m_changed, sender=Restaurant.categories.through)
+def restaurant_categories_changed(sender, instance, action, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if isinstance(instance, Restaurant):
+        tags = {f"restaurant:{instance.pk}"}
+        if pk_set:
+            category_ids = set(pk_set)
+            tags |= {f"category:{category_id}" for category_id in pk_set}
+        else:
+            # post_clear does not say which categories were removed
+            category_ids = None
+            tags.add(CATEGORIES_TAG)
+    else:
+        category_ids = [instance.pk]
+        tags = {f"category:{instance.pk}"}
+        tags |= {f"restaurant:{restaurant_id}" for restaurant_id in pk_set or ()}
+    transaction.on_commit(lambda: RestaurantCategory.refresh_restaurants_counts(category_ids))
+    rebuild_snapshots_on_commit([CATEGORIES_SNAPSHOT])
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_save, sender=RestaurantImage)
+@receiver(post_delete, sender=RestaurantImage)
+def restaurant_image_changed(sender, instance, **kwargs):
+    purge_tags_on_commit({f"restaurant:{instance.restaurant_id}"})
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def country_changed(sender, instance, **kwargs):
+    if kwargs["signal"] is post_save:
+        # The save wrote back the instance's possibly stale cities_count
+        transaction.on_commit(lambda: Country.refresh_cities_counts([instance.pk]))
+    # Catalogue rows are searched and ordered by name, so any write may move them
+    rebuild_snapshots_on_commit([COUNTRIES_SNAPSHOT, CITIES_SNAPSHOT])
+    purge_tags_on_commit({f"country:{instance.pk}", COUNTRIES_TAG})
+
+
+@receiver(pre_save, sender=City)
+def city_saving(sender, instance, **kwargs):
+    snapshot_fields(instance, CITY_LISTING_FIELDS)
+
+
+@receiver(post_save, sender=City)
+def city_saved(sender, instance, **kwargs):
+    # The save wrote back the instance's possibly stale counts
+    transaction.on_commit(lambda: City.refresh_catalogue_counts([instance.pk]))
+    tags = {f"city:{instance.pk}", CITIES_TAG}
+    if fields_changed(instance, CITY_LISTING_FIELDS):
+        # Countries embed their count of active cities
+        country_ids = {instance.country_id, previous_value(instance, "country_id")}
+        transaction.on_commit(lambda: Country.refresh_cities_counts(country_ids))
+        rebuild_snapshots_on_commit([COUNTRIES_SNAPSHOT])
+        tags |= {f"country:{country_id}" for country_id in country_ids}
+    rebuild_snapshots_on_commit([CITIES_SNAPSHOT])
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=City)
+def city_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: Country.refresh_cities_counts([instance.country_id]))
+    rebuild_snapshots_on_commit([COUNTRIES_SNAPSHOT, CITIES_SNAPSHOT])
+    purge_tags_on_commit({f"city:{instance.pk}", f"country:{instance.country_id}", CITIES_TAG})
+
+
+@receiver(post_save, sender=RestaurantCategory)
+@receiver(post_delete, sender=RestaurantCategory)
+def category_changed(sender, instance, **kwargs):
+    if kwargs["signal"] is post_save:
+        # The save wrote back the instance's possibly stale restaurants_count
+        transaction.on_commit(
+            lambda: RestaurantCategory.refresh_restaurants_counts([instance.pk])
+        )
+    rebuild_snapshots_on_commit([CATEGORIES_SNAPSHOT])
+    purge_tags_on_commit({f"category:{instance.pk}", CATEGORIES_TAG})
+
+
+@receiver(post_save, sender=SavedRestaurant)
+def restaurant_saved_by_user(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: add_saved(
+            "restaurants", instance.user_id, instance.restaurant_id, instance.created_at
+        ))
+
+
+@receiver(post_delete, sender=SavedRestaurant)
+def restaurant_unsaved_by_user(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: remove_saved("restaurants", instance.user_id, instance.restaurant_id)
+    )
+
+
+@receiver(post_save, sender=SavedDeal)
+def deal_saved_by_user(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: add_saved(
+            "deals", instance.user_id, instance.deal_id, instance.created_at
+        ))
+
+
+@receiver(post_delete, sender=SavedDeal)
+def deal_unsaved_by_user(sender, instance, **kwargs):
+    transaction.on_commit(lambda: remove_saved("deals", instance.user_id, instance.deal_id))
+
+
+@receiver(post_save, sender=SavedRestaurant)
+@receiver(post_delete, sender=SavedRestaurant)
+@receiver(post_save, sender=SavedDeal)
+@receiver(post_delete, sender=SavedDeal)
+@receiver(post_save, sender=DealUse)
+@receiver(post_delete, sender=DealUse)
+def user_state_changed(sender, instance, **kwargs):
+    # Detail responses render is_saved and can_use for the requesting user
+    purge_tags_on_commit({f"user:{instance.user_id}"})
+
+
+@receiver(post_save, sender=Deal)
+def deal_search_document_changed(sender, instance, **kwargs):
+    reindex_on_commit(DEAL_SEARCH, pk=instance.pk)
+    reindex_on_commit(DEAL_TRIGRAMS, pk=instance.pk)
+
+
+@receiver(post_delete, sender=Deal)
+def deal_search_document_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: DEAL_SEARCH.remove([instance.pk]))
+    transaction.on_commit(lambda: DEAL_TRIGRAMS.remove([instance.pk]))
+
+
+@receiver(post_save, sender=Restaurant)
+def restaurant_search_document_changed(sender, instance, **kwargs):
+    # Deal documents embed the restaurant's name
+    reindex_on_commit(RESTAURANT_SEARCH, pk=instance.pk)
+    reindex_on_commit(RESTAURANT_TRIGRAMS, pk=instance.pk)
+    reindex_on_commit(DEAL_SEARCH, restaurant_id=instance.pk)
+
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_search_document_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: RESTAURANT_SEARCH.remove([instance.pk]))
+    transaction.on_commit(lambda: RESTAURANT_TRIGRAMS.remove([instance.pk]))
+
+
+@receiver(post_save, sender=City)
+def city_search_documents_changed(sender, instance, created, **kwargs):
+    # Restaurant and deal documents embed the city's name
+    if not created:
+        reindex_on_commit(RESTAURANT_SEARCH, city_id=instance.pk)
+        reindex_on_commit(DEAL_SEARCH, restaurant__city_id=instance.pk)
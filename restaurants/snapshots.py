@@ -0,0 +1,48 @@
+"""Catalogue snapshots served to first-page country, city and category list requests"""
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from core.snapshots import register_snapshot
+
+from .models import City, Country, RestaurantCategory
+from .serializers import CitySerializer, CountrySerializer, RestaurantCategorySerializer
+
+COUNTRIES_SNAPSHOT = "countries"
+CITIES_SNAPSHOT = "cities"
+CATEGORIES_SNAPSHOT = "categories"
+
+
+def _first_page(queryset, serializer_class, base_url):
+    # The body PageNumberPagination renders for page 1 of the list at base_url
+    page_size = api_settings.PAGE_SIZE
+    count = queryset.count()
+    next_link = None
+    if count > page_size:
+        page_query_param = api_settings.DEFAULT_PAGINATION_CLASS.page_query_param
+        next_link = replace_query_param(base_url, page_query_param, 2)
+    return {
+        "count": count,
+        "next": next_link,
+        "previous": None,
+        "results": serializer_class(queryset[:page_size], many=True).data,
+    }
+
+
+register_snapshot(
+    COUNTRIES_SNAPSHOT,
+    lambda base_url: _first_page(Country.objects.order_by("name"), CountrySerializer, base_url)
+)
+register_snapshot(
+    CITIES_SNAPSHOT,
+    lambda base_url: _first_page(
+        City.objects.filter(is_active=True).select_related("country").order_by("name"),
+        CitySerializer,
+        base_url
+    )
+)
+register_snapshot(
+    CATEGORIES_SNAPSHOT,
+    lambda base_url: _first_page(
+        RestaurantCategory.objects.order_by("name"), RestaurantCategorySerializer, base_url
+    )
+)
@@ -0,0 +1,295 @@
+"""
+Per-process spatial index over verified restaurant coordinates.
+
+Coordinates are stored as unit vectors in a static k-d tree so radius and
+k-nearest queries never touch the database; the tree only hands back ids
+and distances. Rows changed since the last refresh (by ``updated_at``) are
+kept in a small overlay that is searched by brute force until it grows
+large enough to justify a rebuild (see core.memory_index).
+"""
+import heapq
+
+import numpy as np
+
+from core.memory_index import DEFAULTS as REFRESH_DEFAULTS, RefreshingIndex
+
+from .distance import after_mask, haversine_many
+from .geo import EARTH_RADIUS_KM
+
+LEAF_SIZE = 32
+
+DEFAULTS = {**REFRESH_DEFAULTS, "ENABLED": True}
+
+
+def index_settings():
+    return restaurant_index.settings()
+
+
+def to_unit_vectors(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def km_to_chord(distance_km):
+    return 2 * np.sin(np.minimum(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0.0, 1.0))
+
+
+class KDTree:
+    """Static k-d tree over 3-d unit vectors with small leaf buckets"""
+
+    def __init__(self, ids, points, leaf_size=LEAF_SIZE):
+        order = np.arange(len(ids))
+        lows, highs, starts, ends, lefts, rights = [], [], [], [], [], []
+
+        def add_node(start, end):
+            block = points[order[start:end]]
+            lows.append(block.min(axis=0))
+            highs.append(block.max(axis=0))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+            return len(starts) - 1
+
+        stack = [add_node(0, len(ids))] if len(ids) else []
+        while stack:
+            node = stack.pop()
+            start, end = starts[node], ends[node]
+            if end - start <= leaf_size:
+                continue
+            axis = int(np.argmax(highs[node] - lows[node]))
+            mid = (start + end) // 2
+            segment = order[start:end]
+            order[start:end] = segment[np.argpartition(points[segment, axis], mid - start)]
+            lefts[node] = add_node(start, mid)
+            rights[node] = add_node(mid, end)
+            stack.extend((lefts[node], rights[node]))
+
+        self.ids = ids[order]
+        self.points = points[order]
+        self.lows = np.array(lows).reshape(-1, 3)
+        self.highs = np.array(highs).reshape(-1, 3)
+        self.starts = starts
+        self.ends = ends
+        self.lefts = lefts
+        self.rights = rights
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return (
+            self.ids.nbytes + self.points.nbytes + self.lows.nbytes + self.highs.nbytes
+            + 4 * 8 * len(self.starts)
+        )
+
+    def _min_chord(self, node, point):
+        gap = np.maximum(self.lows[node] - point, 0) + np.maximum(point - self.highs[node], 0)
+        return float(np.sqrt(gap @ gap))
+
+    def query_radius(self, point, chord):
+        """Return (ids, chords) of points within a chord distance, unordered"""
+        if not len(self.ids):
+            return self.ids[:0], np.empty(0)
+        found_ids, found_chords = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._min_chord(node, point) > chord:
+                continue
+            if self.lefts[node] == -1:
+                start, end = self.starts[node], self.ends[node]
+                chords = np.linalg.norm(self.points[start:end] - point, axis=1)
+                mask = chords <= chord
+                found_ids.append(self.ids[start:end][mask])
+                found_chords.append(chords[mask])
+            else:
+                stack.extend((self.lefts[node], self.rights[node]))
+        if not found_ids:
+            return self.ids[:0], np.empty(0)
+        return np.concatenate(found_ids), np.concatenate(found_chords)
+
+    def _max_chord(self, node, point):
+        reach = np.maximum(np.abs(self.lows[node] - point), np.abs(self.highs[node] - point))
+        return float(np.sqrt(reach @ reach))
+
+    def query_nearest(self, point, k, chord=np.inf, exclude=None, after=None):
+        """
+        Return up to k (ids, distances in km) nearest to point within a chord
+        distance, visiting nodes best-first. ``exclude`` is a set of ids to
+        skip and ``after`` an exclusive ``(distance_km, id)`` keyset cursor;
+        nodes lying entirely inside the cursor ring are never visited.
+        """
+        if not len(self.ids) or k <= 0:
+            return self.ids[:0], np.empty(0)
+        after_km, after_id = after if after is not None else (-1.0, 0)
+        # Slightly shrunk so float error never prunes a node on the ring itself
+        after_chord = km_to_chord(after_km) * (1 - 1e-9) if after is not None else 0.0
+        best = []  # max-heap of (-distance_km, -id)
+        worst_chord = np.inf
+        heap = [(self._min_chord(0, point), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound > chord or bound > worst_chord:
+                break
+            if after is not None and self._max_chord(node, point) < after_chord:
+                continue
+            if self.lefts[node] == -1:
+                start, end = self.starts[node], self.ends[node]
+                chords = np.linalg.norm(self.points[start:end] - point, axis=1)
+                distances = chord_to_km(chords)
+                ids = self.ids[start:end]
+                mask = chords <= chord
+                if after is not None:
+                    mask &= (distances > after_km) | ((distances == after_km) & (ids > after_id))
+                for index in np.flatnonzero(mask):
+                    item = (-distances[index], -int(ids[index]))
+                    if exclude and -item[1] in exclude:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                    else:
+                        continue
+                    if len(best) == k:
+                        worst_chord = km_to_chord(-best[0][0]) * (1 + 1e-9)
+            else:
+                for child in (self.lefts[node], self.rights[node]):
+                    heapq.heappush(heap, (self._min_chord(child, point), child))
+        best.sort(reverse=True)
+        return (
+            np.array([-item[1] for item in best], dtype=np.int64),
+            np.array([-item[0] for item in best], dtype=np.float64),
+        )
+
+
+class _Snapshot:
+    """Immutable tree plus pending changes, swapped in as a whole"""
+
+    def __init__(self, tree, removed=frozenset(), overlay=None):
+        overlay = overlay or {}
+        self.tree = tree
+        self.removed = removed
+        self.removed_ids = np.fromiter(removed, dtype=np.int64, count=len(removed))
+        self.overlay = overlay
+        self.overlay_ids = np.fromiter(overlay.keys(), dtype=np.int64, count=len(overlay))
+        self.overlay_coords = np.array(list(overlay.values()), dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.tree)
+
+    @property
+    def pending(self):
+        return len(self.removed) + len(self.overlay)
+
+    @property
+    def nbytes(self):
+        return (
+            self.tree.nbytes + self.removed_ids.nbytes
+            + self.overlay_ids.nbytes + self.overlay_coords.nbytes
+        )
+
+    def overlay_distances(self, latitude, longitude):
+        return haversine_many(
+            latitude, longitude, self.overlay_coords[:, 0], self.overlay_coords[:, 1]
+        )
+
+
+class RestaurantSpatialIndex(RefreshingIndex):
+    """In-memory index of active, verified restaurant coordinates"""
+    name = "restaurant spatial index"
+    settings_name = "RESTAURANT_SPATIAL_INDEX"
+    size_name = "points"
+    defaults = DEFAULTS
+
+    @staticmethod
+    def _queryset():
+        from .models import Restaurant
+        return Restaurant.objects.values_list(
+            "id", "latitude", "longitude", "is_active", "verified"
+        )
+
+    def load(self):
+        """A tree of every eligible restaurant"""
+        rows = list(self._queryset().filter(
+            is_active=True,
+            verified=True,
+            latitude__isnull=False,
+            longitude__isnull=False
+        ))
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        points = to_unit_vectors(
+            [float(row[1]) for row in rows], [float(row[2]) for row in rows]
+        )
+        return _Snapshot(KDTree(ids, points))
+
+    def apply_changes(self, snapshot, since):
+        removed = set(snapshot.removed)
+        overlay = dict(snapshot.overlay)
+        for pk, latitude, longitude, is_active, verified in self._queryset().filter(
+            updated_at__gte=since
+        ):
+            # Any changed row is masked out of the tree and re-added to the
+            # overlay if it is still visible
+            removed.add(pk)
+            overlay.pop(pk, None)
+            if is_active and verified and latitude is not None and longitude is not None:
+                overlay[pk] = (float(latitude), float(longitude))
+        return _Snapshot(snapshot.tree, frozenset(removed), overlay)
+
+    @staticmethod
+    def _sorted(ids, distances, limit=None):
+        order = np.lexsort((ids, distances))[:limit]
+        return ids[order], distances[order]
+
+    def radius(self, latitude, longitude, radius_km):
+        """Return (ids, distances in km) inside the radius, nearest first"""
+        self.ensure_fresh()
+        snapshot = self._snapshot
+        point = to_unit_vectors([latitude], [longitude])[0]
+        ids, chords = snapshot.tree.query_radius(point, km_to_chord(radius_km))
+        if snapshot.removed:
+            keep = ~np.isin(ids, snapshot.removed_ids)
+            ids, chords = ids[keep], chords[keep]
+        distances = chord_to_km(chords)
+
+        overlay_distances = snapshot.overlay_distances(latitude, longitude)
+        mask = overlay_distances <= radius_km
+        ids = np.concatenate((ids, snapshot.overlay_ids[mask]))
+        distances = np.concatenate((distances, overlay_distances[mask]))
+        return self._sorted(ids, distances)
+
+    def nearest(self, latitude, longitude, k, radius_km=None, after=None):
+        """
+        Return the k nearest (ids, distances in km), optionally within a
+        radius and after an exclusive ``(distance_km, id)`` cursor
+        """
+        self.ensure_fresh()
+        snapshot = self._snapshot
+        point = to_unit_vectors([latitude], [longitude])[0]
+        chord = np.inf if radius_km is None else km_to_chord(radius_km)
+        ids, distances = snapshot.tree.query_nearest(
+            point, k, chord, exclude=snapshot.removed, after=after
+        )
+
+        overlay_distances = snapshot.overlay_distances(latitude, longitude)
+        mask = after_mask(snapshot.overlay_ids, overlay_distances, after)
+        if radius_km is not None:
+            mask &= overlay_distances <= radius_km
+        ids = np.concatenate((ids, snapshot.overlay_ids[mask]))
+        distances = np.concatenate((distances, overlay_distances[mask]))
+        return self._sorted(ids, distances, k)
+
+    def snapshot_stats(self, snapshot):
+        return {"memory_bytes": snapshot.nbytes}
+
+
+restaurant_index = RestaurantSpatialIndex()
@@ -1,3 +1,912 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import math
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.cache import CachedListMixin
+from core.snapshots import SnapshotListMixin
+from users.models import UserProfile
+from vouchers.models import Merchant
+
+from . import saved
+from .autocomplete import AutocompleteIndex
+from .geo import encode_geohash, geohash_bounds, haversine, radius_filter
+from .models import (
+    City, Country, Deal, DealImage, DealUse, Restaurant, RestaurantCategory, RestaurantImage,
+    SavedDeal, SavedRestaurant
+)
+from .saved import SAVED_SET_TTL, saved_ids, saved_key
+from .scheduler import DealScheduler
+from .signals import ACTIVE_DEALS_CACHE
+from .spatial_index import KDTree, chord_to_km, km_to_chord, restaurant_index, to_unit_vectors
+from .views import CityListView
+
+
+class RestaurantsTestCase(TestCase):
+    """Catalogue fixtures; writes run their on-commit signal handlers"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.country = Country.objects.create(name="United Kingdom", code="GB")
+        self.london = self.create_city("London", Decimal("51.507400"), Decimal("-0.127800"))
+
+    def create_city(self, name, latitude=None, longitude=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return City.objects.create(
+                name=name, slug=name.lower(), country=self.country,
+                latitude=latitude, longitude=longitude
+            )
+
+    def create_restaurant(self, name, city=None, **fields):
+        fields.setdefault("verified", True)
+        fields.setdefault("slug", f"{name.lower().replace(' ', '-')}-{Restaurant.objects.count()}")
+        with self.captureOnCommitCallbacks(execute=True):
+            return Restaurant.objects.create(
+                name=name, city=city or self.london, address="1 High Street", **fields
+            )
+
+    def create_deal(self, restaurant, title="2-for-1 mains", **fields):
+        now = timezone.now()
+        fields.setdefault("start_date", now - timedelta(days=1))
+        fields.setdefault("end_date", now + timedelta(days=7))
+        with self.captureOnCommitCallbacks(execute=True):
+            return Deal.objects.create(restaurant=restaurant, title=title, **fields)
+
+    def update(self, instance, **fields):
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    def results(self, path, params=None):
+        response = self.client.get(path, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+
+class FuzzySearchTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/"
+
+    def test_matches_misspelled_names(self):
+        self.create_restaurant("Noodle Bar")
+        self.create_restaurant("Burger Joint")
+        names = [row["name"] for row in self.results(self.path, {"fuzzy": "nodle bra"})]
+        self.assertEqual(names, ["Noodle Bar"])
+
+    def test_candidates_come_from_the_filtered_queryset(self):
+        for number in range(220):
+            self.create_restaurant(f"Piza Hut {number}")
+        bath = self.create_city("Bath")
+        self.create_restaurant("Pizza Roma", city=bath)
+        names = [row["name"] for row in self.results(self.path, {"fuzzy": "piza", "city": bath.pk})]
+        self.assertEqual(names, ["Pizza Roma"])
+
+    def test_hidden_restaurants_are_not_matched(self):
+        self.create_restaurant("Noodle Bar", verified=False)
+        self.assertEqual(self.results(self.path, {"fuzzy": "nodle"}), [])
+
+
+class DealSchedulerTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.restaurant = self.create_restaurant("Noodle Bar")
+        self.now = timezone.now()
+        self.scheduler = DealScheduler(tick=1.0, horizon=60)
+        self.scheduler.run_once(self.now)
+
+    def test_deal_created_inside_the_horizon_goes_live_at_its_start(self):
+        deal = self.create_deal(self.restaurant, start_date=self.now + timedelta(seconds=10))
+        self.assertFalse(deal.is_live)
+        self.scheduler.run_once(self.now + timedelta(seconds=5))
+        deal.refresh_from_db()
+        self.assertFalse(deal.is_live)
+        self.scheduler.run_once(self.now + timedelta(seconds=11))
+        deal.refresh_from_db()
+        self.assertTrue(deal.is_live)
+
+    def test_deal_edited_inside_the_horizon_ends_at_its_new_end(self):
+        deal = self.create_deal(self.restaurant)
+        self.assertTrue(deal.is_live)
+        deal.end_date = self.now + timedelta(seconds=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            deal.save()
+        self.scheduler.run_once(self.now + timedelta(seconds=5))
+        deal.refresh_from_db()
+        self.assertTrue(deal.is_live)
+        self.scheduler.run_once(self.now + timedelta(seconds=11))
+        deal.refresh_from_db()
+        self.assertFalse(deal.is_live)
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.active_deals_count, 0)
+
+    def test_edit_that_ends_a_deal_before_the_tick_purges_its_listings(self):
+        deal = self.create_deal(self.restaurant)
+        restaurant_path = f"/api/restaurants/restaurants/{self.restaurant.pk}/"
+        etag = self.client.get(restaurant_path)["ETag"]
+        self.assertEqual(len(self.results("/api/restaurants/deals/active/")), 1)
+        # The deal ended but the scheduler has not ticked yet
+        Deal.objects.filter(pk=deal.pk).update(end_date=self.now - timedelta(seconds=1))
+        deal.refresh_from_db()
+        self.update(deal, title="3-for-2 mains")
+        self.assertEqual(self.results("/api/restaurants/deals/active/"), [])
+        self.assertEqual(self.client.get(restaurant_path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PaginationTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/"
+
+    def setUp(self):
+        super().setUp()
+        for number in range(45):
+            self.create_restaurant(f"Noodle Bar {number}", is_featured=number % 7 == 0)
+        self.expected = list(
+            Restaurant.objects.order_by("-is_featured", "-created_at", "-id").values_list("id", flat=True)
+        )
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_page_numbers_are_the_default(self):
+        for params in ({}, {"search": "noodle"}, {"fuzzy": "nodle"}, {"fuzzy": "zzzz"}):
+            data = self.get(self.path, params)
+            self.assertIn("count", data, params)
+            if data["next"]:
+                self.assertIn("page=2", data["next"])
+
+    def test_cursor_walk_follows_the_ordering(self):
+        data = self.get(self.path, {"paginate": "cursor"})
+        self.assertNotIn("count", data)
+        self.assertIsNone(data["previous"])
+        pages = [[row["id"] for row in data["results"]]]
+        while data["next"]:
+            data = self.get(data["next"])
+            pages.append([row["id"] for row in data["results"]])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+
+        # Back from the last page
+        data = self.get(data["previous"])
+        self.assertEqual([row["id"] for row in data["results"]], pages[1])
+        data = self.get(data["previous"])
+        self.assertEqual([row["id"] for row in data["results"]], pages[0])
+        self.assertIsNone(data["previous"])
+
+    def test_cursor_count_is_opt_in(self):
+        data = self.get(self.path, {"paginate": "cursor", "count": "true"})
+        self.assertEqual(data["count"], 45)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.path, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_mode_rejects_unseekable_orderings(self):
+        response = self.client.get(self.path, {"paginate": "cursor", "search": "noodle"})
+        self.assertEqual(response.status_code, 400)
+        data = self.get(self.path, {"paginate": "cursor", "search": "noodle", "ordering": "name"})
+        self.assertEqual(len(data["results"]), 20)
+
+
+@override_settings(AUTOCOMPLETE_INDEX={"BACKGROUND_REFRESH": False})
+class AutocompleteTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.noodles = self.create_restaurant("Noodle Bar")
+        self.nordic = self.create_restaurant("Nordic Café")
+        self.create_restaurant("Burger Joint")
+        self.create_deal(self.noodles, title="Noodle Tuesday")
+        # Two saves outrank Noodle Bar's one live deal
+        for name in ("a", "b"):
+            user = get_user_model().objects.create_user(
+                email=f"{name}@example.com", username=name, password="pw"
+            )
+            SavedRestaurant.objects.create(user=user, restaurant=self.nordic)
+        self.index = AutocompleteIndex()
+
+    def test_any_word_prefix_matches_most_popular_first(self):
+        self.assertEqual(self.index.suggest("no"), [
+            ("restaurant", self.nordic.pk, "Nordic Café"),
+            ("restaurant", self.noodles.pk, "Noodle Bar"),
+            ("deal", Deal.objects.get().pk, "Noodle Tuesday"),
+        ])
+        self.assertEqual(self.index.suggest("TUE"), [("deal", Deal.objects.get().pk, "Noodle Tuesday")])
+        self.assertEqual(self.index.suggest("cafe"), [("restaurant", self.nordic.pk, "Nordic Café")])
+        self.assertEqual(self.index.suggest("lond"), [("city", self.london.pk, "London")])
+
+    def test_refresh_applies_changes(self):
+        self.index.build()
+        self.noodles.name = "Ramen House"
+        self.noodles.save()
+        self.nordic.verified = False
+        self.nordic.save()
+        self.index.refresh()
+        self.assertEqual(self.index.suggest("ram"), [("restaurant", self.noodles.pk, "Ramen House")])
+        self.assertEqual(self.index.suggest("nord"), [])
+        # Deals of a changed restaurant are re-read and stay visible
+        self.assertEqual(self.index.suggest("tues"), [("deal", Deal.objects.get().pk, "Noodle Tuesday")])
+
+    @override_settings(AUTOCOMPLETE_INDEX={"BACKGROUND_REFRESH": True, "REFRESH_INTERVAL": 0})
+    def test_requests_do_not_refresh_when_a_thread_does(self):
+        with mock.patch.object(AutocompleteIndex, "start_refresher") as start_refresher:
+            self.index.suggest("no")
+            with self.assertNumQueries(0):
+                self.index.suggest("bur")
+        start_refresher.assert_called()
+
+
+class SavedSetTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            email="a@example.com", username="a", password="pw"
+        )
+        self.noodles = self.create_restaurant("Noodle Bar")
+        self.burgers = self.create_restaurant("Burger Joint")
+
+    def save(self, restaurant):
+        with self.captureOnCommitCallbacks(execute=True):
+            return SavedRestaurant.objects.create(user=self.user, restaurant=restaurant)
+
+    def hydrate_during(self, write):
+        """Hydrate the user's set with ``write`` committing between its database read and Redis write"""
+        read = saved._from_database
+
+        def read_then_write(kind, user_id):
+            rows = read(kind, user_id)
+            write()
+            return rows
+
+        with mock.patch.object(saved, "_from_database", read_then_write):
+            return saved_ids("restaurants", self.user.pk)
+
+    def test_write_through_keeps_newest_first(self):
+        self.save(self.noodles)
+        self.assertEqual(saved_ids("restaurants", self.user.pk), [self.noodles.pk])
+        self.save(self.burgers)
+        self.assertEqual(saved_ids("restaurants", self.user.pk), [self.burgers.pk, self.noodles.pk])
+
+    def test_unsave_during_hydration_is_not_lost(self):
+        saved_restaurant = self.save(self.noodles)
+
+        def unsave():
+            with self.captureOnCommitCallbacks(execute=True):
+                saved_restaurant.delete()
+
+        self.assertEqual(self.hydrate_during(unsave), [self.noodles.pk])
+        self.assertEqual(saved_ids("restaurants", self.user.pk), [])
+
+    def test_save_during_hydration_is_not_lost(self):
+        self.assertEqual(self.hydrate_during(lambda: self.save(self.noodles)), [])
+        self.assertEqual(saved_ids("restaurants", self.user.pk), [self.noodles.pk])
+
+    def test_save_refreshes_the_ttl(self):
+        saved_ids("restaurants", self.user.pk)
+        redis = get_redis_connection("default")
+        redis.expire(saved_key("restaurants", self.user.pk), 10)
+        self.save(self.noodles)
+        self.assertGreater(redis.ttl(saved_key("restaurants", self.user.pk)), SAVED_SET_TTL - 10)
+
+
+class CatalogueSnapshotTests(RestaurantsTestCase):
+    path = "/api/restaurants/cities/"
+
+    def test_snapshot_is_the_first_page(self):
+        City.objects.bulk_create(
+            City(name=f"Town {index:02}", slug=f"town-{index:02}", country=self.country,
+                 latitude=51, longitude=0)
+            for index in range(25)
+        )
+        bare = self.client.get(self.path)
+        self.assertEqual(bare["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(self.path, {"page": 1})["X-Cache"], "HIT")
+        # The view's own first page, rendered without the snapshot
+        with mock.patch.object(SnapshotListMixin, "list", CachedListMixin.list):
+            page = self.client.get(self.path, {"page": 1})
+        self.assertEqual(bare.content, page.content)
+        self.assertEqual(bare["ETag"], page["ETag"])
+        self.assertEqual(bare.json()["next"], "http://testserver/api/restaurants/cities/?page=2")
+        self.assertEqual(len(bare.json()["results"]), 20)
+
+    def test_gzip_has_its_own_etag(self):
+        identity = self.client.get(self.path)
+        gzipped = self.client.get(self.path, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(gzipped["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(gzipped.content), identity.content)
+        self.assertNotEqual(gzipped["ETag"], identity["ETag"])
+        response = self.client.get(self.path, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=identity["ETag"])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.path, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=gzipped["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_rebuild_the_snapshot(self):
+        etag = self.client.get(self.path)["ETag"]
+        self.assertEqual(self.client.get(self.path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.create_city("Bath")
+        response = self.client.get(self.path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 2)
+
+    def cache_key(self, params):
+        view = CityListView()
+        view.request = Request(APIRequestFactory().get(self.path, params))
+        return view.get_cache_key()
+
+    def test_cache_key_covers_declared_parameters_only(self):
+        key = self.cache_key({"page": 1, "search": "London"})
+        self.assertEqual(self.cache_key({"page": 1, "search": " london ", "utm_source": "mail"}), key)
+        self.assertNotEqual(self.cache_key({"page": 1, "search": "London", "ordering": "name"}),
+                            self.cache_key({"page": 1, "search": "London", "ordering": "Name"}))
+        self.assertNotEqual(self.cache_key({"page": 1, "is_active": "true"}),
+                            self.cache_key({"page": 1, "is_active": "True"}))
+
+
+class ConditionalRetrieveTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.restaurant = self.create_restaurant("Noodle Bar")
+        # Elsewhere, so it shares no surrogate key with the responses under test
+        self.other = self.create_restaurant("Burger Joint", city=self.create_city("Bath"))
+        self.deal = self.create_deal(self.restaurant)
+
+    def assertRevalidates(self, path, write, changed=True):
+        etag = self.client.get(path)["ETag"]
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200 if changed else 304)
+
+    def test_restaurant_writes(self):
+        path = f"/api/restaurants/restaurants/{self.restaurant.pk}/"
+        self.restaurant.name = "Ramen House"
+        self.assertRevalidates(path, self.restaurant.save)
+        self.assertRevalidates(path, lambda: RestaurantImage.objects.create(
+            restaurant=self.restaurant, image="restaurants/front.jpg"
+        ))
+        self.assertRevalidates(path, lambda: self.create_deal(self.restaurant, "Ramen Monday"))
+        self.other.name = "Burger Palace"
+        self.assertRevalidates(path, self.other.save, changed=False)
+
+    def test_deal_writes(self):
+        path = f"/api/restaurants/deals/{self.deal.pk}/"
+        self.deal.title = "3-for-2 mains"
+        self.assertRevalidates(path, self.deal.save)
+        self.assertRevalidates(path, lambda: DealImage.objects.create(
+            deal=self.deal, image="deals/menu.jpg"
+        ))
+        self.restaurant.name = "Ramen House"
+        self.assertRevalidates(path, self.restaurant.save)
+        self.assertRevalidates(path, lambda: self.create_deal(self.other), changed=False)
+
+
+class ActiveDealsCountTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.restaurant = self.create_restaurant("Noodle Bar")
+        self.deal = self.create_deal(self.restaurant)
+
+    def assertActiveDeals(self, restaurant, count):
+        restaurant.refresh_from_db()
+        self.assertEqual(restaurant.active_deals_count, count)
+
+    def test_deal_create_edit_and_soft_delete(self):
+        self.assertActiveDeals(self.restaurant, 1)
+        self.create_deal(self.restaurant, "Ramen Monday")
+        self.assertActiveDeals(self.restaurant, 2)
+        self.update(self.deal, end_date=timezone.now() - timedelta(hours=1))
+        self.assertActiveDeals(self.restaurant, 1)
+        self.update(self.deal, end_date=timezone.now() + timedelta(days=1))
+        self.assertActiveDeals(self.restaurant, 2)
+        self.update(self.deal, is_active=False)
+        self.assertActiveDeals(self.restaurant, 1)
+
+    def test_moving_a_live_deal_recounts_both_restaurants(self):
+        ramen = self.create_restaurant("Ramen House")
+        self.update(self.deal, restaurant=ramen)
+        self.assertActiveDeals(self.restaurant, 0)
+        self.assertActiveDeals(ramen, 1)
+
+    def test_saving_a_stale_restaurant_keeps_the_count(self):
+        stale = Restaurant.objects.get(pk=self.restaurant.pk)
+        self.create_deal(self.restaurant, "Ramen Monday")
+        self.update(stale, name="Noodle House")
+        self.assertActiveDeals(self.restaurant, 2)
+
+
+class CatalogueCountTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = RestaurantCategory.objects.create(name="Asian", slug="asian")
+        self.restaurant = self.create_restaurant("Noodle Bar")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.categories.add(self.category)
+        self.deal = self.create_deal(self.restaurant)
+
+    def assertCounts(self, active_deals, restaurants, cities=1):
+        self.london.refresh_from_db()
+        self.country.refresh_from_db()
+        self.category.refresh_from_db()
+        self.assertEqual(self.london.active_deals_count, active_deals)
+        self.assertEqual(self.london.restaurants_count, restaurants)
+        self.assertEqual(self.category.restaurants_count, restaurants)
+        self.assertEqual(self.country.cities_count, cities)
+        # The catalogue snapshots embed the same counts
+        cities = self.client.get("/api/restaurants/cities/").json()["results"]
+        city, = [row for row in cities if row["id"] == self.london.pk]
+        self.assertEqual((city["active_deals_count"], city["restaurants_count"]), (active_deals, restaurants))
+        category = self.client.get("/api/restaurants/categories/").json()["results"][0]
+        self.assertEqual(category["restaurants_count"], restaurants)
+
+    def test_deal_writes(self):
+        self.assertCounts(active_deals=1, restaurants=1)
+        self.create_deal(self.restaurant, "Ramen Monday")
+        self.assertCounts(active_deals=2, restaurants=1)
+        self.update(self.deal, end_date=timezone.now() - timedelta(hours=1))
+        self.assertCounts(active_deals=1, restaurants=1)
+        self.update(self.deal, is_active=False, end_date=timezone.now() + timedelta(days=1))
+        self.assertCounts(active_deals=1, restaurants=1)
+
+    def test_restaurant_and_city_soft_delete(self):
+        self.update(self.restaurant, is_active=False)
+        self.assertCounts(active_deals=0, restaurants=0)
+        self.update(self.restaurant, is_active=True)
+        self.assertCounts(active_deals=1, restaurants=1)
+        self.update(self.london, is_active=False)
+        self.country.refresh_from_db()
+        self.assertEqual(self.country.cities_count, 0)
+        self.assertEqual(self.client.get("/api/restaurants/countries/").json()["results"][0]["cities_count"], 0)
+
+    def test_saving_stale_instances_keeps_counts(self):
+        instances = [
+            City.objects.get(pk=self.london.pk), Country.objects.get(pk=self.country.pk),
+            RestaurantCategory.objects.get(pk=self.category.pk)
+        ]
+        self.create_city("Bath")
+        ramen = self.create_restaurant("Ramen House")
+        with self.captureOnCommitCallbacks(execute=True):
+            ramen.categories.add(self.category)
+        self.create_deal(self.restaurant, "Ramen Monday")
+        for instance in instances:
+            self.update(instance)
+        self.assertCounts(active_deals=2, restaurants=2, cities=2)
+
+
+@override_settings(RESTAURANT_SPATIAL_INDEX={"BACKGROUND_REFRESH": False, "REFRESH_INTERVAL": 0})
+class SpatialIndexTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/nearby/"
+    origin = (51.5074, -0.1278)
+
+    def setUp(self):
+        super().setUp()
+        random = np.random.default_rng(7)
+        coordinates = np.column_stack((
+            random.uniform(51.2, 51.8, 300), random.uniform(-0.6, 0.4, 300)
+        )).round(6)
+        # Only coordinates matter here, so skip the per-row save signals
+        self.restaurants = Restaurant.objects.bulk_create([
+            Restaurant(
+                name=f"Restaurant {number}", slug=f"restaurant-{number}", city=self.london,
+                address="1 High Street", verified=True,
+                latitude=Decimal(str(latitude)), longitude=Decimal(str(longitude))
+            )
+            for number, (latitude, longitude) in enumerate(coordinates)
+        ])
+        restaurant_index.build()
+
+    def brute_force(self, radius_km, k=None):
+        """``(distance, id)`` of restaurants within the radius by scalar haversine, nearest first"""
+        rows = sorted(
+            (haversine(*self.origin, float(restaurant.latitude), float(restaurant.longitude)), restaurant.pk)
+            for restaurant in Restaurant.objects.filter(is_active=True, verified=True)
+        )
+        return [row for row in rows if row[0] <= radius_km][:k]
+
+    def assertMatches(self, ids, distances, expected):
+        self.assertEqual(list(ids), [pk for _, pk in expected])
+        np.testing.assert_allclose(distances, [distance for distance, _ in expected], atol=1e-6)
+
+    def test_kd_tree_matches_brute_force(self):
+        points = [(float(row.latitude), float(row.longitude)) for row in self.restaurants]
+        ids = np.array([row.pk for row in self.restaurants], dtype=np.int64)
+        tree = KDTree(ids, to_unit_vectors(*zip(*points)), leaf_size=4)
+        point = to_unit_vectors([self.origin[0]], [self.origin[1]])[0]
+        for radius_km in (0.5, 5, 20, 200):
+            found, chords = tree.query_radius(point, km_to_chord(radius_km))
+            order = np.lexsort((found, chords))
+            self.assertMatches(found[order], chord_to_km(chords[order]), self.brute_force(radius_km))
+        for k in (1, 7, 300):
+            found, distances = tree.query_nearest(point, k)
+            self.assertMatches(found, distances, self.brute_force(np.inf, k))
+
+    def test_radius(self):
+        expected = self.brute_force(10)
+        rows = self.client.get(
+            self.path, {"latitude": self.origin[0], "longitude": self.origin[1], "radius": 10}
+        ).json()
+        self.assertMatches([row["id"] for row in rows], [row["distance"] for row in rows], expected)
+
+    def test_nearest_pages_outward(self):
+        expected = self.brute_force(15)
+        rows = []
+        data = self.client.get(
+            self.path, {"latitude": self.origin[0], "longitude": self.origin[1], "radius": 15, "k": 25}
+        ).json()
+        rows += data["results"]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            rows += data["results"]
+        self.assertMatches([row["id"] for row in rows], [row["distance"] for row in rows], expected)
+
+    def test_rejects_out_of_range_parameters(self):
+        params = {"latitude": self.origin[0], "longitude": self.origin[1]}
+        for bad in ({"radius": -1}, {"radius": 0}, {"radius": "nan"}, {"radius": "inf"},
+                    {"latitude": 91}, {"longitude": -180.5}, {"latitude": "nan"},
+                    {"k": 5, "after_distance": "nan", "after_id": 1}):
+            response = self.client.get(self.path, {**params, **bad})
+            self.assertEqual(response.status_code, 400, bad)
+
+    def test_refresh_applies_moves_and_hides(self):
+        moved, hidden = self.restaurants[:2]
+        moved.latitude, moved.longitude = Decimal("51.507500"), Decimal("-0.127900")
+        moved.save()
+        hidden.verified = False
+        hidden.save()
+        restaurant_index.refresh()
+        ids, distances = restaurant_index.nearest(*self.origin, k=300)
+        self.assertEqual(ids[0], moved.pk)
+        self.assertNotIn(hidden.pk, ids)
+        self.assertMatches(ids, distances, self.brute_force(np.inf, 300))
+
+
+class FacetTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        bath = self.create_city("Bath")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pizza = RestaurantCategory.objects.create(name="Pizza", slug="pizza")
+            self.italian = RestaurantCategory.objects.create(name="Italian", slug="italian")
+            self.sushi = RestaurantCategory.objects.create(name="Sushi", slug="sushi")
+        self.london_pizza = self.create_restaurant("Pizza Roma", price_range=1)
+        self.london_pizza.categories.add(self.pizza, self.italian)
+        self.bath_pizza = self.create_restaurant("Pizza Bath", city=bath)
+        self.bath_pizza.categories.add(self.pizza)
+        self.sushi_bar = self.create_restaurant("Sushi Bar")
+        self.sushi_bar.categories.add(self.sushi)
+        self.create_restaurant("Hidden Pizza", verified=False).categories.add(self.pizza)
+
+        self.create_deal(self.london_pizza, deal_type=Deal.DEAL_TYPE_TWO_FOR_ONE)
+        self.create_deal(self.bath_pizza, deal_type=Deal.DEAL_TYPE_TWO_FOR_ONE)
+        self.create_deal(self.sushi_bar, deal_type=Deal.DEAL_TYPE_FIXED)
+
+    def facets(self, path, params=None):
+        response = self.client.get(path, params or {})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data["count"], {
+            name: [(row["label"], row["count"]) for row in rows] for name, rows in data["facets"].items()
+        }
+
+    def test_restaurant_facets(self):
+        count, facets = self.facets("/api/restaurants/restaurants/facets/")
+        self.assertEqual(count, 3)
+        self.assertEqual(facets["category"], [("Pizza", 2), ("Italian", 1), ("Sushi", 1)])
+        self.assertEqual(facets["price_range"], [("2", 2), ("1", 1)])
+        self.assertEqual(facets["city"], [("London", 2), ("Bath", 1)])
+
+    def test_filtered_category_does_not_narrow_its_own_counts(self):
+        count, facets = self.facets("/api/restaurants/restaurants/facets/", {"category": "pizza"})
+        self.assertEqual(count, 2)
+        self.assertEqual(facets["category"], [("Pizza", 2), ("Italian", 1)])
+        self.assertEqual(facets["city"], [("Bath", 1), ("London", 1)])
+
+    def test_deal_facets(self):
+        count, facets = self.facets("/api/restaurants/deals/facets/")
+        self.assertEqual(count, 3)
+        self.assertEqual(facets["deal_type"], [("2-for-1", 2), ("Fixed Discount", 1)])
+        self.assertEqual(facets["city"], [("London", 2), ("Bath", 1)])
+        count, facets = self.facets("/api/restaurants/deals/facets/", {"city": "bath"})
+        self.assertEqual(count, 1)
+        self.assertEqual(facets["category"], [("Pizza", 1)])
+
+
+class ClusterTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/clusters/"
+
+    def clusters(self, bbox, zoom):
+        response = self.client.get(self.path, {"bbox": ",".join(map(str, bbox)), "zoom": zoom})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_precomputed_grid_keeps_cells_overlapping_the_bbox(self):
+        min_lat, max_lat, min_lon, max_lon = geohash_bounds(encode_geohash(51.5074, -0.1278, 4))
+        self.create_restaurant("Noodle Bar", latitude=min_lat + 0.01, longitude=min_lon + 0.01)
+        self.create_restaurant("Burger Joint", latitude=max_lat - 0.01, longitude=max_lon - 0.01)
+        # Around the first restaurant only: the cell's centroid lies outside
+        bbox = (min_lon, min_lat, min_lon + 0.05, min_lat + 0.05)
+        body = self.clusters(bbox, zoom=8)
+        self.assertEqual(body["precision"], 4)
+        self.assertEqual([cell["count"] for cell in body["clusters"]], [2])
+        far = (max_lon + 0.5, max_lat + 0.5, max_lon + 0.6, max_lat + 0.6)
+        self.assertEqual(self.clusters(far, zoom=8)["clusters"], [])
+
+    def test_writes_purge_the_precomputed_grid(self):
+        bbox = (-10, 45, 10, 60)
+        restaurant = self.create_restaurant("Noodle Bar", latitude=51.5074, longitude=-0.1278)
+        self.assertEqual(self.clusters(bbox, zoom=3)["clusters"][0]["count"], 1)
+        self.create_restaurant("Burger Joint", latitude=51.51, longitude=-0.13)
+        cell, = self.clusters(bbox, zoom=3)["clusters"]
+        self.assertEqual((cell["count"], cell["active_deals_count"]), (2, 0))
+        self.create_deal(restaurant)
+        self.assertEqual(self.clusters(bbox, zoom=3)["clusters"][0]["active_deals_count"], 1)
+        self.update(restaurant, latitude=Decimal("48.8566"), longitude=Decimal("2.3522"))
+        self.assertEqual(len(self.clusters(bbox, zoom=3)["clusters"]), 2)
+
+
+class ActiveDealsCacheTests(RestaurantsTestCase):
+    path = "/api/restaurants/deals/active/"
+
+    def setUp(self):
+        super().setUp()
+        self.restaurant = self.create_restaurant("Noodle Bar")
+        self.deal = self.create_deal(self.restaurant)
+
+    def get(self, cache_status):
+        response = self.client.get(self.path)
+        self.assertEqual(response["X-Cache"], cache_status)
+        return response.json()
+
+    def test_hit_does_no_database_work(self):
+        self.get("MISS")
+        with self.assertNumQueries(0):
+            self.assertEqual([deal["id"] for deal in self.get("HIT")["results"]], [self.deal.pk])
+
+    def test_expires_at_the_next_transition(self):
+        self.create_deal(self.restaurant, "Ramen Monday", start_date=timezone.now() + timedelta(minutes=10))
+        self.get("MISS")
+        digest = hashlib.md5(b"").hexdigest()
+        _, _, _, expires_at, _ = cache.get(f"{ACTIVE_DEALS_CACHE}:testserver:{digest}")
+        self.assertAlmostEqual(expires_at - time.time(), 600, delta=5)
+
+    def test_deal_writes_purge_the_page(self):
+        other = self.create_restaurant("Burger Joint", city=self.create_city("Bath"))
+        hidden = self.create_deal(other, is_active=False)
+        self.get("MISS")
+        self.update(hidden, title="Burger Tuesday")
+        self.get("HIT")
+        self.update(self.deal, title="3-for-2 mains")
+        self.assertEqual(self.get("MISS")["results"][0]["title"], "3-for-2 mains")
+        self.update(hidden, is_active=True)
+        self.assertEqual(self.get("MISS")["count"], 2)
+
+
+class FullTextSearchTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/"
+
+    def names(self, params, path=None, field="name"):
+        return [row[field] for row in self.results(path or self.path, params)]
+
+    def test_every_term_is_prefix_matched(self):
+        self.create_restaurant("Noodle Bar")
+        self.create_restaurant("Noodle House")
+        self.create_restaurant("Burger Bar")
+        self.assertEqual(self.names({"search": "nood bar"}), ["Noodle Bar"])
+        self.assertEqual(sorted(self.names({"search": "NOODLE"})), ["Noodle Bar", "Noodle House"])
+        self.assertEqual(self.names({"search": "noodles"}), [])
+
+    def test_name_matches_rank_first_unless_ordering_is_given(self):
+        self.create_restaurant("Corner Cafe", description="Also serves pizza by the slice")
+        self.create_restaurant("Pizza Palace")
+        self.assertEqual(self.names({"search": "pizza"}), ["Pizza Palace", "Corner Cafe"])
+        self.assertEqual(self.names({"search": "pizza", "ordering": "name"}), ["Corner Cafe", "Pizza Palace"])
+
+    def test_deals_match_their_restaurant_and_city(self):
+        deal = self.create_deal(self.create_restaurant("Noodle Bar"), "Ramen Monday")
+        self.create_deal(self.create_restaurant("Burger Joint", city=self.create_city("Bath")))
+        path = "/api/restaurants/deals/"
+        self.assertEqual(self.names({"search": "noodle ramen"}, path, "title"), ["Ramen Monday"])
+        self.assertEqual(self.names({"search": "lond"}, path, "title"), ["Ramen Monday"])
+        self.update(self.london, name="Greater London")
+        self.assertEqual(self.names({"search": "greater"}, path, "title"), ["Ramen Monday"])
+        self.update(deal, title="Udon Tuesday")
+        self.assertEqual(self.names({"search": "udon"}, path, "title"), ["Udon Tuesday"])
+
+
+class AlongRouteTests(RestaurantsTestCase):
+    path = "/api/restaurants/deals/along-route/"
+    # Diagonal across London, so its bounding box holds points far from it
+    route = [(51.50, -0.20), (51.60, 0.00)]
+
+    def encode(self, points):
+        """Google encoded polyline of ``points``"""
+        chars = []
+        previous = (0, 0)
+        for point in points:
+            values = tuple(round(coordinate * 1e5) for coordinate in point)
+            for value, last in zip(values, previous):
+                delta = value - last
+                delta = ~(delta << 1) if delta < 0 else delta << 1
+                while delta >= 0x20:
+                    chars.append(chr((0x20 | (delta & 0x1F)) + 63))
+                    delta >>= 5
+                chars.append(chr(delta + 63))
+            previous = values
+        return "".join(chars)
+
+    def titles(self, width):
+        params = {"polyline": self.encode(self.route), "width": width}
+        return sorted(row["title"] for row in self.results(self.path, params))
+
+    def add(self, title, latitude, longitude, **fields):
+        restaurant = self.create_restaurant(title, latitude=latitude, longitude=longitude, **fields)
+        self.create_deal(restaurant, title)
+
+    def test_corridor_membership(self):
+        self.add("On the route", 51.55, -0.10)
+        self.add("Past the start", 51.50, -0.207)
+        self.add("Far past the start", 51.50, -0.25)
+        self.add("Inside the box only", 51.59, -0.19)
+        self.add("Unverified", 51.55, -0.10, verified=False)
+        self.assertEqual(self.titles(1), ["On the route", "Past the start"])
+        self.assertEqual(self.titles(5), ["Far past the start", "On the route", "Past the start"])
+
+    def test_rejects_bad_parameters(self):
+        polyline = self.encode(self.route)
+        for params in ({}, {"polyline": "_p~"}, {"polyline": polyline, "width": 0},
+                       {"polyline": polyline, "width": 51}):
+            self.assertEqual(self.client.get(self.path, params).status_code, 400)
+
+
+class DistanceOrderingTests(RestaurantsTestCase):
+    path = "/api/restaurants/restaurants/"
+    origin = {"latitude": 51.5074, "longitude": -0.1278}
+
+    def setUp(self):
+        super().setUp()
+        self.pizza = RestaurantCategory.objects.create(name="Pizza", slug="pizza")
+        # Due north of the origin, created furthest first so creation order is not distance order
+        for km, price_range, category, deal in [
+            (15, 2, True, True), (8, 1, True, True), (4, 2, False, True),
+            (2, 2, True, False), (0.5, 2, True, True),
+        ]:
+            restaurant = self.create_restaurant(
+                f"{km} km", latitude=round(51.5074 + km / 111.2, 6), longitude=-0.1278,
+                price_range=price_range
+            )
+            if category:
+                with self.captureOnCommitCallbacks(execute=True):
+                    restaurant.categories.add(self.pizza)
+            if deal:
+                self.create_deal(restaurant)
+
+    def nearest(self, **params):
+        rows = self.results(self.path, {**self.origin, "radius": 10, "ordering": "distance", **params})
+        return [(row["name"], round(row["distance"])) for row in rows]
+
+    def test_orders_by_distance_within_the_radius(self):
+        self.assertEqual(self.nearest(), [("0.5 km", 0), ("2 km", 2), ("4 km", 4), ("8 km", 8)])
+        self.assertEqual([name for name, _ in self.nearest(ordering="-distance")][0], "8 km")
+
+    def test_composes_with_filters(self):
+        self.assertEqual(self.nearest(category="pizza"), [("0.5 km", 0), ("2 km", 2), ("8 km", 8)])
+        self.assertEqual(self.nearest(category="pizza", has_deals="true"), [("0.5 km", 0), ("8 km", 8)])
+        self.assertEqual(self.nearest(has_deals="true", price_range=2), [("0.5 km", 0), ("4 km", 4)])
+
+    def test_distance_ordering_needs_a_location(self):
+        # Dropped without one, leaving the default ordering (newest first)
+        rows = self.results(self.path, {"ordering": "distance"})
+        self.assertEqual([row["name"] for row in rows], ["0.5 km", "2 km", "4 km", "8 km", "15 km"])
+        self.assertNotIn("distance", rows[0])
+
+
+class UserContextQueryTests(RestaurantsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            email="owner@example.com", username="owner", password="pw"
+        )
+        UserProfile.objects.create(user=self.user, role=UserProfile.ROLE_MERCHANT)
+        self.merchant = Merchant.objects.create(user=self.user, name="Noodle Group", verified=True)
+        self.client.force_authenticate(self.user)
+
+    def add(self, count):
+        """``count`` more restaurants with a deal each, saved and used by the user"""
+        for _ in range(count):
+            restaurant = self.create_restaurant("Noodle Bar", merchant=self.merchant)
+            deal = self.create_deal(restaurant)
+            with self.captureOnCommitCallbacks(execute=True):
+                SavedRestaurant.objects.create(user=self.user, restaurant=restaurant)
+                SavedDeal.objects.create(user=self.user, deal=deal)
+                DealUse.objects.create(user=self.user, deal=deal)
+
+    def queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, path):
+        self.add(1)
+        # Hydrates the saved sets, which later saves write through to
+        self.queries(path)
+        one = self.queries(path)
+        self.add(4)
+        self.assertEqual(self.queries(path), one)
+
+    def test_saved_restaurants(self):
+        self.assertConstantQueries("/api/restaurants/restaurants/saved/")
+
+    def test_saved_deals(self):
+        self.assertConstantQueries("/api/restaurants/deals/saved/")
+
+    def test_merchant_deals(self):
+        self.assertConstantQueries("/api/restaurants/merchant/deals/")
+
+
+class GeohashCoverTests(RestaurantsTestCase):
+    cases = [
+        (51.5074, -0.1278, 2),
+        (51.5074, -0.1278, 0.2),
+        (0.0, 0.0, 10),  # Corner of the four top-level cells
+        (-17.7, 179.99, 25),  # Across the antimeridian
+        (78.2, 15.6, 200),
+        (89.9, 0.0, 30),  # Over the pole
+    ]
+
+    def scatter(self, latitude, longitude, radius_km, count=400):
+        """``count`` restaurants spread over a box half as wide again as the radius"""
+        random = np.random.default_rng(11)
+        lat_delta = 1.5 * radius_km / 111.0
+        lon_delta = min(180.0, lat_delta / max(math.cos(math.radians(latitude)), 0.01))
+        latitudes = np.clip(random.uniform(latitude - lat_delta, latitude + lat_delta, count), -90, 90)
+        longitudes = (random.uniform(longitude - lon_delta, longitude + lon_delta, count) + 180) % 360 - 180
+        Restaurant.objects.all().delete()
+        # geohash is set on save, which bulk_create skips
+        Restaurant.objects.bulk_create([
+            Restaurant(
+                name=f"Restaurant {number}", slug=f"restaurant-{number}", city=self.london,
+                address="1 High Street", verified=True,
+                latitude=Decimal(f"{lat:.6f}"), longitude=Decimal(f"{lon:.6f}"),
+                geohash=encode_geohash(round(lat, 6), round(lon, 6))
+            )
+            for number, (lat, lon) in enumerate(zip(latitudes, longitudes))
+        ])
+
+    def test_radius_filter_keeps_every_restaurant_in_the_radius(self):
+        for latitude, longitude, radius_km in self.cases:
+            with self.subTest(latitude=latitude, longitude=longitude, radius_km=radius_km):
+                self.scatter(latitude, longitude, radius_km)
+                inside = {
+                    pk for pk, lat, lon in Restaurant.objects.values_list("pk", "latitude", "longitude")
+                    if haversine(latitude, longitude, float(lat), float(lon)) <= radius_km
+                }
+                self.assertTrue(inside)
+                found = set(Restaurant.objects.filter(
+                    radius_filter(latitude, longitude, radius_km)
+                ).values_list("pk", flat=True))
+                self.assertEqual(inside - found, set())
+                self.assertLess(len(found), Restaurant.objects.count())
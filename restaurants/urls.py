@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
-    CountryListView, CityListView, RestaurantCategoryListView,
+    AutocompleteView, CountryListView, CityListView, RestaurantCategoryListView,
     RestaurantViewSet, DealViewSet, DealUseViewSet,
     MerchantRestaurantViewSet, MerchantDealViewSet
 )
@@ -18,6 +18,7 @@ urlpatterns = [
     path("countries/", CountryListView.as_view(), name="country-list"),
     path("cities/", CityListView.as_view(), name="city-list"),
     path("categories/", RestaurantCategoryListView.as_view(), name="restaurant-category-list"),
+    path("autocomplete/", AutocompleteView.as_view(), name="autocomplete"),
     path("", include(router.urls)),
 ]
 
@@ -0,0 +1,44 @@
+"""Per-request lookups of the requesting user's saved items and deal uses"""
+from django.db.models import Count
+from django.utils.functional import cached_property
+
+from .models import DealUse
+from .saved import saved_ids
+
+
+class UserContext:
+    """
+    Loads the user's saved restaurant ids and saved deal ids (from their
+    Redis saved sets) and per-deal use counts (one query), the first time
+    each is needed, so serializers rendering many objects do not query per
+    object.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def for_request(cls, request):
+        """The request's UserContext, or None for anonymous requests"""
+        if request is None or not request.user.is_authenticated:
+            return None
+        context = getattr(request, "_user_context", None)
+        if context is None or context.user != request.user:
+            context = request._user_context = cls(request.user)
+        return context
+
+    @cached_property
+    def saved_restaurant_ids(self):
+        return set(saved_ids("restaurants", self.user.pk))
+
+    @cached_property
+    def saved_deal_ids(self):
+        return set(saved_ids("deals", self.user.pk))
+
+    @cached_property
+    def deal_use_counts(self):
+        return dict(
+            DealUse.objects.filter(user=self.user).values("deal").annotate(
+                count=Count("id")
+            ).values_list("deal", "count")
+        )
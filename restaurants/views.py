@@ -1,42 +1,54 @@
+import hashlib
 import math
-from django.db.models import Q, Count, F
+from urllib.parse import urlencode
+
 from django.utils import timezone
-from django.core.cache import cache
 from rest_framework import generics, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .filters import RestaurantFilter, DealFilter
+from .autocomplete import MAX_SUGGESTIONS, autocomplete_index
+from .clusters import clusters_for_bbox
+from .facets import DEAL_FACETS, RESTAURANT_FACETS, facet_counts
+from .filters import RestaurantFilter, DealFilter, DistanceOrderingFilter, RankedOrderingFilter
+from .distance import coordinate_arrays, nearest_within, route_distances
+from .geo import corridor_filter, decode_polyline, distance_expression, radius_filter
+from .saved import saved_ids
+from .scheduler import next_transition
+from .fuzzy import FuzzySearchFilter
+from .search import FullTextSearchFilter
+from .snapshots import CATEGORIES_SNAPSHOT, CITIES_SNAPSHOT, COUNTRIES_SNAPSHOT
+from .signals import (
+    ACTIVE_DEALS_CACHE, CATALOGUE_CACHE, CATEGORIES_TAG, CITIES_TAG, COUNTRIES_TAG, DEALS_TAG
+)
+from .spatial_index import index_settings, restaurant_index
 from .models import (
     Country, City, RestaurantCategory, Restaurant, Deal,
     SavedRestaurant, SavedDeal, DealUse
 )
 from .serializers import (
     CountrySerializer, CitySerializer, RestaurantCategorySerializer,
-    RestaurantSerializer, RestaurantListSerializer, DealSerializer,
+    RestaurantSerializer, RestaurantListSerializer, NearbyRestaurantSerializer, DealSerializer,
     DealListSerializer, SavedRestaurantSerializer, SavedDealSerializer,
     DealUseSerializer, DealUseCreateSerializer
 )
-from users.permissions import IsMerchant
-
+from core.cache import (
+    CachedListMixin, ConditionalRetrieveMixin, cached_json_response, timeout_until
+)
+from core.pagination import KeysetPagination
+from core.snapshots import SnapshotListMixin
+from users.permissions import IsAdmin, IsMerchant
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points using Haversine formula (in km)"""
-    if not all([lat1, lon1, lat2, lon2]):
-        return None
-    R = 6371  # Earth's radius in kilometers
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat / 2) ** 2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dlon / 2) ** 2)
-    c = 2 * math.asin(math.sqrt(a))
-    return R * c
+MAX_NEARBY_PAGE_SIZE = 100
+MAX_ROUTE_WIDTH_KM = 50
 
 
-class CountryListView(generics.ListAPIView):
+class CountryListView(SnapshotListMixin, CachedListMixin, generics.ListAPIView):
     """List all countries"""
     queryset = Country.objects.all()
     serializer_class = CountrySerializer
@@ -45,9 +57,20 @@ class CountryListView(generics.ListAPIView):
     search_fields = ["name", "code"]
     ordering_fields = ["name"]
     ordering = ["name"]
+    cache_name = CATALOGUE_CACHE
+    cache_tags = [COUNTRIES_TAG]
+    cache_query_params = [
+        api_settings.SEARCH_PARAM,
+        api_settings.ORDERING_PARAM,
+        api_settings.DEFAULT_PAGINATION_CLASS.page_query_param,
+    ]
+    snapshot_name = COUNTRIES_SNAPSHOT
+    
+    def get_cache_tags(self, countries):
+        return [f"country:{country.pk}" for country in countries]
 
 
-class CityListView(generics.ListAPIView):
+class CityListView(SnapshotListMixin, CachedListMixin, generics.ListAPIView):
     """List all cities, optionally filtered by country"""
     serializer_class = CitySerializer
     permission_classes = [AllowAny]
@@ -56,18 +79,26 @@ class CityListView(generics.ListAPIView):
     search_fields = ["name", "country__name"]
     ordering_fields = ["name", "created_at"]
     ordering = ["name"]
+    cache_name = CATALOGUE_CACHE
+    cache_tags = [CITIES_TAG]
+    cache_query_params = [
+        "country",
+        "is_active",
+        api_settings.SEARCH_PARAM,
+        api_settings.ORDERING_PARAM,
+        api_settings.DEFAULT_PAGINATION_CLASS.page_query_param,
+    ]
+    snapshot_name = CITIES_SNAPSHOT
     
     def get_queryset(self):
-        return City.objects.filter(is_active=True).select_related("country").annotate(
-            restaurants_count=Count(
-                "restaurants",
-                filter=Q(restaurants__is_active=True, restaurants__verified=True),
-                distinct=True
-            )
-        )
+        return City.objects.filter(is_active=True).select_related("country")
+    
+    def get_cache_tags(self, cities):
+        tags = [f"city:{city.pk}" for city in cities]
+        return tags + [f"country:{city.country_id}" for city in cities]
 
 
-class RestaurantCategoryListView(generics.ListAPIView):
+class RestaurantCategoryListView(SnapshotListMixin, CachedListMixin, generics.ListAPIView):
     """List all restaurant categories"""
     queryset = RestaurantCategory.objects.all()
     serializer_class = RestaurantCategorySerializer
@@ -76,19 +107,85 @@ class RestaurantCategoryListView(generics.ListAPIView):
     search_fields = ["name"]
     ordering_fields = ["name"]
     ordering = ["name"]
+    cache_name = CATALOGUE_CACHE
+    cache_tags = [CATEGORIES_TAG]
+    cache_query_params = [
+        api_settings.SEARCH_PARAM,
+        api_settings.ORDERING_PARAM,
+        api_settings.DEFAULT_PAGINATION_CLASS.page_query_param,
+    ]
+    snapshot_name = CATEGORIES_SNAPSHOT
+    
+    def get_cache_tags(self, categories):
+        return [f"category:{category.pk}" for category in categories]
 
 
-class RestaurantViewSet(viewsets.ReadOnlyModelViewSet):
+class AutocompleteView(APIView):
+    """
+    Search-box suggestions: restaurants, live deals, cities and categories
+    with a word starting with ``q``, most popular first, answered from this
+    worker's in-memory prefix index
+    """
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get("limit", 10))
+            if not 1 <= limit <= MAX_SUGGESTIONS:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": f"limit must be between 1 and {MAX_SUGGESTIONS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        suggestions = autocomplete_index.suggest(request.query_params.get("q", ""), limit)
+        return Response({
+            "results": [
+                {"type": kind, "id": pk, "label": label} for kind, pk, label in suggestions
+            ]
+        })
+
+
+class RestaurantViewSet(ConditionalRetrieveMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for restaurants"""
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [
+        DjangoFilterBackend, FullTextSearchFilter, FuzzySearchFilter, DistanceOrderingFilter
+    ]
     filterset_class = RestaurantFilter
     search_fields = ["name", "description", "address", "city__name"]
-    ordering_fields = ["name", "created_at", "is_featured"]
+    ordering_fields = ["name", "created_at", "is_featured", "active_deals_count", "distance"]
     ordering = ["-is_featured", "-created_at"]
     
+    def get_etag_tags(self):
+        """Surrogate keys of everything the detail serializer renders"""
+        rows = Restaurant.objects.filter(pk=self.kwargs.get("pk")).values_list(
+            "city_id", "city__country_id", "categories__id"
+        )
+        tags = {f"restaurant:{self.kwargs.get('pk')}"}
+        for city_id, country_id, category_id in rows:
+            tags |= {f"city:{city_id}", f"country:{country_id}"}
+            if category_id is not None:
+                tags.add(f"category:{category_id}")
+        return tags if len(tags) > 1 else None
+    
+    def get_geo_params(self):
+        """Parsed (latitude, longitude, radius) from the query, or None"""
+        lat = self.request.query_params.get("latitude")
+        lon = self.request.query_params.get("longitude")
+        radius = self.request.query_params.get("radius", 10)  # default 10km
+        if not (lat and lon):
+            return None
+        try:
+            return float(lat), float(lon), float(radius)
+        except (ValueError, TypeError):
+            return None  # Invalid coordinates, ignore filter
+    
     def get_serializer_class(self):
         if self.action == "list":
+            if self.get_geo_params():
+                return NearbyRestaurantSerializer
             return RestaurantListSerializer
         return RestaurantSerializer
     
@@ -98,16 +195,6 @@ class RestaurantViewSet(viewsets.ReadOnlyModelViewSet):
             verified=True
         ).select_related("city", "city__country").prefetch_related(
             "categories", "images"
-        ).annotate(
-            active_deals_count=Count(
-                "deals",
-                filter=Q(
-                    deals__is_active=True,
-                    deals__start_date__lte=timezone.now(),
-                    deals__end_date__gte=timezone.now()
-                ),
-                distinct=True
-            )
         )
         
         # Filter by category slug if provided
@@ -115,32 +202,14 @@ class RestaurantViewSet(viewsets.ReadOnlyModelViewSet):
         if category_slug:
             queryset = queryset.filter(categories__slug=category_slug)
         
-        # Nearby restaurants (requires lat/long)
-        lat = self.request.query_params.get("latitude")
-        lon = self.request.query_params.get("longitude")
-        radius = self.request.query_params.get("radius", 10)  # default 10km
-        
-        if lat and lon:
-            try:
-                lat = float(lat)
-                lon = float(lon)
-                radius = float(radius)
-                
-                # Filter restaurants within approximate radius
-                # Simple bounding box filter (not perfect but fast)
-                lat_delta = radius / 111.0  # roughly 1 degree = 111km
-                lon_delta = radius / (111.0 * abs(math.cos(math.radians(lat))))
-                
-                queryset = queryset.filter(
-                    latitude__gte=lat - lat_delta,
-                    latitude__lte=lat + lat_delta,
-                    longitude__gte=lon - lon_delta,
-                    longitude__lte=lon + lon_delta,
-                    latitude__isnull=False,
-                    longitude__isnull=False
-                )
-            except (ValueError, TypeError):
-                pass  # Invalid coordinates, ignore filter
+        # Nearby restaurants (requires lat/long): the geohash cells narrow the
+        # scan, the distance annotation gives the exact radius and ?ordering=distance
+        geo = self.get_geo_params()
+        if geo:
+            lat, lon, radius = geo
+            queryset = queryset.filter(radius_filter(lat, lon, radius)).annotate(
+                distance=distance_expression(lat, lon)
+            ).filter(distance__lte=radius)
         
         return queryset
     
@@ -163,22 +232,44 @@ class RestaurantViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def saved(self, request):
         """Get user's saved restaurants"""
-        saved_restaurants = SavedRestaurant.objects.filter(
-            user=request.user
-        ).select_related("restaurant", "restaurant__city").prefetch_related(
-            "restaurant__images"
-        ).order_by("-created_at")
-        
-        restaurants = [sr.restaurant for sr in saved_restaurants]
+        ids = saved_ids("restaurants", request.user.pk)
+        restaurants = Restaurant.objects.filter(id__in=ids).select_related(
+            "city", "city__country"
+        ).prefetch_related("images").in_bulk()
+        restaurants = [restaurants[pk] for pk in ids if pk in restaurants]
         serializer = RestaurantListSerializer(restaurants, many=True, context={"request": request})
         return Response(serializer.data)
     
+    def _nearest_ids(self, lat, lon, radius, k=None, after=None):
+        """Ids and distances of restaurants within radius, nearest first"""
+        if index_settings()["ENABLED"]:
+            if k is None:
+                return restaurant_index.radius(lat, lon, radius)
+            return restaurant_index.nearest(lat, lon, k, radius_km=radius, after=after)
+        # Only the geohash cells covering the radius are scanned, and only
+        # coordinates are loaded; distances and ordering are one NumPy pass
+        candidates = Restaurant.objects.filter(
+            radius_filter(lat, lon, radius),
+            is_active=True,
+            verified=True
+        )
+        return nearest_within(lat, lon, candidates, radius, k=k, after=after)
+    
     @action(detail=False, methods=["get"], permission_classes=[AllowAny])
     def nearby(self, request):
-        """Get nearby restaurants based on coordinates"""
+        """
+        Get nearby restaurants based on coordinates, nearest first.
+        
+        With ``k`` the response is a page of the k nearest restaurants and a
+        ``next`` link carrying an ``after_distance``/``after_id`` cursor, so
+        clients can page outward ring by ring at a constant cost per page.
+        """
         lat = request.query_params.get("latitude")
         lon = request.query_params.get("longitude")
-        radius = float(request.query_params.get("radius", 10))
+        radius = request.query_params.get("radius", 10)
+        k = request.query_params.get("k")
+        after_distance = request.query_params.get("after_distance")
+        after_id = request.query_params.get("after_id")
         
         if not lat or not lon:
             return Response(
@@ -189,51 +280,107 @@ class RestaurantViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             lat = float(lat)
             lon = float(lon)
+            radius = float(radius)
+            # Comparisons with NaN are false, so NaN is rejected too
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180 and 0 < radius < math.inf):
+                raise ValueError
         except (ValueError, TypeError):
             return Response(
-                {"error": "Invalid latitude or longitude"},
+                {"error": "latitude (-90 to 90), longitude (-180 to 180) and a positive, "
+                          "finite radius are required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Get all restaurants within bounding box
-        lat_delta = radius / 111.0
-        lon_delta = radius / (111.0 * abs(math.cos(math.radians(lat))))
+        after = None
+        if k is not None:
+            try:
+                k = int(k)
+                if not 1 <= k <= MAX_NEARBY_PAGE_SIZE:
+                    raise ValueError
+                if after_distance is not None or after_id is not None:
+                    after = (float(after_distance), int(after_id))
+                    if not math.isfinite(after[0]):
+                        raise ValueError
+            except (ValueError, TypeError):
+                return Response(
+                    {"error": f"k must be between 1 and {MAX_NEARBY_PAGE_SIZE}, "
+                              "and after_distance and after_id must be given together"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        ids, distances = self._nearest_ids(lat, lon, radius, k=k, after=after)
         
-        restaurants = Restaurant.objects.filter(
+        # The index may lag writes by a refresh interval, so the fetch still
+        # applies the visibility filters
+        ordered_ids = ids.tolist()
+        restaurants_by_id = Restaurant.objects.filter(
             is_active=True,
-            verified=True,
-            latitude__gte=lat - lat_delta,
-            latitude__lte=lat + lat_delta,
-            longitude__gte=lon - lon_delta,
-            longitude__lte=lon + lon_delta,
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).select_related("city", "city__country").prefetch_related("images")
+            verified=True
+        ).select_related("city", "city__country").prefetch_related("images").in_bulk(ordered_ids)
+        restaurants = []
+        for pk, distance in zip(ordered_ids, distances.tolist()):
+            if pk in restaurants_by_id:
+                restaurant = restaurants_by_id[pk]
+                restaurant.distance = distance
+                restaurants.append(restaurant)
         
-        # Calculate actual distances and sort
-        restaurants_with_distance = []
-        for restaurant in restaurants:
-            if restaurant.latitude and restaurant.longitude:
-                distance = calculate_distance(
-                    lat, lon,
-                    float(restaurant.latitude),
-                    float(restaurant.longitude)
-                )
-                if distance and distance <= radius:
-                    restaurants_with_distance.append((restaurant, distance))
+        serializer = NearbyRestaurantSerializer(restaurants, many=True, context={"request": request})
+        if k is None:
+            return Response(serializer.data)
         
-        # Sort by distance
-        restaurants_with_distance.sort(key=lambda x: x[1])
-        restaurants = [r[0] for r in restaurants_with_distance]
+        next_url = None
+        if len(ordered_ids) == k:
+            next_url = replace_query_param(
+                replace_query_param(
+                    request.build_absolute_uri(), "after_distance", repr(distances[-1].item())
+                ),
+                "after_id", ordered_ids[-1]
+            )
+        return Response({"next": next_url, "results": serializer.data})
+    
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def clusters(self, request):
+        """
+        Map marker clusters for a bbox (``min_lon,min_lat,max_lon,max_lat``)
+        and zoom level, aggregated on a geohash grid
+        """
+        try:
+            bbox = [float(value) for value in request.query_params.get("bbox", "").split(",")]
+            zoom = int(request.query_params.get("zoom", ""))
+            min_lon, min_lat, max_lon, max_lat = bbox
+            if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180
+                    and -180 <= max_lon <= 180 and 0 <= zoom <= 22):
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": "bbox (min_lon,min_lat,max_lon,max_lat) and zoom (0-22) are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        serializer = RestaurantListSerializer(restaurants, many=True, context={"request": request})
-        return Response(serializer.data)
+        precision, clusters = clusters_for_bbox(tuple(bbox), zoom)
+        return Response({"zoom": zoom, "precision": precision, "clusters": clusters})
+    
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def facets(self, request):
+        """
+        Counts per category, price range and city of the restaurants matching
+        the list's filters and search, computed in one query
+        """
+        return Response(facet_counts(self.filter_queryset(self.get_queryset()), RESTAURANT_FACETS))
+    
+    @action(detail=False, methods=["get"], permission_classes=[IsAdmin], url_path="nearby/index")
+    def nearby_index(self, request):
+        """Stats of this worker's in-memory spatial index"""
+        return Response(restaurant_index.stats())
 
 
-class DealViewSet(viewsets.ReadOnlyModelViewSet):
+class DealViewSet(ConditionalRetrieveMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for deals"""
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [
+        DjangoFilterBackend, FullTextSearchFilter, FuzzySearchFilter, RankedOrderingFilter
+    ]
     filterset_class = DealFilter
     search_fields = ["title", "description", "restaurant__name"]
     ordering_fields = ["start_date", "end_date", "created_at", "is_featured"]
@@ -244,17 +391,28 @@ class DealViewSet(viewsets.ReadOnlyModelViewSet):
             return DealListSerializer
         return DealSerializer
     
+    def get_etag_tags(self):
+        """Surrogate keys of everything the detail serializer renders"""
+        row = Deal.objects.filter(pk=self.kwargs.get("pk")).values_list(
+            "restaurant_id", "restaurant__city_id", "restaurant__city__country_id"
+        ).first()
+        if row is None:
+            return None
+        restaurant_id, city_id, country_id = row
+        return {
+            f"deal:{self.kwargs.get('pk')}",
+            f"restaurant:{restaurant_id}",
+            f"city:{city_id}",
+            f"country:{country_id}",
+        }
+    
     def get_queryset(self):
-        now = timezone.now()
         queryset = Deal.objects.filter(
-            is_active=True,
+            is_live=True,
             restaurant__is_active=True,
             restaurant__verified=True
         ).select_related("restaurant", "restaurant__city", "restaurant__city__country").prefetch_related(
             "images"
-        ).filter(
-            start_date__lte=now,
-            end_date__gte=now
         )
         
         # Filter by city
@@ -288,36 +446,96 @@ class DealViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def saved(self, request):
         """Get user's saved deals"""
-        saved_deals = SavedDeal.objects.filter(
-            user=request.user
-        ).select_related("deal", "deal__restaurant").prefetch_related(
-            "deal__images"
-        ).order_by("-created_at")
-        
-        deals = [sd.deal for sd in saved_deals]
+        ids = saved_ids("deals", request.user.pk)
+        deals = Deal.objects.filter(id__in=ids).select_related(
+            "restaurant", "restaurant__city"
+        ).prefetch_related("images").in_bulk()
+        deals = [deals[pk] for pk in ids if pk in deals]
         serializer = DealListSerializer(deals, many=True, context={"request": request})
         return Response(serializer.data)
     
     @action(detail=False, methods=["get"], permission_classes=[AllowAny])
     def active(self, request):
-        """Get all active deals (cached)"""
-        now = timezone.now()
-        cache_key = f"active_deals_{now.date()}"
-        deals = cache.get(cache_key)
+        """
+        Get all active deals (cached).
+        
+        Each page is cached as rendered JSON until the next deal start/end,
+        tagged with the deals, restaurants and cities it shows, so a hit does
+        no ORM or serializer work and writes purge only the pages they touch.
+        """
+        paginator = self.paginator
+        params = urlencode(sorted(
+            (name, request.query_params[name])
+            for name in (paginator.page_query_param, paginator.cursor_query_param,
+                         paginator.count_query_param, paginator.mode_query_param)
+            if name in request.query_params
+        ))
+        digest = hashlib.md5(params.encode()).hexdigest()
+        cache_key = f"{ACTIVE_DEALS_CACHE}:{request.get_host()}:{digest}"
         
-        if deals is None:
+        def build():
+            now = timezone.now()
             deals = Deal.objects.filter(
-                is_active=True,
+                is_live=True,
                 restaurant__is_active=True,
-                restaurant__verified=True,
-                start_date__lte=now,
-                end_date__gte=now
+                restaurant__verified=True
             ).select_related(
                 "restaurant", "restaurant__city"
-            ).prefetch_related("images").order_by("-is_featured", "-created_at")
-            cache.set(cache_key, list(deals), 300)  # Cache for 5 minutes
+            ).prefetch_related("images").order_by("-is_featured", "-created_at", "-id")
+            page_deals = self.paginate_queryset(deals)
+            serializer = DealListSerializer(page_deals, many=True, context={"request": request})
+            data = self.get_paginated_response(serializer.data).data
+            tags = [DEALS_TAG]
+            for deal in page_deals:
+                tags += [
+                    f"deal:{deal.pk}",
+                    f"restaurant:{deal.restaurant_id}",
+                    f"city:{deal.restaurant.city_id}",
+                ]
+            return data, timeout_until(next_transition(now), now), tags
         
-        serializer = DealListSerializer(deals, many=True, context={"request": request})
+        return cached_json_response(ACTIVE_DEALS_CACHE, cache_key, build, request)
+    
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def facets(self, request):
+        """
+        Counts per deal type, category, price range and city of the deals
+        matching the list's filters and search, computed in one query
+        """
+        return Response(facet_counts(self.filter_queryset(self.get_queryset()), DEAL_FACETS))
+    
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny], url_path="along-route")
+    def along_route(self, request):
+        """
+        Active deals at restaurants within ``width`` km of a route given as an
+        encoded polyline. Candidates come from per-segment bounding boxes and
+        are then checked with a vectorized point-to-segment distance.
+        """
+        try:
+            route = decode_polyline(request.query_params.get("polyline", ""))
+            width = float(request.query_params.get("width", 1))
+            if not route or not 0 < width <= MAX_ROUTE_WIDTH_KM:
+                raise ValueError
+        except ValueError:
+            return Response(
+                {"error": f"A valid encoded polyline and a width between 0 and {MAX_ROUTE_WIDTH_KM} km are required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        candidates = Restaurant.objects.filter(
+            corridor_filter(route, width),
+            is_active=True,
+            verified=True
+        )
+        ids, latitudes, longitudes = coordinate_arrays(candidates)
+        restaurant_ids = ids[route_distances(latitudes, longitudes, route) <= width].tolist()
+        
+        queryset = self.filter_queryset(self.get_queryset()).filter(restaurant_id__in=restaurant_ids)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = DealListSerializer(page, many=True, context={"request": request})
+            return self.get_paginated_response(serializer.data)
+        serializer = DealListSerializer(queryset, many=True, context={"request": request})
         return Response(serializer.data)
     
     @action(detail=True, methods=["post"], permission_classes=[IsAuthenticated])
@@ -356,6 +574,7 @@ class DealUseViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for user's deal uses"""
     serializer_class = DealUseSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ["deal", "restaurant_confirmed"]
     ordering_fields = ["used_at", "created_at"]
@@ -363,8 +582,8 @@ class DealUseViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         return DealUse.objects.filter(user=self.request.user).select_related(
-            "deal", "deal__restaurant"
-        )
+            "deal", "deal__restaurant", "deal__restaurant__city"
+        ).prefetch_related("deal__images")
 
 
 class MerchantRestaurantViewSet(viewsets.ModelViewSet):
@@ -373,7 +592,7 @@ class MerchantRestaurantViewSet(viewsets.ModelViewSet):
     permission_classes = [IsMerchant]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["name", "address"]
-    ordering_fields = ["name", "created_at"]
+    ordering_fields = ["name", "created_at", "active_deals_count"]
     ordering = ["-created_at"]
     
     def get_queryset(self):
@@ -387,16 +606,6 @@ class MerchantRestaurantViewSet(viewsets.ModelViewSet):
             merchant=merchant
         ).select_related("city", "city__country").prefetch_related(
             "categories", "images"
-        ).annotate(
-            active_deals_count=Count(
-                "deals",
-                filter=Q(
-                    deals__is_active=True,
-                    deals__start_date__lte=timezone.now(),
-                    deals__end_date__gte=timezone.now()
-                ),
-                distinct=True
-            )
         )
     
     def perform_create(self, serializer):
@@ -427,7 +636,9 @@ class MerchantDealViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Merchant profile not found. Please create a merchant account.")
         return Deal.objects.filter(
             restaurant__merchant=merchant
-        ).select_related("restaurant").prefetch_related("images")
+        ).select_related("restaurant", "restaurant__city", "restaurant__city__country").prefetch_related(
+            "images", "restaurant__images"
+        )
     
     def perform_create(self, serializer):
         restaurant_id = self.request.data.get("restaurant")
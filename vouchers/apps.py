@@ -5,4 +5,6 @@ class VouchersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "vouchers"
 
+    def ready(self):
+        from . import signals  # noqa: F401
 
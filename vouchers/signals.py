@@ -0,0 +1,62 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import fields_changed, purge_tags_on_commit, snapshot_fields
+
+from .models import Merchant, Voucher, VoucherCategory
+
+# Cache namespace of the rendered public voucher list pages
+VOUCHER_CATALOGUE_CACHE = "voucher_catalogue"
+
+# Surrogate key of the voucher list's membership and order; single rows are
+# tagged "voucher:<id>", "merchant:<id>" and "voucher_category:<id>"
+VOUCHERS_TAG = "vouchers"
+
+# Fields the public list filters, searches or orders on
+VOUCHER_LISTING_FIELDS = [
+    "code", "title", "merchant_id", "start_date", "end_date", "sale_price", "discount_percent"
+]
+MERCHANT_LISTING_FIELDS = ["verified", "name"]
+
+
+@receiver(pre_save, sender=Voucher)
+def voucher_saving(sender, instance, **kwargs):
+    snapshot_fields(instance, VOUCHER_LISTING_FIELDS)
+
+
+@receiver(post_save, sender=Voucher)
+def voucher_saved(sender, instance, **kwargs):
+    tags = {f"voucher:{instance.pk}"}
+    if fields_changed(instance, VOUCHER_LISTING_FIELDS):
+        tags.add(VOUCHERS_TAG)
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=Voucher)
+def voucher_deleted(sender, instance, **kwargs):
+    purge_tags_on_commit({f"voucher:{instance.pk}", VOUCHERS_TAG})
+
+
+@receiver(pre_save, sender=Merchant)
+def merchant_saving(sender, instance, **kwargs):
+    snapshot_fields(instance, MERCHANT_LISTING_FIELDS)
+
+
+@receiver(post_save, sender=Merchant)
+def merchant_saved(sender, instance, **kwargs):
+    tags = {f"merchant:{instance.pk}"}
+    if fields_changed(instance, MERCHANT_LISTING_FIELDS):
+        # Verification decides which vouchers are listed; names are searched
+        tags.add(VOUCHERS_TAG)
+    purge_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=Merchant)
+def merchant_deleted(sender, instance, **kwargs):
+    purge_tags_on_commit({f"merchant:{instance.pk}", VOUCHERS_TAG})
+
+
+@receiver(post_save, sender=VoucherCategory)
+@receiver(post_delete, sender=VoucherCategory)
+def category_changed(sender, instance, **kwargs):
+    purge_tags_on_commit({f"voucher_category:{instance.pk}"})
@@ -0,0 +1,69 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import Merchant, Voucher
+from .views import VoucherListView
+
+
+class VoucherCatalogueCacheTests(TestCase):
+    path = "/api/vouchers/"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(
+            email="shop@example.com", username="shop", password="pw"
+        )
+        self.merchant = Merchant.objects.create(user=user, name="Corner Shop", verified=True)
+        self.voucher = self.create_voucher("SUMMER", end_date=timezone.now() + timedelta(minutes=10))
+        self.create_voucher("WINTER")
+
+    def create_voucher(self, code, **fields):
+        now = timezone.now()
+        fields.setdefault("start_date", now - timedelta(days=1))
+        fields.setdefault("end_date", now + timedelta(days=2))
+        with self.captureOnCommitCallbacks(execute=True):
+            return Voucher.objects.create(
+                code=code, title=f"{code.title()} sale", merchant=self.merchant,
+                discount_percent=20, original_price=Decimal("10.00"), sale_price=Decimal("8.00"),
+                total_quantity=100, **fields
+            )
+
+    def get(self, params, cache_status):
+        response = self.client.get(self.path, params)
+        self.assertEqual(response["X-Cache"], cache_status)
+        return response.json()
+
+    def test_key_covers_normalized_declared_parameters(self):
+        self.get({"search": "Summer"}, "MISS")
+        self.get({"search": "  summer ", "utm_source": "mail"}, "HIT")
+        self.get({"search": "summer", "ordering": "end_date"}, "MISS")
+        self.get({"search": "summer", "ordering": "-end_date"}, "MISS")
+        self.get({"search": "summer", "page": 1}, "MISS")
+
+    def test_expires_when_the_first_listed_voucher_ends(self):
+        self.get({}, "MISS")
+        view = VoucherListView()
+        view.request = Request(APIRequestFactory().get(self.path))
+        _, _, _, expires_at, _ = cache.get(view.get_cache_key())
+        self.assertAlmostEqual(expires_at - time.time(), 600, delta=5)
+
+    def test_writes_purge_the_page(self):
+        self.get({}, "MISS")
+        self.get({}, "HIT")
+        self.voucher.title = "Summer clearance"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.voucher.save()
+        self.assertEqual(self.get({}, "MISS")["results"][1]["title"], "Summer clearance")
+        self.merchant.verified = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.merchant.save()
+        self.assertEqual(self.get({}, "MISS")["count"], 0)
@@ -1,33 +1,54 @@
+from django.db.models import Min
 from django.utils import timezone
-from django.core.cache import cache
 from rest_framework import generics, permissions, filters
+from rest_framework.settings import api_settings
 
+from core.cache import CachedListMixin, timeout_until
 from users.permissions import ReadOnly, IsMerchant
 from .models import Voucher
 from .serializers import VoucherSerializer
+from .signals import VOUCHER_CATALOGUE_CACHE, VOUCHERS_TAG
 
 
-class VoucherListView(generics.ListAPIView):
+class VoucherListView(CachedListMixin, generics.ListAPIView):
+    """
+    Public voucher catalogue. Pages are cached as rendered JSON, tagged with
+    the vouchers, merchants and categories they show.
+    """
     serializer_class = VoucherSerializer
     permission_classes = [permissions.AllowAny]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["code", "title", "merchant__name"]
     ordering_fields = ["start_date", "end_date", "sale_price", "discount_percent"]
+    cache_name = VOUCHER_CATALOGUE_CACHE
+    cache_tags = [VOUCHERS_TAG]
+    cache_query_params = [
+        api_settings.SEARCH_PARAM,
+        api_settings.ORDERING_PARAM,
+        api_settings.DEFAULT_PAGINATION_CLASS.page_query_param,
+    ]
 
     def get_queryset(self):
         now = timezone.now()
-        cache_key = f"voucher_list_active_{now.date()}"
-        qs = cache.get(cache_key)
-        if qs is None:
-            qs = (
-                Voucher.objects.filter(
-                    end_date__gte=now, is_active=True, merchant__verified=True
-                )
-                .select_related("merchant", "category")
-                .order_by("-created_at")
-            )
-            cache.set(cache_key, qs, 60)  # cache 1 minute
-        return qs
+        # Voucher.is_active() shadows the SoftDeleteModel field, so there is
+        # no is_active column to filter on
+        return (
+            Voucher.objects.filter(end_date__gte=now, merchant__verified=True)
+            .select_related("merchant", "category")
+            .order_by("-created_at")
+        )
+
+    def get_cache_timeout(self, queryset, now):
+        # Listed until end_date, so a page is valid until its first voucher ends
+        return timeout_until(queryset.aggregate(next_end=Min("end_date"))["next_end"], now)
+
+    def get_cache_tags(self, vouchers):
+        tags = []
+        for voucher in vouchers:
+            tags += [f"voucher:{voucher.pk}", f"merchant:{voucher.merchant_id}"]
+            if voucher.category_id:
+                tags.append(f"voucher_category:{voucher.category_id}")
+        return tags
 
 
 class MerchantVoucherView(generics.ListCreateAPIView):
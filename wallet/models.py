@@ -46,6 +46,10 @@ class WalletTransaction(TimeStampedModel):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination of a wallet's transactions, newest first
+            models.Index(fields=["wallet", "created_at", "id"], name="wallet_transaction_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.wallet.user.email} - {self.transaction_type} {self.amount}"
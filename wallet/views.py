@@ -4,6 +4,8 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.pagination import KeysetPagination
+
 from .models import Wallet
 from .serializers import WalletSerializer, WalletTransactionSerializer
 
@@ -20,6 +22,7 @@ class WalletDetailView(generics.RetrieveAPIView):
 class WalletTransactionsView(generics.ListAPIView):
     serializer_class = WalletTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         wallet, _ = Wallet.objects.get_or_create(user=self.request.user)